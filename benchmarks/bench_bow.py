@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Benchmark bag-of-words modes against recorded articles
+
+Bags the scrubbed 'content' of recorded (unbagified) .json articles in
+each bow.BAG_MODES mode and reports per-article time, the size of the
+JSON-serialized content, and the time to load it back.
+
+    python benchmarks/bench_bow.py ../wskoutput
+    python benchmarks/bench_bow.py a.zip b.zip -n 2000 -r 3
+"""
+
+import argparse
+import json
+import time
+
+from corpus import iter_members
+
+from bow import BAG_MODES, Vocabulary, bag
+
+
+def load_texts(paths, limit):
+    """The string content of up to limit recorded .json articles."""
+    texts = []
+    for _, data in iter_members(paths, '.json'):
+        content = json.loads(data).get('content')
+        if isinstance(content, str):
+            texts.append(content)
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def best_of(func, repeat):
+    """Best-of-repeat seconds for func(), and its last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(paths, limit, repeat):
+    """Bag the corpus in every mode and print a comparison."""
+    texts = load_texts(paths, limit)
+    if not texts:
+        print('no recorded .json articles found')
+        return
+    count = len(texts)
+    vocabulary = Vocabulary()
+    print('articles:', count)
+    print('%-8s %12s %14s %14s' % ('mode', 'us/article', 'bytes/article', 'load us/art'))
+    for mode in BAG_MODES:
+        seconds, bags = best_of(lambda: [bag(txt, mode, vocabulary) for txt in texts], repeat)
+        dumped = [json.dumps(content) for content in bags]
+        load_seconds, _ = best_of(lambda: [json.loads(data) for data in dumped], repeat)
+        print('%-8s %12.1f %14.0f %14.1f' % (mode, seconds * 1e6 / count,
+                                             sum(len(data) for data in dumped) / count,
+                                             load_seconds * 1e6 / count))
+    print('vocabulary:', len(vocabulary), 'terms')
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('paths', nargs='+', help='output zips or directories of recorded articles')
+    PARSER.add_argument('-n', '--limit', type=int, default=1000, help='maximum articles to load')
+    PARSER.add_argument('-r', '--repeat', type=int, default=3, help='timing repetitions')
+    ARGS = PARSER.parse_args()
+    main(ARGS.paths, ARGS.limit, ARGS.repeat)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark article markup extraction against recorded articles
+
+Compares extract.ArticleExtractor with the BeautifulSoup find / find_all
+extraction search_query used before it, on recorded Display-markup XML,
+and reports per-article time and any articles whose output differs.
+
+    python benchmarks/bench_extract.py ../wskoutput
+    python benchmarks/bench_extract.py a.zip b.zip -n 2000 -r 3
+"""
+
+import argparse
+import re
+import time
+import warnings
+
+from corpus import load_articles
+
+from bs4 import BeautifulSoup
+from extract import ArticleExtractor
+
+
+warnings.filterwarnings('ignore', module='bs4')
+
+
+def legacy_extract(markup):
+    """The pre-extractor BeautifulSoup code path from search_query."""
+    soup = BeautifulSoup(markup, 'lxml')
+    all_copyright = soup.find('div', {'class': 'PUB-COPYRIGHT'})
+    if not all_copyright:
+        all_copyright = soup.find('div', {'class': 'COPYRIGHT'})
+    copyright_txt = ''
+    for copyright in all_copyright or ():
+        copyright_txt = str(copyright)
+        copyright_txt = re.sub('Copyright [0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f] ', '', copyright_txt)
+    txt = ''
+    for body_div in soup.find_all("div", {"class": "BODY"}):
+        txt = txt + body_div.get_text(separator=u' ')
+    return {'body': txt, 'copyright': copyright_txt}
+
+
+def timed(func, articles, repeat):
+    """Best-of-repeat seconds per article, and the results of the last run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(xml) for _, xml in articles]
+        best = min(best, time.perf_counter() - start)
+    return best / max(len(articles), 1), results
+
+
+def main(paths, limit, repeat):
+    """Run both extractors over the corpus and print a comparison."""
+    articles = load_articles(paths, limit)
+    if not articles:
+        print('no recorded .xml articles found')
+        return
+    extractor = ArticleExtractor()
+    legacy_time, legacy = timed(legacy_extract, articles, repeat)
+    new_time, new = timed(extractor.extract, articles, repeat)
+    mismatches = [name for (name, _), old, cur in zip(articles, legacy, new) if old != cur]
+    print('articles:      ', len(articles))
+    print('beautifulsoup: ', '%.1f us/article' % (legacy_time * 1e6))
+    print('extractor:     ', '%.1f us/article' % (new_time * 1e6))
+    print('speedup:       ', '%.2fx' % (legacy_time / new_time if new_time else 0))
+    print('mismatches:    ', len(mismatches))
+    for name in mismatches[:10]:
+        print('   ', name)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('paths', nargs='+', help='output zips or directories of recorded articles')
+    PARSER.add_argument('-n', '--limit', type=int, default=1000, help='maximum articles to load')
+    PARSER.add_argument('-r', '--repeat', type=int, default=3, help='timing repetitions')
+    ARGS = PARSER.parse_args()
+    main(ARGS.paths, ARGS.limit, ARGS.repeat)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark and equivalence check for scrub/normalize.py
+
+Runs the original string_cleaner and ftfy + remove_accents code against
+normalize.clean_text and normalize.fix_text on the body text of recorded
+articles, plus a built-in set of edge cases (accents, curly quotes, HTML
+entities, ligatures, control characters, full-width forms). Prints
+per-article timings and exits with status 1 if any output differs.
+
+    python benchmarks/bench_normalize.py ../wskoutput
+    python benchmarks/bench_normalize.py          # edge cases only
+"""
+
+import argparse
+import string
+import sys
+import time
+import unicodedata as ud
+
+from corpus import load_articles
+
+import ftfy
+import unidecode
+from extract import ArticleExtractor
+from scrub.normalize import clean_text, fix_text
+
+EDGE_CASES = [
+    '',
+    'plain ascii text with   extra\twhitespace\n',
+    'Café crème brûlée, naïve coöperate',
+    '“Curly” ‘quotes’ and an em—dash…',
+    'AT&amp;T &lt;b&gt; &#39;entities&#39; &nbsp;here',
+    'a <tag> with &amp; and > brackets',
+    'AT&T, R&D; Q&A & more &; &#; &#x41; &AMP;',
+    'ﬁnance ﬂow ＡＢＣ full width',
+    'control\x00chars\x07and\x0bvertical\x0cfeed\r\nline\x1b[31mred',
+    'Zürich İstanbul Łódź Ångström',
+    'â\u0080\u0099 mojibake Ã©tÃ©',
+    '日本語 Русский العربية',
+]
+
+
+def legacy_string_cleaner(unistr):
+    """search.string_cleaner before normalize.py."""
+    unaccented = unidecode.unidecode(unistr)
+    printonly = ''.join(filter(lambda x: x in string.printable, unaccented))
+    return ' '.join(printonly.split())
+
+
+def legacy_fix_text(text):
+    """The tail of scrub.scrub before normalize.py."""
+    text = ftfy.fix_text(text, normalization='NFKC')
+    nfkd_form = ud.normalize('NFKD', text)
+    return u"".join([c for c in nfkd_form if not ud.combining(c)])
+
+
+def timed(func, texts, repeat):
+    """Best-of-repeat seconds per text, and the outputs of the last run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(text) for text in texts]
+        best = min(best, time.perf_counter() - start)
+    return best / max(len(texts), 1), results
+
+
+def compare(label, legacy, fused, texts, repeat):
+    """Time both functions over texts and return the number of differences."""
+    legacy_time, expected = timed(legacy, texts, repeat)
+    fused_time, actual = timed(fused, texts, repeat)
+    differences = [text for text, old, new in zip(texts, expected, actual) if old != new]
+    print('%-28s %9.1f us %9.1f us %7.2fx %6d differ'
+          % (label, legacy_time * 1e6, fused_time * 1e6,
+             legacy_time / fused_time if fused_time else 0, len(differences)))
+    for text in differences[:5]:
+        print('    ', repr(text[:80]))
+    return len(differences)
+
+
+def main(paths, limit, repeat):
+    """Compare the legacy and fused normalizers on edge cases and articles."""
+    extractor = ArticleExtractor()
+    bodies = [extractor.extract(xml)['body'] for _, xml in load_articles(paths, limit)] if paths else []
+    cleaned = [legacy_string_cleaner(text) for text in bodies]
+    print('%-28s %12s %12s %8s' % ('', 'legacy', 'fused', 'speedup'))
+    failures = compare('string_cleaner (edge cases)', legacy_string_cleaner, clean_text, EDGE_CASES, repeat)
+    failures += compare('fix_text (edge cases)', legacy_fix_text, fix_text, EDGE_CASES, repeat)
+    if bodies:
+        print('articles:', len(bodies))
+        failures += compare('string_cleaner (raw body)', legacy_string_cleaner, clean_text, bodies, repeat)
+        failures += compare('fix_text (raw body)', legacy_fix_text, fix_text, bodies, repeat)
+        failures += compare('fix_text (cleaned body)', legacy_fix_text, fix_text, cleaned, repeat)
+    return failures
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('paths', nargs='*', help='output zips or directories of recorded articles')
+    PARSER.add_argument('-n', '--limit', type=int, default=1000, help='maximum articles to load')
+    PARSER.add_argument('-r', '--repeat', type=int, default=3, help='timing repetitions')
+    ARGS = PARSER.parse_args()
+    sys.exit(1 if main(ARGS.paths, ARGS.limit, ARGS.repeat) else 0)
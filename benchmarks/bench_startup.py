@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark the cold start of the WE1S collector command line tools
+
+Runs each tool with --help in a fresh interpreter, which imports
+everything the tool imports at startup and parses its arguments but does
+no work, and reports the median wall time of the runs, with a bare
+interpreter start for reference:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py -n 20 -c searchcmd -c rescrub
+    python benchmarks/bench_startup.py --imports 5
+
+--imports N also lists the N slowest top-level imports of each tool
+(python -X importtime, Python 3.7+). A tool that fails to start, e.g.
+for want of an installed package, is reported with its error.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from corpus import ROOT
+
+COMMANDS = [
+    # (name, arguments to the interpreter)
+    ('python', ['-c', 'pass']),
+    ('searchcmd', ['searchcmd.py', '--help']),
+    ('search', ['-c', 'import search']),
+    ('zipcount', ['zipcount.py', '--help']),
+    ('json_into_mongo', ['json_into_mongo.py', '--help']),
+    ('rescrub', ['rescrub.py', '--help']),
+    ('xmlstore', ['xmlstore.py', '--help']),
+    ('dtm', ['dtm.py', '--help']),
+    ('profiling', ['profiling.py', '--help']),
+    ('progress', ['progress.py', '--help']),
+    ('query_expander', ['query_expander.py', '--help']),
+    ('scrub.batch', ['-m', 'scrub.batch', '--help']),
+    ('scrub.rulestats', ['-m', 'scrub.rulestats', '--help']),
+]
+
+
+def start(args, importtime=False):
+    """(seconds, completed process) of one run of the interpreter."""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + args
+    begin = time.perf_counter()
+    process = subprocess.run(command, cwd=ROOT, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - begin, process
+
+
+def slowest_imports(stderr, count):
+    """The count slowest top-level imports of -X importtime output, as
+    (microseconds, module) pairs.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # the header line
+        if fields[2].startswith(' ') and not fields[2].startswith('  '):
+            imports.append((int(fields[1]), fields[2].strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(runs, only, imports):
+    print('%-16s %10s %10s %10s' % ('command', 'median ms', 'min ms', 'max ms'))
+    for name, args in COMMANDS:
+        if only and name not in only:
+            continue
+        times = []
+        for _ in range(runs):
+            seconds, process = start(args)
+            if process.returncode:
+                break
+            times.append(seconds)
+        if process.returncode:
+            error = (process.stderr.strip().splitlines() or ['exit status %d' % process.returncode])
+            print('%-16s failed: %s' % (name, error[-1]))
+            continue
+        print('%-16s %10.1f %10.1f %10.1f' % (name, statistics.median(times) * 1e3,
+                                               min(times) * 1e3, max(times) * 1e3))
+        if imports:
+            for micros, module in slowest_imports(start(args, importtime=True)[1].stderr, imports):
+                print('%-16s %10.1f   %s' % ('', micros / 1e3, module))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('-n', '--runs', type=int, default=10, help='runs per command')
+    PARSER.add_argument('-c', '--command', action='append', default=[],
+                        help='only time this command; may be repeated')
+    PARSER.add_argument('--imports', type=int, default=0, metavar='N',
+                        help='list the N slowest top-level imports of each command')
+    ARGS = PARSER.parse_args()
+    main(ARGS.runs, ARGS.command, ARGS.imports)
@@ -0,0 +1,50 @@
+"""Recorded article corpora for the WE1S collector benchmarks
+
+Benchmarks read recorded LexisNexis Display-markup articles from collector
+output: the .xml members of output zips, or loose .xml files, found under
+any of the given paths (zip files or directories).
+"""
+
+import os
+import sys
+import zipfile
+
+# benchmarks are run as scripts from the repository root or this folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def iter_files(paths, suffixes=('.zip', '.xml')):
+    """Yield files with one of the given suffixes under paths."""
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirname, _dirs, files) in os.walk(path):
+                for filename in sorted(files):
+                    if filename.endswith(suffixes):
+                        yield os.path.join(dirname, filename)
+        elif path.endswith(suffixes):
+            yield path
+
+
+def iter_members(paths, suffix):
+    """Yield (name, text) for every member / file ending in suffix."""
+    for path in iter_files(paths, ('.zip', suffix)):
+        if path.endswith('.zip'):
+            with zipfile.ZipFile(path) as source:
+                for member in source.namelist():
+                    if member.endswith(suffix):
+                        yield member, source.read(member).decode('utf-8')
+        else:
+            with open(path, encoding='utf-8') as infile:
+                yield path, infile.read()
+
+
+def load_articles(paths, limit=None):
+    """Return up to limit recorded article XML strings as (name, xml) pairs."""
+    articles = []
+    for name, xml in iter_members(paths, '.xml'):
+        articles.append((name, xml))
+        if limit and len(articles) >= limit:
+            break
+    return articles
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Micro-benchmark suite for the CPU hot paths of the WE1S collector
+
+Times each stage of turning a Search response into output on synthetic
+LexisNexis documents (see synthetic.py), and reports per-document time
+and allocations:
+
+    find_tag_by_name   wsk.find_tag_by_name on a parsed Search response
+    format_doc         wsk.Document: decode and parse one documentcontainer
+    get_doc_pub_date   Document.get_doc_pub_date on parsed Cite metadata
+    extract            body / copyright extraction of a full-text article
+    string_cleaner     search.string_cleaner (normalize.clean_text)
+    scrub              the default scrub.scrub ruleset
+    bagify             bow.bag of the scrubbed text
+    zip_write          sinks.ZipSink, a .json and an .xml member per article
+    json_write         sinks.JsonFileSink, one .json file per article
+
+Times are best-of-repeat per document; peak is the largest traced
+allocation during one document, retained what is still allocated after
+its result is dropped (tracemalloc, in a separate untimed pass). The wsk
+stages are skipped if wsk cannot be imported (it needs pymongo and
+requests).
+
+Save a run and compare a later one against it:
+    python benchmarks/suite.py --save baseline.json
+    python benchmarks/suite.py --compare baseline.json --fail
+
+--compare flags stages whose time or peak allocation grew by more than
+--threshold (10% by default); --fail exits with status 1 if any did.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import corpus  # noqa: F401 -- puts the repository root on sys.path
+from synthetic import Generator
+
+from bs4 import BeautifulSoup
+from bow import bag
+from extract import DEFAULT_EXTRACTOR
+from scrub.normalize import clean_text
+from scrub.scrub import get_scrubber
+from sinks import JsonFileSink, ZipSink
+
+try:
+    import wsk
+except ImportError as error:
+    wsk = None
+    WSK_ERROR = error
+
+warnings.filterwarnings('ignore', module='bs4')
+warnings.filterwarnings('ignore', message='.*using an HTML parser to parse an XML document')
+
+PER_PAGE = 10
+COMPARED = ('us_per_doc', 'peak_bytes_per_doc')
+
+
+def quiet(func):
+    """func with its prints discarded; several wsk accessors print."""
+    def wrapped(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func(*args)
+    return wrapped
+
+
+def timed(func, inputs, repeat):
+    """Best-of-repeat seconds for one pass of func over inputs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def traced(func, inputs):
+    """(mean peak bytes, mean retained bytes) of func per input."""
+    peak_total = retained_total = 0
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            tracemalloc.clear_traces()
+            before = tracemalloc.get_traced_memory()[0]
+            result = func(item)
+            peak = tracemalloc.get_traced_memory()[1]
+            del result
+            peak_total += peak - before
+            retained_total += max(tracemalloc.get_traced_memory()[0] - before, 0)
+    finally:
+        tracemalloc.stop()
+    return peak_total / float(len(inputs)), retained_total / float(len(inputs))
+
+
+class Sinks:
+    """Sink factory for the write stages: every pass writes to a fresh
+    folder of a temporary directory.
+    """
+
+    def __init__(self, sink_class):
+        self.sink_class = sink_class
+        self.root = tempfile.mkdtemp(prefix='we1s-bench-')
+        self.passes = 0
+
+    def run(self, batch):
+        self.passes += 1
+        outpath = os.path.join(self.root, str(self.passes))
+        os.makedirs(outpath)
+        with self.sink_class(outpath, 'bench') as sink:
+            for basename, article, xml in batch:
+                sink.write(basename, article, xml)
+        shutil.rmtree(outpath)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def build_stages(docs, words, seed):
+    """[(stage, func, inputs, documents per input)] over synthetic documents."""
+    generator = Generator(seed)
+    articles = [generator.article(words) for _ in range(docs)]
+    parts = [DEFAULT_EXTRACTOR.extract(article) for article in articles]
+    cleaned = [clean_text(part['body']) for part in parts]
+    scrubber = get_scrubber()
+    scrubbed = [scrubber(text) for text in cleaned]
+    records = [('bench_%d' % idx, {'name': 'bench_%d' % idx, 'title': 'Synthetic article',
+                                   'copyright': part['copyright'], 'content': bag(text)}, article)
+               for idx, (part, text, article) in enumerate(zip(parts, scrubbed, articles))]
+    stages = []
+    if wsk is not None:
+        pages = max(docs // PER_PAGE, 1)
+        responses = [generator.search_response(PER_PAGE) for _ in range(pages)]
+        soups = [BeautifulSoup(response, 'lxml') for response in responses]
+        containers = [tag for soup in soups for tag in soup.find_all('ns1:documentcontainer')]
+        metadata = [BeautifulSoup(generator.metadata_html('0', 'Synthetic', words), 'lxml')
+                    for _ in range(docs)]
+        document = wsk.Document.__new__(wsk.Document)
+        document.verbose = False
+        document.include_meta = False
+        stages += [
+            ('find_tag_by_name', lambda soup: wsk.find_tag_by_name(soup, 'documentsfound'),
+             soups, PER_PAGE),
+            ('format_doc', quiet(wsk.Document), containers, 1),
+            ('get_doc_pub_date', quiet(document.get_doc_pub_date), metadata, 1),
+        ]
+    stages += [
+        ('extract', DEFAULT_EXTRACTOR.extract, articles, 1),
+        ('string_cleaner', clean_text, [part['body'] for part in parts], 1),
+        ('scrub', scrubber, cleaned, 1),
+        ('bagify', bag, scrubbed, 1),
+        ('zip_write', Sinks(ZipSink), [records], docs),
+        ('json_write', Sinks(JsonFileSink), [records], docs),
+    ]
+    return stages
+
+
+def run(docs=200, words=600, repeat=5, seed=0, only=()):
+    """{stage: {metric: value}} for the stages named in only, or all."""
+    results = {}
+    for name, func, inputs, per_input in build_stages(docs, words, seed):
+        runner = func.run if isinstance(func, Sinks) else func
+        try:
+            if only and name not in only:
+                continue
+            count = len(inputs) * per_input
+            seconds = timed(runner, inputs, repeat)
+            peak, retained = traced(runner, inputs)
+        finally:
+            if isinstance(func, Sinks):
+                func.cleanup()
+        results[name] = {'us_per_doc': seconds / count * 1e6,
+                         'peak_bytes_per_doc': peak / per_input,
+                         'retained_bytes_per_doc': retained / per_input}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print results against a baseline; return the regressed stages."""
+    regressions = []
+    print('%-18s %12s %12s %8s %14s %8s' % ('stage', 'us/doc', 'baseline', 'ratio',
+                                             'peak B/doc', 'ratio'))
+    for name, metrics in results.items():
+        old = baseline.get(name)
+        if not old:
+            print('%-18s %12.1f %12s' % (name, metrics['us_per_doc'], 'new'))
+            continue
+        ratios = dict((metric, metrics[metric] / old[metric] if old.get(metric) else 1.0)
+                      for metric in COMPARED)
+        regressed = [metric for metric in COMPARED if ratios[metric] > 1 + threshold]
+        print('%-18s %12.1f %12.1f %7.2fx %14.0f %7.2fx%s'
+              % (name, metrics['us_per_doc'], old['us_per_doc'], ratios['us_per_doc'],
+                 metrics['peak_bytes_per_doc'], ratios['peak_bytes_per_doc'],
+                 '  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def report(results):
+    print('%-18s %12s %14s %14s' % ('stage', 'us/doc', 'peak B/doc', 'retained B/doc'))
+    for name, metrics in results.items():
+        print('%-18s %12.1f %14.0f %14.0f' % (name, metrics['us_per_doc'],
+                                              metrics['peak_bytes_per_doc'],
+                                              metrics['retained_bytes_per_doc']))
+
+
+def main(docs, words, repeat, seed, only, save, baseline_file, threshold, fail):
+    if wsk is None:
+        print('skipping the wsk stages:', WSK_ERROR)
+    results = run(docs, words, repeat, seed, only)
+    if baseline_file:
+        with open(baseline_file) as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline['stages'], threshold)
+        if regressions:
+            print('regressed by more than %d%%: %s' % (threshold * 100, ', '.join(regressions)))
+    else:
+        regressions = []
+        report(results)
+    if save:
+        with open(save, 'w') as outfile:
+            json.dump({'meta': {'python': platform.python_version(),
+                                'platform': platform.platform(),
+                                'time': datetime.datetime.now().isoformat(),
+                                'docs': docs, 'words': words, 'repeat': repeat, 'seed': seed},
+                       'stages': results}, outfile, indent=2, sort_keys=True)
+    return 1 if regressions and fail else 0
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('-n', '--docs', type=int, default=200, help='synthetic documents per stage')
+    PARSER.add_argument('-w', '--words', type=int, default=600, help='words per article')
+    PARSER.add_argument('-r', '--repeat', type=int, default=5, help='timing repetitions')
+    PARSER.add_argument('--seed', type=int, default=0, help='synthetic corpus seed')
+    PARSER.add_argument('-s', '--stage', action='append', default=[],
+                        help='only run this stage; may be repeated')
+    PARSER.add_argument('--save', default='', help='write the results to this JSON file')
+    PARSER.add_argument('--compare', default='', help='compare against a saved results file')
+    PARSER.add_argument('--threshold', type=float, default=0.10,
+                        help='regression threshold as a fraction, 0.10 by default')
+    PARSER.add_argument('--fail', action='store_true',
+                        help='exit with status 1 if a stage regressed')
+    ARGS = PARSER.parse_args()
+    sys.exit(main(ARGS.docs, ARGS.words, ARGS.repeat, ARGS.seed, ARGS.stage, ARGS.save,
+                  ARGS.compare, ARGS.threshold, ARGS.fail))
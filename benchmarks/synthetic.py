@@ -0,0 +1,106 @@
+"""Synthetic LexisNexis WSK documents for the WE1S collector benchmarks
+
+Generates, from a seed, the two kinds of markup the collector parses:
+Search responses, whose documentcontainer elements hold base64-encoded
+Cite-view metadata HTML, and Display-view full-text articles with BODY
+and PUB-COPYRIGHT divs. Article text mixes a Zipf-distributed vocabulary
+with the things the normalizer and scrub rules handle: accented words,
+curly quotes, URLs, email addresses, numbers and entities.
+"""
+
+import base64
+import random
+
+SOURCES = [('163823', 'Chicago Daily Herald'), ('8075', 'The Washington Post'),
+           ('138620', 'The Guardian (London)'), ('10962', 'BBC Monitoring: International Reports')]
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+          'September', 'October', 'November', 'December']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+EXTRAS = ['café', 'naïve', '“quoted”', 'it’s', 'http://www.example.com/story',
+          'editor@example.com', '2,500', '&amp;', 'U.S.', '—', 'humanities', 'liberal arts']
+
+
+class Generator:
+    """Seeded generator of synthetic Search responses and articles."""
+
+    def __init__(self, seed=0, vocabulary_size=20000):
+        self.random = random.Random(seed)
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        self.vocabulary = [''.join(self.random.choice(letters)
+                                   for _ in range(self.random.randint(2, 10)))
+                           for _ in range(vocabulary_size)]
+        self.weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+        self.count = 0
+
+    def words(self, count):
+        """count words of Zipf-distributed vocabulary and occasional extras."""
+        words = self.random.choices(self.vocabulary, self.weights, k=count)
+        for i in range(0, count, 25):
+            words[i] = self.random.choice(EXTRAS)
+        return words
+
+    def paragraph(self, count):
+        words = self.words(count)
+        sentences = []
+        for i in range(0, count, 18):
+            sentence = ' '.join(words[i:i + 18])
+            sentences.append(sentence[:1].upper() + sentence[1:] + '.')
+        return ' '.join(sentences)
+
+    def pub_date(self):
+        return '%s %d, %d %s %d:%02d PM GMT' % (
+            self.random.choice(MONTHS), self.random.randint(1, 28), self.random.randint(2000, 2018),
+            self.random.choice(DAYS), self.random.randint(1, 12), self.random.randint(0, 59))
+
+    def metadata_html(self, source_id, source_title, words):
+        """Cite-view metadata HTML of one document."""
+        return ('<html><head><meta name="sourceName" content="%s"/>'
+                '<meta name="sourceId" content="%s"/></head><body>'
+                '<div class="HEADLINE">%s</div><div class="PUB">%s</div>'
+                '<div class="PUB-DATE">%s</div><div class="LENGTH">%d words</div>'
+                '<div class="SECTION">NEWS; Pg. %d</div><div class="BYLINE">By %s %s</div>'
+                '<span class="attachmentId" id="att%d"></span></body></html>') % (
+                    source_title, source_id, self.paragraph(8).rstrip('.'), source_title,
+                    self.pub_date(), words, self.random.randint(1, 40),
+                    self.random.choice(self.vocabulary).title(),
+                    self.random.choice(self.vocabulary).title(), self.count)
+
+    def article(self, words=600, source=None):
+        """Display-view full-text markup of one article."""
+        self.count += 1
+        source_id, source_title = source or self.random.choice(SOURCES)
+        paragraphs = []
+        remaining = words
+        while remaining > 0:
+            size = min(remaining, self.random.randint(30, 120))
+            paragraphs.append('<p>%s</p>' % self.paragraph(size))
+            remaining -= size
+        return ('<?xml version="1.0" encoding="UTF-8"?><html><head>'
+                '<meta name="sourceName" content="%s"/><style>.BODY{margin:0}</style></head><body>'
+                '<div class="PUB">%s</div><div class="PUB-DATE">%s</div>'
+                '<div class="HEADLINE">%s</div><div class="BYLINE">By %s</div>'
+                '<div class="LENGTH">%d words</div><div class="BODY">%s</div>'
+                '<div class="PUB-COPYRIGHT"><p>Copyright %d %s All Rights Reserved</p></div>'
+                '<div class="LOAD-DATE">%s</div></body></html>') % (
+                    source_title, source_title, self.pub_date(), self.paragraph(8).rstrip('.'),
+                    self.random.choice(self.vocabulary).title(), words, ''.join(paragraphs),
+                    self.random.randint(2000, 2018), source_title, self.pub_date())
+
+    def search_response(self, documents=10, total=None, source=None):
+        """A Search SOAP response with documents Cite-view containers."""
+        source_id, source_title = source or self.random.choice(SOURCES)
+        containers = []
+        for _ in range(documents):
+            self.count += 1
+            html = self.metadata_html(source_id, source_title, self.random.randint(200, 1500))
+            containers.append(
+                '<ns1:documentContainer><ns1:documentId>%016X</ns1:documentId>'
+                '<ns1:document>%s</ns1:document></ns1:documentContainer>'
+                % (self.random.getrandbits(64), base64.b64encode(html.encode('utf-8')).decode('ascii')))
+        return ('<?xml version="1.0" encoding="UTF-8"?><soap:Envelope '
+                'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+                '<ns1:SearchResponse xmlns:ns1="http://search.search.services.v1.wsapi.lexisnexis.com">'
+                '<ns1:result><ns1:documentsFound>%d</ns1:documentsFound>'
+                '<ns1:documentContainerList>%s</ns1:documentContainerList></ns1:result>'
+                '</ns1:SearchResponse></soap:Body></soap:Envelope>') % (
+                    total if total is not None else documents, ''.join(containers))
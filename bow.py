@@ -0,0 +1,98 @@
+"""Bag-of-words article content for WE1S (WhatEvery1Says)
+
+Modes for search_query(bagify=True):
+
+    sorted   the legacy form: the article's tokens as one string,
+             sorted case-insensitively
+    counts   a sparse {term: count} dict
+    ids      a sparse {term id: count} dict against a shared vocabulary
+             file with one term per line; a term's id is its line number
+
+Counts are collected in one pass over the tokens instead of sorting them.
+counts and ids content holds each distinct term once, and is ready for
+topic modeling without re-tokenizing; benchmarks/bench_bow.py compares
+the modes on recorded articles.
+"""
+
+import collections
+import os
+import threading
+
+BAG_MODES = ('sorted', 'counts', 'ids')
+VOCABULARY_FILE = 'vocabulary.txt'
+
+
+def sorted_bag(txt):
+    """The legacy bag: tokens sorted case-insensitively, space-joined."""
+    return ' '.join(sorted(txt.split(' '), key=str.lower))
+
+
+def count_terms(txt):
+    """{term: count} for the space-separated tokens of txt."""
+    return dict(collections.Counter(txt.split()))
+
+
+class Vocabulary:
+    """Term ids shared by any number of articles, queries and threads.
+
+    Terms are numbered in order of first use. The vocabulary is stored as
+    a text file of one term per line; save() only appends terms added
+    since the file was loaded or last saved, so ids never change.
+    """
+
+    def __init__(self, path=''):
+        self.path = path
+        self.terms = []
+        self.ids = {}
+        self._saved = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as vocab_file:
+                for line in vocab_file:
+                    self.ids[line.rstrip('\n')] = len(self.terms)
+                    self.terms.append(line.rstrip('\n'))
+            self._saved = len(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def term_id(self, term):
+        """The id of term, adding it if it is new."""
+        try:
+            return self.ids[term]
+        except KeyError:
+            with self._lock:
+                if term not in self.ids:
+                    self.ids[term] = len(self.terms)
+                    self.terms.append(term)
+                return self.ids[term]
+
+    def encode(self, counts):
+        """{term id: count} for a {term: count} dict."""
+        return {self.term_id(term): count for term, count in counts.items()}
+
+    def save(self):
+        """Append new terms to the vocabulary file."""
+        with self._lock:
+            new_terms = self.terms[self._saved:]
+            if not self.path or not new_terms:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as vocab_file:
+                vocab_file.write(''.join(term + '\n' for term in new_terms))
+            self._saved += len(new_terms)
+
+
+def bag(txt, mode='sorted', vocabulary=None):
+    """Bag-of-words content for txt in one of BAG_MODES."""
+    if mode == 'sorted':
+        return sorted_bag(txt)
+    if mode == 'counts':
+        return count_terms(txt)
+    if mode == 'ids':
+        if vocabulary is None:
+            raise ValueError('the ids bag mode needs a Vocabulary')
+        return vocabulary.encode(count_terms(txt))
+    raise ValueError('unknown bag mode: %s' % mode)
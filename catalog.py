@@ -0,0 +1,231 @@
+"""SQLite catalog of WE1S (WhatEvery1Says) output zips
+
+Indexes every member of the output zips under a tree, with the source,
+keyword and year of each article, so that counts and lookups do not
+reopen any zip:
+
+    zips     path (relative to the tree), mtime, size
+    members  zip, member name, article name, source_id, source and
+             keyword slugs, year, and whether it is an exact match
+
+Source, keyword and the (no-exact-match) flag come from the zip name
+that search.py gives each query row's output, and article names from
+the member names (source_id_name.json), all read from the zip's central
+directory. The year is that of the row when its begin_date and end_date
+fall in one year; only zips of rows spanning several years, or not named
+like a row's output, have their .json articles read for the year of
+their pub_date (or of the row's begin_date). update() only scans zips
+that are new or whose mtime or size changed, in a process pool, and
+drops zips that are gone.
+
+zipcount.py answers its counts from the catalog, catalog.sqlite in the
+root of the tree by default.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import zipfile
+
+from planner import slugify
+
+CATALOG_FILE = 'catalog.sqlite'
+NO_EXACT_MATCH = '(no-exact-match)'
+ZIP_NAME = re.compile(r'^([0-9+]+)_([^_]*)_([^_]*)_(\d{4})-\d\d-\d\d_(\d{4})-\d\d-\d\d'
+                      r'(\(no-exact-match\))?\.zip$')
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS zips (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    zip_id INTEGER NOT NULL REFERENCES zips(id),
+    member TEXT NOT NULL,
+    name TEXT,
+    source_id TEXT,
+    source TEXT,
+    keyword TEXT,
+    year TEXT,
+    exact INTEGER
+);
+CREATE INDEX IF NOT EXISTS members_zip ON members (zip_id);
+CREATE INDEX IF NOT EXISTS members_name ON members (name);
+CREATE INDEX IF NOT EXISTS members_query ON members (source_id, keyword, year);
+'''
+
+
+def zip_fields(filename):
+    """(source_id, source, keyword, begin year, exact) from an output zip
+    name, or Nones if it is not named like one.
+    """
+    match = ZIP_NAME.match(filename)
+    if not match:
+        return None, None, None, None, None
+    return match.group(1), match.group(2), match.group(3), match.group(4), int(not match.group(6))
+
+
+def member_article(member, source_id):
+    """The article name in a .json member name written by search.py
+    (source_id + '_' + name, with the (no-exact-match) suffix of its
+    output), or None.
+    """
+    basename = member[:-len('.json')]
+    if basename.endswith(NO_EXACT_MATCH):
+        basename = basename[:-len(NO_EXACT_MATCH)]
+    prefix = '%s_' % source_id
+    return basename[len(prefix):] if source_id and basename.startswith(prefix) else None
+
+
+def scan_zip(args):
+    """List the members of one zip and the article names of its .json
+    members; read an article only if its member name does not give its
+    name or the zip's name does not give its year. Returns (relative path, mtime, size, member rows), or
+    None rows if the zip cannot be read.
+    """
+    root, relpath = args
+    path = os.path.join(root, relpath)
+    stat = os.stat(path)
+    filename = os.path.basename(path)
+    source_id, source, keyword, year, exact = zip_fields(filename)
+    match = ZIP_NAME.match(filename)
+    read_years = not match or match.group(4) != match.group(5)
+    rows = []
+    try:
+        with zipfile.ZipFile(path) as source_zip:
+            for member in source_zip.namelist():
+                name, member_year = None, year
+                if member.endswith('.json'):
+                    name = member_article(member, source_id)
+                    if name is None or read_years:
+                        try:
+                            article = json.loads(source_zip.read(member).decode('utf-8'))
+                            name = name or article.get('name')
+                            member_year = (article.get('pub_date') or '')[:4] or year
+                        except (ValueError, AttributeError):
+                            pass
+                rows.append((member, name, source_id, source, keyword, member_year, exact))
+    except (OSError, zipfile.BadZipFile):
+        rows = None
+    return relpath, stat.st_mtime, stat.st_size, rows
+
+
+class Catalog:
+    """An SQLite catalog of the zips under root."""
+
+    def __init__(self, root, path=''):
+        self.root = os.path.abspath(root)
+        self.path = path or os.path.join(self.root, CATALOG_FILE)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stale(self):
+        """(zips to scan, catalogued zips that are gone), as relative paths."""
+        known = dict((path, (mtime, size)) for path, mtime, size
+                     in self.db.execute('SELECT path, mtime, size FROM zips'))
+        changed = []
+        found = set()
+        for (dirname, _dirs, files) in os.walk(self.root):
+            for filename in sorted(files):
+                if not filename.endswith('.zip'):
+                    continue
+                relpath = os.path.relpath(os.path.join(dirname, filename), self.root)
+                found.add(relpath)
+                stat = os.stat(os.path.join(dirname, filename))
+                if known.get(relpath) != (stat.st_mtime, stat.st_size):
+                    changed.append(relpath)
+        return changed, sorted(set(known) - found)
+
+    def update(self, processes=None):
+        """Scan new and changed zips in parallel and drop missing ones.
+        Returns (zips scanned, zips dropped, zips unreadable).
+        """
+        changed, missing = self.stale()
+        unreadable = 0
+        for relpath in missing:
+            self._drop(relpath)
+        if changed:
+            pool = multiprocessing.Pool(processes)
+            try:
+                for relpath, mtime, size, rows in pool.imap_unordered(
+                        scan_zip, [(self.root, relpath) for relpath in changed]):
+                    self._drop(relpath)
+                    zip_id = self.db.execute('INSERT INTO zips (path, mtime, size) VALUES (?, ?, ?)',
+                                             (relpath, mtime, size)).lastrowid
+                    if rows is None:  # catalogued without members until it changes
+                        unreadable += 1
+                        continue
+                    self.db.executemany('INSERT INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                        [(zip_id,) + row for row in rows])
+            finally:
+                pool.close()
+                pool.join()
+        self.db.commit()
+        return len(changed), len(missing), unreadable
+
+    def _drop(self, relpath):
+        for (zip_id,) in self.db.execute('SELECT id FROM zips WHERE path = ?', (relpath,)).fetchall():
+            self.db.execute('DELETE FROM members WHERE zip_id = ?', (zip_id,))
+            self.db.execute('DELETE FROM zips WHERE id = ?', (zip_id,))
+
+    def _where(self, namefilter='', source='', keyword='', year='', exact=None):
+        clauses, params = [], []
+        if namefilter:
+            clauses.append("instr(member, ?) > 0")
+            params.append(namefilter)
+        if source:
+            clauses.append('(source_id = ? OR source = ?)')
+            params += [source, slugify(source)]
+        if keyword:
+            clauses.append('keyword = ?')
+            params.append(slugify(keyword))
+        if year:
+            clauses.append('year = ?')
+            params.append(str(year))
+        if exact is not None:
+            clauses.append('exact = ?')
+            params.append(int(exact))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def count(self, namefilter='', source='', keyword='', year='', exact=None):
+        """Number of zip members whose name contains namefilter, for a
+        source (id or title), keyword string and year, if given.
+        """
+        where, params = self._where(namefilter, source, keyword, year, exact)
+        return self.db.execute('SELECT count(*) FROM members' + where, params).fetchone()[0]
+
+    def counts(self, group_by, namefilter='', source='', keyword='', year='', exact=None):
+        """[(group value, count)] of matching members, grouped by one of
+        'source_id', 'source', 'keyword' or 'year'.
+        """
+        if group_by not in ('source_id', 'source', 'keyword', 'year'):
+            raise ValueError('cannot group by %s' % group_by)
+        where, params = self._where(namefilter, source, keyword, year, exact)
+        return self.db.execute('SELECT %s, count(*) FROM members%s GROUP BY 1 ORDER BY 1'
+                               % (group_by, where), params).fetchall()
+
+    def members(self, namefilter='', source='', keyword='', year='', exact=None):
+        """Yield (zip path, member) of matching members."""
+        where, params = self._where(namefilter, source, keyword, year, exact)
+        for relpath, member in self.db.execute(
+                'SELECT zips.path, member FROM members JOIN zips ON zips.id = zip_id'
+                + where + ' ORDER BY zips.path, member', params):
+            yield os.path.join(self.root, relpath), member
+
+    def locate(self, name):
+        """[(zip path, member)] of the .json articles named name."""
+        return [(os.path.join(self.root, relpath), member) for relpath, member in self.db.execute(
+            'SELECT zips.path, member FROM members JOIN zips ON zips.id = zip_id WHERE name = ?',
+            (name,))]
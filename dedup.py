@@ -0,0 +1,141 @@
+"""Near-duplicate article detection for WE1S (WhatEvery1Says)
+
+Wire stories (AP, U-WIRE, ...) are collected once per source that ran
+them. With searchcmd.py --dedup, each article's scrubbed text is
+fingerprinted with a MinHash of its 5-word shingles as it is collected,
+and looked up in a locality-sensitive hash (LSH) index kept in an SQLite
+file across runs. Articles whose estimated Jaccard similarity to an
+indexed article reaches the threshold join its cluster:
+
+    article['dup_cluster']  name of the first collected article of the
+                            cluster, also set on that article
+
+With --dedup-xml, later copies also get article['xml_ref'], the name of
+the first copy, and are stored without their raw XML (see
+zipcount.py --locate to find it).
+
+The signature is NUM_PERM hashes split into BANDS bands; two articles
+are compared if any band matches, which for 128 hashes in 16 bands
+finds pairs above about 0.7 similarity with high probability.
+"""
+
+import array
+import hashlib
+import random
+import sqlite3
+import threading
+import zlib
+
+from lazy import optional
+
+DEDUP_FILE = 'dedup.sqlite'
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_WORDS = 5
+THRESHOLD = 0.8
+PRIME = (1 << 31) - 1
+
+_RANDOM = random.Random(20180101)
+PERMUTATIONS = [(_RANDOM.randrange(1, PRIME), _RANDOM.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    cluster TEXT NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+'''
+
+
+def shingle_hashes(text, size=SHINGLE_WORDS):
+    """32-bit hashes of the distinct size-word shingles of text."""
+    words = text.lower().split()
+    if len(words) <= size:
+        return set([zlib.crc32(' '.join(words).encode('utf-8'))]) if words else set()
+    return set(zlib.crc32(' '.join(words[i:i + size]).encode('utf-8'))
+               for i in range(len(words) - size + 1))
+
+
+def minhash(text):
+    """The MinHash signature of text, a tuple of NUM_PERM ints, or None
+    if text has no words.
+    """
+    hashes = shingle_hashes(text)
+    if not hashes:
+        return None
+    numpy = optional('numpy')
+    if numpy is not None:
+        values = numpy.fromiter(hashes, dtype=numpy.uint64, count=len(hashes))
+        perms = numpy.array(PERMUTATIONS, dtype=numpy.uint64)
+        mins = ((perms[:, :1] * values + perms[:, 1:]) % PRIME).min(axis=1)
+        return tuple(int(value) for value in mins)
+    return tuple(min((a * value + b) % PRIME for value in hashes) for a, b in PERMUTATIONS)
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(signature, other) if x == y) / float(len(signature))
+
+
+def band_buckets(signature):
+    """(band, bucket) pairs of a signature for the LSH index."""
+    rows = len(signature) // BANDS
+    for band in range(BANDS):
+        digest = hashlib.md5(array.array('q', signature[band * rows:(band + 1) * rows]).tobytes())
+        yield band, int.from_bytes(digest.digest()[:8], 'big', signed=True)
+
+
+class DedupIndex:
+    """A persistent MinHash LSH index of collected articles. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path=DEDUP_FILE, threshold=THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def add(self, name, signature):
+        """Index an article by name. Returns (cluster, duplicate): the
+        name of the first article of its cluster, and whether that is
+        another article. A name already indexed keeps its cluster.
+        """
+        with self._lock:
+            known = self.db.execute('SELECT cluster FROM documents WHERE name = ?',
+                                    (name,)).fetchone()
+            if known:
+                return known[0], known[0] != name
+            buckets = list(band_buckets(signature))
+            candidates = set()
+            for band, bucket in buckets:
+                candidates.update(row[0] for row in self.db.execute(
+                    'SELECT name FROM bands WHERE band = ? AND bucket = ?', (band, bucket)))
+            cluster, best = name, self.threshold
+            for candidate in sorted(candidates):
+                other_cluster, blob = self.db.execute(
+                    'SELECT cluster, signature FROM documents WHERE name = ?', (candidate,)).fetchone()
+                score = similarity(signature, array.array('q', blob))
+                if score >= best:
+                    cluster, best = other_cluster, score
+            self.db.execute('INSERT INTO documents VALUES (?, ?, ?)',
+                            (name, cluster, array.array('q', signature).tobytes()))
+            self.db.executemany('INSERT INTO bands VALUES (?, ?, ?)',
+                                [(band, bucket, name) for band, bucket in buckets])
+            return cluster, cluster != name
+
+    def commit(self):
+        """Write the articles indexed so far."""
+        with self._lock:
+            self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
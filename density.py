@@ -0,0 +1,76 @@
+"""Hit-density history for WE1S (WhatEvery1Says) query planning
+
+Records how many documents each (source_id, keyword_string) search found
+over which dates, from the total_matches WSK reports for collected query
+rows (for rows coalesced into a search with others, the articles
+attributed to the row), so that later query files can be sized to the
+density of each source:
+
+    {"163823|liberal arts": [["2017-01-01", "2017-12-31", 512], ...], ...}
+
+query_expander.py uses documents_per_day() to split multi-year rows
+into windows holding a target number of documents.
+"""
+
+import datetime
+import json
+import os
+import threading
+
+DENSITY_FILE = 'density.json'
+
+
+def density_key(source_id, keyword_string):
+    """The history key for a source and keyword string."""
+    return str(source_id) + '|' + keyword_string
+
+
+def days_between(begin_date, end_date):
+    """Days from begin_date to end_date (YYYY-MM-DD), both included."""
+    begin = datetime.datetime.strptime(begin_date, '%Y-%m-%d')
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d')
+    return (end - begin).days + 1
+
+
+class DensityHistory:
+    """Document counts per source, keyword string and date range, kept in a
+    JSON file. A new count for the same dates replaces the old one.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=DENSITY_FILE):
+        self.path = path
+        self.history = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path) as density_file:
+                self.history = json.load(density_file)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, source_id, keyword_string, begin_date, end_date, documents):
+        """Record that a search found documents documents in a date range."""
+        with self._lock:
+            entries = self.history.setdefault(density_key(source_id, keyword_string), [])
+            entries[:] = [entry for entry in entries
+                          if (entry[0], entry[1]) != (begin_date, end_date)]
+            entries.append([begin_date, end_date, documents])
+
+    def documents_per_day(self, source_id, keyword_string):
+        """Average documents per day over all recorded ranges, or None if
+        there is no history for the source and keyword string.
+        """
+        with self._lock:
+            entries = list(self.history.get(density_key(source_id, keyword_string), ()))
+        days = sum(days_between(begin, end) for begin, end, _ in entries)
+        if not days:
+            return None
+        return float(sum(documents for _, _, documents in entries)) / days
+
+    def save(self):
+        """Write the history file."""
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as density_file:
+                json.dump(self.history, density_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Document-term matrix export for WE1S (WhatEvery1Says)
+
+A DTM folder holds a sparse document-term matrix in CSR form as raw
+native-endian arrays that can be memory-mapped without parsing:
+
+    indptr.i8     int64, one more entry than there are rows
+    indices.i4    int32 term ids, sorted within each row
+    data.i4       int32 term counts
+    rows.txt      article names, one per row
+    vocabulary.txt  terms, one per line; a term's id is its line number
+
+Rows are only ever appended, so a DTM can grow across query runs. It is
+built at collection time with searchcmd.py --dtm, or afterwards from
+collector output:
+
+    ./dtm.py build ../wskoutput -o ../wskoutput/dtm
+    ./dtm.py info ../wskoutput/dtm
+
+load_dtm() maps the arrays with numpy; csr_matrix() wraps them in a
+scipy.sparse matrix if scipy is installed.
+"""
+
+import argparse
+import array
+import collections
+import json
+import os
+import threading
+import zipfile
+
+from bow import VOCABULARY_FILE, Vocabulary, count_terms
+from lazy import optional
+from sinks import iter_jsonl
+
+INDPTR_FILE = 'indptr.i8'
+INDICES_FILE = 'indices.i4'
+DATA_FILE = 'data.i4'
+ROWS_FILE = 'rows.txt'
+
+DTM = collections.namedtuple('DTM', ['indptr', 'indices', 'data', 'rows', 'terms'])
+
+
+class DTMWriter:
+    """Appends article rows to a DTM folder.
+
+    Rows are buffered and written every flush_rows rows and on close().
+    indptr is written last, so an interrupted write leaves data past the
+    last complete row, which is discarded the next time the DTM is opened.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path, vocabulary=None, flush_rows=10000):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.vocabulary = vocabulary or Vocabulary(os.path.join(path, VOCABULARY_FILE))
+        self.flush_rows = flush_rows
+        self.names = set()
+        self._lock = threading.Lock()
+        self._nnz = self._recover()
+        self._indptr = array.array('q')
+        self._indices = array.array('i')
+        self._data = array.array('i')
+        self._rows = []
+        if not self.names and not os.path.getsize(self._file(INDPTR_FILE)):
+            self._indptr.append(0)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _recover(self):
+        """Truncate files to the last complete row; returns its nnz."""
+        indptr = array.array('q')
+        indptr_path = self._file(INDPTR_FILE)
+        if os.path.exists(indptr_path):
+            with open(indptr_path, 'rb') as indptr_file:
+                raw = indptr_file.read()
+            indptr.frombytes(raw[:len(raw) - len(raw) % indptr.itemsize])
+        else:
+            open(indptr_path, 'wb').close()
+        names = []
+        if os.path.exists(self._file(ROWS_FILE)):
+            with open(self._file(ROWS_FILE), encoding='utf-8') as rows_file:
+                names = [line.rstrip('\n') for line in rows_file]
+        row_count = min(max(len(indptr) - 1, 0), len(names))
+        nnz = indptr[row_count] if indptr else 0
+        with open(indptr_path, 'r+b') as indptr_file:
+            indptr_file.truncate((row_count + 1) * indptr.itemsize if indptr else 0)
+        for name, size in ((INDICES_FILE, nnz * 4), (DATA_FILE, nnz * 4)):
+            with open(self._file(name), 'ab') as array_file:
+                array_file.truncate(size)
+        if len(names) != row_count:
+            with open(self._file(ROWS_FILE), 'w', encoding='utf-8') as rows_file:
+                rows_file.write(''.join(name + '\n' for name in names[:row_count]))
+        self.names.update(names[:row_count])
+        return nnz
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, counts):
+        """Append a row: counts is a {term: count} dict or a text to count.
+        A row whose name is already in the DTM, e.g. from a re-run query, is
+        skipped. Returns whether the row was appended.
+        """
+        if name in self.names:
+            return False
+        if isinstance(counts, str):
+            counts = count_terms(counts)
+        row = sorted(self.vocabulary.encode(counts).items())
+        with self._lock:
+            if name in self.names:
+                return False
+            self._rows.append(name)
+            self.names.add(name)
+            self._indices.extend(term_id for term_id, _ in row)
+            self._data.extend(count for _, count in row)
+            self._nnz += len(row)
+            self._indptr.append(self._nnz)
+            if len(self._rows) >= self.flush_rows:
+                self._flush()
+        return True
+
+    def flush(self):
+        """Write buffered rows and new vocabulary terms."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows and not self._indptr:
+            return
+        self.vocabulary.save()
+        for name, values in ((INDICES_FILE, self._indices), (DATA_FILE, self._data)):
+            with open(self._file(name), 'ab') as array_file:
+                values.tofile(array_file)
+        with open(self._file(ROWS_FILE), 'a', encoding='utf-8') as rows_file:
+            rows_file.write(''.join(name + '\n' for name in self._rows))
+        with open(self._file(INDPTR_FILE), 'ab') as indptr_file:
+            self._indptr.tofile(indptr_file)
+        self._indptr = array.array('q')
+        self._indices = array.array('i')
+        self._data = array.array('i')
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_dtm(path, mode='r'):
+    """Memory-map the DTM in path. Returns a DTM of numpy arrays, row names
+    and terms.
+    """
+    numpy = optional('numpy')
+    if numpy is None:
+        raise ImportError('loading a DTM requires the numpy package')
+
+    def mapped(name, dtype):
+        if not os.path.getsize(os.path.join(path, name)):
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.memmap(os.path.join(path, name), dtype=dtype, mode=mode)
+
+    indptr = mapped(INDPTR_FILE, numpy.int64)
+    if not len(indptr):
+        indptr = numpy.zeros(1, dtype=numpy.int64)
+    with open(os.path.join(path, ROWS_FILE), encoding='utf-8') as rows_file:
+        rows = [line.rstrip('\n') for line in rows_file]
+    terms = Vocabulary(os.path.join(path, VOCABULARY_FILE)).terms
+    return DTM(indptr, mapped(INDICES_FILE, numpy.int32), mapped(DATA_FILE, numpy.int32),
+               rows, terms)
+
+
+def csr_matrix(dtm):
+    """A scipy.sparse.csr_matrix over the arrays of a loaded DTM."""
+    sparse = optional('scipy.sparse')
+    if sparse is None:
+        raise ImportError('csr_matrix requires the scipy package')
+    return sparse.csr_matrix((dtm.data, dtm.indices, dtm.indptr),
+                                   shape=(len(dtm.indptr) - 1, len(dtm.terms)), copy=False)
+
+
+def iter_articles(paths):
+    """Yield the JSON articles in output zips, loose .json files and
+    .jsonl / .jsonl.zst shards under paths.
+    """
+    suffixes = ('.zip', '.json', '.jsonl', '.jsonl.zst')
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(dirname, filename)
+                     for (dirname, _dirs, filenames) in os.walk(path)
+                     for filename in sorted(filenames) if filename.endswith(suffixes)]
+        else:
+            files = [path]
+        for file_path in files:
+            if file_path.endswith('.zip'):
+                with zipfile.ZipFile(file_path) as source:
+                    for member in source.namelist():
+                        if member.endswith('.json'):
+                            yield json.loads(source.read(member).decode('utf-8'))
+            elif file_path.endswith('.json'):
+                with open(file_path, encoding='utf-8') as article_file:
+                    yield json.load(article_file)
+            else:
+                for record in iter_jsonl(file_path):
+                    yield record
+
+
+def build_dtm(paths, output):
+    """Append the articles under paths that are not yet in the DTM in
+    output. Returns (rows added, rows skipped).
+    """
+    added = skipped = 0
+    with DTMWriter(output) as writer:
+        for article in iter_articles(paths):
+            content = article.get('content')
+            name = article.get('name')
+            if not name or name in writer.names or article.get('bag_mode') == 'ids' \
+                    or not isinstance(content, (str, dict)):
+                skipped += 1
+                continue
+            writer.add(name, content)
+            added += 1
+    return added, skipped
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    SUBPARSERS = PARSER.add_subparsers(dest='command')
+    BUILD = SUBPARSERS.add_parser('build', help='append collector output to a DTM')
+    BUILD.add_argument('paths', nargs='+', help='output zips, json files, jsonl shards or directories')
+    BUILD.add_argument('-o', '--output', required=True, help='DTM folder')
+    INFO = SUBPARSERS.add_parser('info', help='print the shape of a DTM')
+    INFO.add_argument('path', help='DTM folder')
+    ARGS = PARSER.parse_args()
+    if ARGS.command == 'build':
+        print('%d rows added, %d skipped' % build_dtm(ARGS.paths, ARGS.output))
+    elif ARGS.command == 'info':
+        MATRIX = load_dtm(ARGS.path)
+        print('%d rows x %d terms, %d nonzero' % (len(MATRIX.rows), len(MATRIX.terms),
+                                                   len(MATRIX.indices)))
+    else:
+        PARSER.print_help()
@@ -0,0 +1,137 @@
+"""Dry-run cost estimates for WE1S (WhatEvery1Says) query files
+
+A full search of a query row costs one WSK Search request per page of 10
+results in each date window of WSK.search, plus one full-text retrieval
+per document. estimate_querylist() instead sends each row a single probe
+Search for a 1-document range without full text, which returns the row's
+documentsfound count, and reports per row and in total:
+
+    documents   documents found
+    searches    Search requests a full search would make
+    retrievals  full-text retrievals a full search would make
+    bytes       approximate full-text size, from the probed document's
+                word count
+    seconds     time a full search would take at the probe's latency
+
+Probes run concurrently under the limits of scheduler.Scheduler. Rows
+whose probe fails are reported without figures and left out of the
+totals. Search page counts assume documents are spread evenly over a
+row's dates, so they are a lower bound for bursty sources.
+
+    ./searchcmd.py -q queries.csv --estimate estimate.csv -j 8
+"""
+
+import csv
+import logging
+import math
+import sys
+import time
+
+from density import DensityHistory
+from scheduler import Scheduler, span_days
+from search import read_querylist
+
+PER_PAGE = 10
+TIME_DELTA = 30
+BYTES_PER_WORD = 12
+DEFAULT_DOCUMENT_BYTES = 8000
+COLUMNS = ['query_idx', 'source_title', 'source_id', 'keyword_string', 'begin_date', 'end_date',
+           'documents', 'searches', 'retrievals', 'bytes', 'seconds']
+
+
+def search_requests(documents, days, per_page=PER_PAGE, time_delta=TIME_DELTA):
+    """Search requests WSK.search makes for documents spread evenly over
+    days: one per page of each date window, where windows of time_delta
+    days widen by a day after each window with under half a page.
+    """
+    requests = 0
+    start = 0
+    while True:
+        window = min(start + time_delta, days - 1) - start + 1
+        window_documents = float(documents) * window / days
+        requests += max(1, int(math.ceil(window_documents / per_page)))
+        if start + time_delta >= days - 1:
+            return requests
+        start += time_delta
+        if window_documents < per_page / 2.0:
+            time_delta += 1
+
+
+def document_bytes(article):
+    """Approximate full-text size of a probed article, from its word count."""
+    try:
+        return int(article['length']) * BYTES_PER_WORD
+    except (KeyError, TypeError, ValueError):
+        return DEFAULT_DOCUMENT_BYTES
+
+
+def probe_row(session, qrow):
+    """Send a row's 1-document probe Search. Returns (documents found,
+    approximate bytes per document, seconds taken).
+    """
+    started = time.time()
+    result = session.run_search(qrow['keyword_string'], qrow['source_id'], begin=1, end=1,
+                                start_date=qrow['begin_date'], end_date=qrow['end_date'],
+                                save_results=False, get_text=False)
+    latency = time.time() - started
+    if result['status_code'] != 200:
+        raise IOError('probe failed with status %s' % result['status_code'])
+    results = result['results']
+    size = document_bytes(results[0]) if results else DEFAULT_DOCUMENT_BYTES
+    return result['total_matches'], size, latency
+
+
+def row_estimate(qrow, documents, size, latency):
+    """The estimate columns for a probed row."""
+    searches = search_requests(documents, span_days(qrow))
+    return {'documents': documents,
+            'searches': searches,
+            'retrievals': documents,
+            'bytes': documents * size,
+            'seconds': round((searches + documents) * latency, 1)}
+
+
+def estimate_querylist(session, fname='queries.csv', jobs=1, per_source=1, density_file='',
+                       output=None):
+    """Probe every row of a query file and write a CSV of per-row
+    estimates and a 'total' row to output (stdout by default). If
+    density_file is set, the document counts are recorded in it (see
+    density.py). Returns the totals, with 'seconds' for jobs searches at
+    once in 'seconds_parallel' and the number of failed probes in
+    'failed'.
+    """
+    rows = read_querylist(fname)
+    density = DensityHistory(density_file) if density_file else None
+    estimates = {}
+
+    def probe(search):
+        query_idx, qrow = search[0]
+        documents, size, latency = probe_row(session, qrow)
+        estimates[query_idx] = row_estimate(qrow, documents, size, latency)
+        if density is not None:
+            density.record(qrow['source_id'], qrow['keyword_string'],
+                           qrow['begin_date'], qrow['end_date'], documents)
+
+    status = Scheduler(jobs, per_source).run([[row] for row in rows], probe)
+    if density is not None:
+        density.save()
+
+    totals = dict((column, 0) for column in ('documents', 'searches', 'retrievals', 'bytes', 'seconds'))
+    writer = csv.DictWriter(output or sys.stdout, fieldnames=COLUMNS)
+    writer.writeheader()
+    for query_idx, qrow in rows:
+        line = dict((column, qrow.get(column, '')) for column in COLUMNS)
+        line['query_idx'] = query_idx
+        if query_idx in estimates:
+            line.update(estimates[query_idx])
+            for column in totals:
+                totals[column] += estimates[query_idx][column]
+        writer.writerow(line)
+    totals['seconds'] = round(totals['seconds'], 1)
+    writer.writerow(dict(totals, query_idx='total'))
+    totals['seconds_parallel'] = round(totals['seconds'] / max(jobs, 1), 1)
+    totals['failed'] = status['failed']
+    logging.info('%d documents, %d searches, %d retrievals, %d bytes, %.0f s (%.0f s with %d jobs), '
+                 '%d rows failed', totals['documents'], totals['searches'], totals['retrievals'],
+                 totals['bytes'], totals['seconds'], totals['seconds_parallel'], jobs, totals['failed'])
+    return totals
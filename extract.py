@@ -0,0 +1,96 @@
+"""Article markup extraction for WE1S (WhatEvery1Says)
+
+Pulls the copyright line, body text and any other configured div classes
+out of a LexisNexis Display-markup article with a single lxml parse and a
+single walk over its div elements. Results match what search_query used
+to collect with separate BeautifulSoup find / find_all calls:
+
+    body       text of every <div class="BODY">, strings joined by ' '
+    copyright  last child of the first PUB-COPYRIGHT (else COPYRIGHT) div,
+               with any leading 'Copyright YYYY ' removed
+    <class>    text of every div of each extra class, as for body
+"""
+
+import re
+import threading
+
+from lxml import etree
+import lxml.html
+
+BODY_CLASS = 'BODY'
+COPYRIGHT_CLASSES = ('PUB-COPYRIGHT', 'COPYRIGHT')
+COPYRIGHT_YEAR = re.compile('Copyright [0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f] ')
+
+_LOCAL = threading.local()
+
+
+def _parser():
+    """lxml parsers must not be shared between threads; keep one per thread."""
+    parser = getattr(_LOCAL, 'parser', None)
+    if parser is None:
+        parser = _LOCAL.parser = etree.HTMLParser(encoding='utf-8')
+    return parser
+
+
+class ArticleExtractor:
+    """Extract text by div class from article markup in one tree walk.
+
+    An extractor holds no per-article state and may be shared freely.
+    """
+
+    def __init__(self, classes=(), body_class=BODY_CLASS,
+                 copyright_classes=COPYRIGHT_CLASSES):
+        self.body_class = body_class
+        self.copyright_classes = tuple(copyright_classes)
+        self.classes = tuple(classes)
+        self.text_classes = frozenset((body_class,) + self.classes)
+        self.wanted = self.text_classes | frozenset(self.copyright_classes)
+
+    def parse(self, markup):
+        """Parse article markup (str or bytes) into an lxml root element,
+        or None if there is nothing to parse.
+        """
+        if isinstance(markup, str):
+            markup = markup.encode('utf-8')
+        try:
+            return lxml.html.document_fromstring(markup, parser=_parser())
+        except etree.LxmlError:
+            return None
+
+    def extract(self, markup):
+        """Return a dict with 'body', 'copyright' and one entry per extra class."""
+        texts = {cls: [] for cls in self.text_classes}
+        copyrights = {}
+        root = self.parse(markup)
+        for div in (root.iter('div') if root is not None else ()):
+            classes = div.get('class')
+            if not classes:
+                continue
+            for cls in self.wanted.intersection(classes.split()):
+                if cls in texts:
+                    texts[cls].append(' '.join(div.itertext()))
+                if cls in self.copyright_classes and cls not in copyrights:
+                    copyrights[cls] = div
+        result = {cls: ''.join(parts) for cls, parts in texts.items()}
+        result['body'] = result.pop(self.body_class)
+        result['copyright'] = ''
+        for cls in self.copyright_classes:
+            if cls in copyrights:
+                result['copyright'] = COPYRIGHT_YEAR.sub('', last_child_string(copyrights[cls]))
+                break
+        return result
+
+
+def last_child_string(element):
+    """The last child node of an element as a string: a trailing text node,
+    else the serialized last child element, else the element's own text.
+    """
+    if len(element):
+        last = element[-1]
+        if last.tail:
+            return last.tail
+        return lxml.html.tostring(last, encoding='unicode', with_tail=False)
+    return element.text or ''
+
+
+DEFAULT_EXTRACTOR = ArticleExtractor()
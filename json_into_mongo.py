@@ -1,55 +1,201 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""json_into_mongo.py
+"""Load the .json articles of output zips into a Mongo collection
+
+Load a tree of zips into we1s.Corpus on host mongo:
+    ./json_into_mongo.py ../wskoutput
+
+Upsert on article name (safe to re-run), into another host and collection:
+    ./json_into_mongo.py ../wskoutput --host localhost --db we1s --collection Corpus --upsert
+
+Resume an interrupted load, skipping zips it finished:
+    ./json_into_mongo.py ../wskoutput --resume ingested.txt
+
+Profile the workers' read and write stages (see profiling.py):
+    ./json_into_mongo.py ../wskoutput --profile ../profile
+
+Zips are spread over a process pool. Each worker decodes the articles of
+its zips and sends them in unordered batches of --batch-size: insert_many,
+or with --upsert bulk replaces keyed on 'name', which gets a unique
+index (a collection that already holds duplicate names must be
+deduplicated first); upserts of one name that collide are counted as
+DuplicateKeyError. The paths of finished zips are appended to the
+--resume file; zips with read or write errors are not, and are loaded
+again on resume (use --upsert to avoid duplicating their other
+articles). Throughput is printed as zips finish, and errors are counted
+by type.
 """
 import argparse
 import json
+import multiprocessing
 import os
+import time
 import zipfile
 
-from pymongo import MongoClient
+import profiling
+from profiling import stage
+
+_worker = {}
+
+# errors that loading the zip again would not fix
+PERMANENT_ERRORS = ('JSONDecodeError', 'UnicodeDecodeError', 'ValueError', 'DuplicateKeyError')
+
+
+def _init_worker(host, port, db, collection, namefilter, batch_size, upsert):
+    from pymongo import MongoClient
+
+    client = MongoClient(host, port)
+    _worker.update(collection=client[db][collection], namefilter=namefilter,
+                   batch_size=batch_size, upsert=upsert)
 
 
-def main(filespath, namefilter='.json'):
-    """Loop through zip files..."""
+def _count(errors, error_type, count=1):
+    errors[error_type] = errors.get(error_type, 0) + count
 
-    client = MongoClient('mongo', 27017)
-    db_collection = client['we1s']['Corpus'] # filespath
 
-    os.chdir(filespath)
-    count = 0
+def _send(batch, counts, errors):
+    """Write a batch of articles to the worker's collection, unordered."""
+    from pymongo import ReplaceOne
+    from pymongo.errors import BulkWriteError, PyMongoError
+
+    collection = _worker['collection']
+    try:
+        if _worker['upsert']:
+            result = collection.bulk_write([ReplaceOne({'name': doc.get('name')}, doc, upsert=True)
+                                            for doc in batch], ordered=False)
+            counts['written'] += result.upserted_count + result.matched_count
+        else:
+            result = collection.insert_many(batch, ordered=False)
+            counts['written'] += len(result.inserted_ids)
+    except BulkWriteError as error:
+        details = error.details
+        counts['written'] += details.get('nInserted', 0) + details.get('nUpserted', 0) + \
+                             details.get('nMatched', 0)
+        for write_error in details.get('writeErrors', ()):
+            _count(errors, 'DuplicateKeyError' if write_error.get('code') == 11000
+                   else 'WriteError %s' % write_error.get('code'))
+    except PyMongoError as error:
+        _count(errors, type(error).__name__, len(batch))
+
+
+def ingest_zip(zip_path):
+    """Load the articles of one zip. Returns (zip_path, counts, errors by
+    type).
+    """
+    counts = {'articles': 0, 'written': 0}
     errors = {}
-    for (dirname, _dirs, files) in os.walk(filespath):
-        for filename in files:
-            if filename.endswith('.zip'):  # scan for zip files
-                filepath = os.path.join(dirname, filename)
-                # print('\n', filepath, '\n')
-                source = zipfile.ZipFile(filepath, 'r')  # read zip
-                for afile in source.filelist:
-                    if namefilter and namefilter in afile.filename:
-                        count += 1
-                        # print('   ', afile.filename)
-                        with source.open(afile) as f_in_zip:
-                            try:
-                                file_data = json.loads(f_in_zip.read().decode('utf-8'))
-                                db_collection.insert(file_data)
-                            except json.decoder.JSONDecodeError:
-                                if 'JSONDecodeError' not in errors:
-                                    errors['JSONDecodeError'] = 1
-                                else:
-                                    errors['JSONDecodeError'] += 1
-                        # print('   ', afile.filename)
-        # print('   ' + str(count))
-    client.close()
-    print(errors)
-    print(count)
+    batch = []
+    try:
+        with zipfile.ZipFile(zip_path) as source:
+            for afile in source.filelist:
+                if _worker['namefilter'] and _worker['namefilter'] not in afile.filename:
+                    continue
+                counts['articles'] += 1
+                try:
+                    with stage('read'):
+                        batch.append(json.loads(source.read(afile).decode('utf-8')))
+                except ValueError as error:
+                    _count(errors, type(error).__name__)
+                    continue
+                if len(batch) >= _worker['batch_size']:
+                    with stage('write'):
+                        _send(batch, counts, errors)
+                    batch = []
+        if batch:
+            with stage('write'):
+                _send(batch, counts, errors)
+    except (OSError, zipfile.BadZipFile) as error:
+        _count(errors, type(error).__name__)
+    return zip_path, counts, errors
+
+
+def read_resume(resume_file):
+    """The set of zip paths listed in a resume file."""
+    try:
+        with open(resume_file, encoding='utf-8') as done_file:
+            return set(line.rstrip('\n') for line in done_file)
+    except FileNotFoundError:
+        return set()
+
+
+def main(filespath, namefilter='.json', host='mongo', port=27017, db='we1s',
+         collection='Corpus', batch_size=1000, processes=None, upsert=False, resume_file='',
+         profile=None):
+    """Load every zip under filespath with a process pool. Returns (totals,
+    errors by type). With profile, a dict of profiling.start() options, the
+    workers are profiled.
+    """
+    done = read_resume(resume_file) if resume_file else set()
+    zip_paths = [os.path.join(dirname, filename)
+                 for (dirname, _dirs, files) in os.walk(filespath)
+                 for filename in sorted(files) if filename.endswith('.zip')]
+    totals = {'zips': 0, 'skipped': 0, 'articles': 0, 'written': 0}
+    totals['skipped'] = sum(1 for zip_path in zip_paths if zip_path in done)
+    zip_paths = [zip_path for zip_path in zip_paths if zip_path not in done]
+    errors = {}
+    if upsert:
+        from pymongo import MongoClient
+
+        client = MongoClient(host, port)
+        # unique, so concurrent upserts of one name cannot both insert
+        client[db][collection].create_index('name', unique=True)
+        client.close()
+    start = time.time()
+    done_file = open(resume_file, 'a', encoding='utf-8') if resume_file else None
+    initializer, initargs = profiling.worker_initializer(
+        profile, _init_worker, (host, port, db, collection, namefilter, batch_size, upsert))
+    pool = multiprocessing.Pool(processes, initializer=initializer, initargs=initargs)
+    try:
+        for zip_path, counts, zip_errors in pool.imap_unordered(ingest_zip, zip_paths):
+            totals['zips'] += 1
+            for key, value in counts.items():
+                totals[key] += value
+            for key, value in zip_errors.items():
+                _count(errors, key, value)
+            if zip_errors:
+                print(' ! errors in', zip_path, zip_errors)
+            if done_file and all(key in PERMANENT_ERRORS for key in zip_errors):
+                done_file.write(zip_path + '\n')
+                done_file.flush()
+            elapsed = time.time() - start
+            print('%d/%d zips, %d articles, %.0f articles/s' % (
+                totals['zips'], len(zip_paths), totals['articles'],
+                totals['articles'] / elapsed if elapsed else 0))
+    finally:
+        pool.close()
+        pool.join()
+        if done_file:
+            done_file.close()
+    if profile:
+        print(profiling.merge_workers(**profile))
+    return totals, errors
 
 
 if __name__ == '__main__':
-    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
     PARSER.add_argument('dir', nargs='?', default='',
                         help='directory tree to process')
     PARSER.add_argument('-n', '--namefilter', default='.json',
                         help='pattern for content filenames, e.g. json')
+    PARSER.add_argument('--host', default='mongo')
+    PARSER.add_argument('--port', type=int, default=27017)
+    PARSER.add_argument('--db', default='we1s')
+    PARSER.add_argument('--collection', default='Corpus')
+    PARSER.add_argument('-b', '--batch-size', type=int, default=1000,
+                        help='articles per insert_many / bulk write, 1000 by default')
+    PARSER.add_argument('-j', '--processes', type=int, help='worker processes, default: cpu count')
+    PARSER.add_argument('--upsert', action='store_true',
+                        help='replace articles with the same name instead of inserting')
+    PARSER.add_argument('--resume', default='',
+                        help='skip the zips listed in this file, and add finished zips to it')
+    profiling.add_arguments(PARSER)
     ARGS = PARSER.parse_args()
-    main(os.path.abspath(ARGS.dir), ARGS.namefilter)
+    START = time.time()
+    TOTALS, ERRORS = main(os.path.abspath(ARGS.dir), ARGS.namefilter, ARGS.host, ARGS.port,
+                          ARGS.db, ARGS.collection, ARGS.batch_size, ARGS.processes,
+                          ARGS.upsert, ARGS.resume, profiling.from_args(ARGS))
+    ELAPSED = time.time() - START
+    print(TOTALS)
+    print(ERRORS)
+    print('%.1fs, %.0f articles/s' % (ELAPSED, TOTALS['articles'] / ELAPSED if ELAPSED else 0))
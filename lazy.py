@@ -0,0 +1,34 @@
+"""Deferred imports of optional packages for WE1S (WhatEvery1Says)
+
+numpy, scipy, pyarrow and zstandard each take tens of milliseconds or
+more to import, and most runs of a command line tool never reach the
+code that needs them. Modules get them with optional() where they are
+used instead of at import time:
+
+    numpy = optional('numpy')
+    if numpy is None:
+        raise ImportError('loading a DTM requires the numpy package')
+
+The first call imports the package; later calls return it, or None if
+it is not installed, from a cache.
+"""
+
+import importlib
+
+_MODULES = {}
+
+
+def optional(name):
+    """The module name, e.g. 'scipy.sparse', imported on the first call,
+    or None if it cannot be imported.
+    """
+    try:
+        return _MODULES[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+    _MODULES[name] = module
+    return module
@@ -8,22 +8,22 @@ import csv
 import os
 import re
 
+from manifest import cell_key, done_cells
+
+HEADER = ['source_title', 'source_id', 'keyword_string', 'begin_date', 'end_date', 'result_filter']
+
 def year_dates(year):
     '''Returns begin and end dates for one year, starting on Jan 1 and ending Dec 31.'''
     begin_date = str(year) + '-01-01'
     end_date = str(year) + '-12-31'
     return begin_date, end_date
 
-def month_dates(year):
-    '''Returns begin and end dates for 1 month for one year, month selected randomly.'''
-    month_range = list(range(1,13))
-    random_month = str(random.sample(month_range, 1)).strip('[]')
-    if len(random_month) < 2:
-        random_month = '0' + random_month
-    first_day = random_month + '-01'
-    last_day = random_month + '-' + str(calendar.monthrange(begin_year, int(random_month))[1])
-    begin_date = str(year) + '-' + first_day
-    end_date = str(year) + '-' + last_day
+def month_dates(year, rng=random):
+    '''Returns begin and end dates for 1 month for one year, month selected randomly with rng.'''
+    month = rng.randint(1, 12)
+    last_day = calendar.monthrange(year, month)[1]
+    begin_date = '%d-%02d-01' % (year, month)
+    end_date = '%d-%02d-%02d' % (year, month, last_day)
     return begin_date, end_date
 
 def create_kf_dict(keyword_list, filter_list):
@@ -36,97 +36,97 @@ def create_kf_dict(keyword_list, filter_list):
         i += 1
     return keyword_filter_dict
 
+def existing_sources(data_dir):
+    '''Yields (name, source_id) for each distinct source of the Lexis Nexis zip files
+    (named source_id_name_...) in the tree of data_dir.'''
+    seen = set()
+    for (dirname, _dirs, files) in os.walk(data_dir):
+        for file in sorted(files):
+            # Grab only Lexis Nexis files from given directory.
+            if not (file.endswith('.zip') and re.match(r'^\d', file)):
+                continue
+            # Split up filename into parts and grab id and name.
+            file_parts = file.split('_')
+            if len(file_parts) < 2:
+                print(os.path.join(dirname, file))
+                continue
+            source_id, name = file_parts[0], file_parts[1]
+            if (name, source_id) not in seen:
+                seen.add((name, source_id))
+                yield name, source_id
+
+def file_sources(source_file):
+    '''Yields (name, source_id) for each line of a source_name,source_id txt file, with
+    special characters, spaces, and punctuation removed from the lowercased name.'''
+    with open(source_file, 'r') as sf:
+        for row in sf:
+            # Split source_file on the comma separating name from source id.
+            source_parts = row.strip().split(',')
+            if len(source_parts) < 2:
+                continue
+            yield re.sub(r'\W+', '', source_parts[0]).lower(), source_parts[1]
+
+def query_rows(sources, keyword_list, filter_list, begin_year, end_year,
+               by_year=True, by_month=False, seed=None):
+    '''Yields query rows for every year, keyword and source: one row per year with by_year,
+    and one for a random month of each year per keyword with by_month. sources is a list of
+    (name, source_id) pairs. With a seed, the random months are the same on every run.
+    A keyword listed more than once gets one set of rows, with its last filter.'''
+    rng = random.Random(seed)
+    keyword_filter_dict = create_kf_dict(keyword_list, filter_list)
+    for year in range(begin_year, end_year+1):
+        if by_year:
+            begin_date, end_date = year_dates(year)
+            for keyword_string, result_filter in keyword_filter_dict.items():
+                for name, source_id in sources:
+                    yield [name, source_id, keyword_string, begin_date, end_date, result_filter]
+        if by_month:
+            for keyword_string, result_filter in keyword_filter_dict.items():
+                begin_date, end_date = month_dates(year, rng)
+                for name, source_id in sources:
+                    yield [name, source_id, keyword_string, begin_date, end_date, result_filter]
+
+def write_queries(query_csv, rows, manifest=''):
+    '''Write query rows to a query csv, leaving out rows recorded as done in a collector
+    manifest file (see manifest.py), so that a restarted campaign only queries the cells
+    that are missing or failed. Returns (rows written, rows skipped).'''
+    done = done_cells(manifest) if manifest else set()
+    written = skipped = 0
+    with open(query_csv, 'w', newline='') as qf:
+        query_writer = csv.writer(qf, delimiter = ',')
+        query_writer.writerow(HEADER)
+        for row in rows:
+            if cell_key(row[1], row[2], row[3], row[4]) in done:
+                skipped += 1
+                continue
+            query_writer.writerow(row)
+            written += 1
+    return written, skipped
+
 
 def query_existing(query_csv, data_dir, keyword_list, filter_list, 
-                      begin_year, end_year, exclude_list=[''], by_year=True, by_month=False):
-    '''Produce query csv for all Lexis Nexis sources in a given directory, using one or more keywords and result filters.
+                      begin_year, end_year, exclude_list=[''], by_year=True, by_month=False,
+                      manifest='', seed=None):
+    '''Produce query csv for all Lexis Nexis sources in a given directory tree, using one or more keywords and result filters.
     Set by default to query all sources in one-year increments between given begin and end years. Can 
-    configure to select one random month from each year to query for each keyword instead.'''
-    name_id = {}  
-    for file in os.listdir(data_dir):
-        # Grab only Lexis Nexis files from given directory.
-        if file.endswith('.zip') and re.match(r'^\d', file):
-            # Split up filename into parts.
-            file_parts = file.split('_')
-            # Grab id and name.
-            try:
-                source_id = file_parts[0]
-                name = file_parts[1]
-            except IndexError as err:
-                print(file)
-            # Create name_id dict and add name and id to it.
-            name_id[name] = source_id
-    with open(query_csv, 'w') as qf:
-        query_writer = csv.writer(qf, delimiter = ',')
-        query_writer.writerow(['source_title', 'source_id', 'keyword_string', 'begin_date', 'end_date', 'result_filter'])
-        year_range = list(range(begin_year, end_year+1))
-        for year in year_range:
-            if by_year == True:
-                dates = year_dates(year)
-                begin_date = dates[0]
-                end_date = dates[1]
-                keyword_filter_dict = create_kf_dict(keyword_list, filter_list)
-                for k,v in keyword_filter_dict.items():
-                    keyword_string = k
-                    result_filter = v
-                    for k,v in name_id.items():
-                        query_writer.writerow([k, v, keyword_string, begin_date, end_date, result_filter])
-            if by_month == True:
-                keyword_filter_dict = create_kf_dict(keyword_list, filter_list)
-                for k,v in keyword_filter_dict.items():
-                    keyword_string = k
-                    result_filter = v
-                    dates = month_dates(year)
-                    begin_date = dates[0]
-                    end_date = dates[1]
-                    for k,v in name_id.items():
-                        query_writer.writerow([k, v, keyword_string, begin_date, end_date, result_filter])
+    configure to select one random month from each year to query for each keyword instead.
+    Cells recorded as done in the manifest file are left out.'''
+    sources = list(existing_sources(data_dir))
+    return write_queries(query_csv, query_rows(sources, keyword_list, filter_list, begin_year, end_year,
+                                               by_year, by_month, seed), manifest)
 
 
 def query_new(query_csv, source_file, keyword_list, filter_list, begin_year, end_year, 
-              by_year=True, by_month=False):
+              by_year=True, by_month=False, manifest='', seed=None):
     '''Produce a Lexis Nexis query from provided source names, index numbers, dates, keywords, and result filters.
     Source_file must be txt file with the following format (one source per line): 
         source_name,source_id.
     Set by default to query all given sources in one-year increments between given begin and end years. Can 
-    configure to select one random month from each year to query for each keyword instead.'''
-    name_id = {}  
-    with open(source_file, 'r') as sf:
-        for row in sf:
-            # Split source_file on the comma separating name from source id.
-            source_parts = row.strip().split(',')
-            name = source_parts[0]
-            # Remove special characters, spaces, and punctuation from source name, lowercase name.
-            name = re.sub('\W+','', name).lower()
-            # Grab source id.
-            source_id = source_parts[1]
-            # Create name_id dict and add name and id to it.
-            name_id[name] = source_id
-    with open(query_csv, 'w') as qf:
-        query_writer = csv.writer(qf, delimiter = ',')
-        query_writer.writerow(['source_title', 'source_id', 'keyword_string', 'begin_date', 'end_date', 'result_filter'])
-        year_range = list(range(begin_year, end_year+1))
-        for year in year_range:
-            if by_year == True:
-                dates = year_dates(year)
-                begin_date = dates[0]
-                end_date = dates[1]
-                keyword_filter_dict = create_kf_dict(keyword_list, filter_list)
-                for k,v in keyword_filter_dict.items():
-                    keyword_string = k
-                    result_filter = v
-                    for k,v in name_id.items():
-                        query_writer.writerow([k, v, keyword_string, begin_date, end_date, result_filter])
-            if by_month == True:
-                keyword_filter_dict = create_kf_dict(keyword_list, filter_list)
-                for k,v in keyword_filter_dict.items():
-                    keyword_string = k
-                    result_filter = v
-                    dates = month_dates(year)
-                    begin_date = dates[0]
-                    end_date = dates[1]
-                    for k,v in name_id.items():
-                        query_writer.writerow([k, v, keyword_string, begin_date, end_date, result_filter])
+    configure to select one random month from each year to query for each keyword instead.
+    Cells recorded as done in the manifest file are left out.'''
+    sources = list(file_sources(source_file))
+    return write_queries(query_csv, query_rows(sources, keyword_list, filter_list, begin_year, end_year,
+                                               by_year, by_month, seed), manifest)
 
 ### CONFIGURATION: See below for how to configure code -- no command line interface
 ## Implement query_existing.
@@ -150,6 +150,9 @@ def query_new(query_csv, source_file, keyword_list, filter_list, begin_year, end
 # # By month
 # query_existing(query_csv, data_dir, keyword_list, filter_list, begin_year, end_year, exclude_list, 
 #                  by_year=False, by_month=True)
+# # Restart a campaign: only the cells not done in the collector's manifest, with the same random months
+# query_existing(query_csv, data_dir, keyword_list, filter_list, begin_year, end_year, exclude_list, 
+#                  by_year=False, by_month=True, manifest='manifest.jsonl', seed=2018)
 
 ## Implement query_new.
 
@@ -0,0 +1,85 @@
+"""Completed-work manifest for WE1S (WhatEvery1Says) collection runs
+
+The collector appends one JSON line per query row to the manifest when
+the row's search finishes or fails:
+
+    {"source_title": "Chicago Daily Herald", "source_id": "163823",
+     "keyword_string": "liberal arts", "begin_date": "2017-01-01",
+     "end_date": "2017-12-31", "documents": 512, "status": "done",
+     "time": "2017-06-01T12:00:00"}
+
+A cell is a (source_id, keyword_string, begin_date, end_date) key; the
+last line for a cell holds its current status. Lines are appended and
+flushed one at a time, so an interrupted run keeps every row it
+finished. lexisnexis_query_writers.py uses done_cells() to write query
+files with only the cells that are missing or failed.
+"""
+
+import datetime
+import json
+import threading
+
+MANIFEST_FILE = 'manifest.jsonl'
+STATUSES = ('done', 'failed')
+
+
+def cell_key(source_id, keyword_string, begin_date, end_date):
+    """The manifest key of a query row's cell."""
+    return (str(source_id), keyword_string, begin_date, end_date)
+
+
+class Manifest:
+    """Appends query row outcomes to a manifest file. Safe to share between
+    threads.
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, qrow, documents, status='done'):
+        """Append a query row's document count and status, one of STATUSES."""
+        if status not in STATUSES:
+            raise ValueError('unknown status: %s' % status)
+        entry = {'source_title': qrow['source_title'],
+                 'source_id': str(qrow['source_id']),
+                 'keyword_string': qrow['keyword_string'],
+                 'begin_date': qrow['begin_date'],
+                 'end_date': qrow['end_date'],
+                 'documents': documents,
+                 'status': status,
+                 'time': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as manifest_file:
+                manifest_file.write(line)
+
+
+def iter_manifest(path=MANIFEST_FILE):
+    """Yield the entries of a manifest file, skipping a truncated last line.
+    A missing file has no entries.
+    """
+    try:
+        manifest_file = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with manifest_file:
+        for line in manifest_file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """{cell key: last entry} for a manifest file."""
+    cells = {}
+    for entry in iter_manifest(path):
+        cells[cell_key(entry['source_id'], entry['keyword_string'],
+                       entry['begin_date'], entry['end_date'])] = entry
+    return cells
+
+
+def done_cells(path=MANIFEST_FILE):
+    """The set of cell keys whose last status is 'done'."""
+    return set(key for key, entry in load_manifest(path).items() if entry['status'] == 'done')
@@ -0,0 +1,238 @@
+"""Search coalescing for WE1S (WhatEvery1Says)
+
+Query rows that differ only by source (same keyword_string, begin_date and
+end_date) can be sent as one WSK search over several sources, whose
+results are then split back to the rows by source. Sources may only be
+searched together if they are combinable: WSK.search_sources reports a
+list of combinability values per source, and sources are grouped only if
+they share one. Sources with unknown combinability are searched alone.
+
+Combinability is cached in a JSON file of {source_id: [values]} so that
+source lookups are only made for new sources.
+
+Query rows for one source and date range that differ only by keyword can
+be sent as one OR query, if every row has a result_filter: each article
+is then fetched once and goes to the output of every row whose filter
+matches it (see FilterSet), or to a combined (no-exact-match) output if
+none does.
+"""
+
+import json
+import logging
+import re
+
+from scrub.literal import literal_rule, trie_pattern
+from scrub.normalize import isascii
+
+COMBINABILITY_FILE = 'combinability.json'
+MAX_SOURCES = 10
+MAX_KEYWORDS = 10
+
+
+def slugify(text):
+    """Lowercased alphanumeric characters of text."""
+    return ''.join(c for c in text if c.isalnum()).lower()
+
+
+def load_combinability(path=COMBINABILITY_FILE):
+    """{source_id: [combinability values]} from a cache file, or {}."""
+    try:
+        with open(path) as cache:
+            return json.load(cache)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_combinability(combinability, path=COMBINABILITY_FILE):
+    """Save a {source_id: [combinability values]} cache file."""
+    with open(path, 'w') as cache:
+        json.dump(combinability, cache, indent=2, sort_keys=True)
+
+
+def update_combinability(session, rows, combinability):
+    """Look up the combinability of row sources missing from combinability
+    with WSK.search_sources, by source title. Returns True if any were added.
+    """
+    added = False
+    for row in rows:
+        source_id = str(row['source_id'])
+        if source_id in combinability:
+            continue
+        try:
+            sources = session.search_sources(row['source_title'])
+        except Exception as error:  # network / parse failures: search the source alone
+            logging.info('combinability lookup failed for %s: %s', row['source_title'], error)
+            sources = []
+        for source in sources:
+            if str(source['source_id']) not in combinability:
+                combinability[str(source['source_id'])] = source['combinability']
+                added = True
+        if source_id not in combinability:
+            combinability[source_id] = []
+            added = True
+    return added
+
+
+def plan_searches(rows, combinability, max_sources=MAX_SOURCES):
+    """Group (query_idx, row) pairs into searches.
+
+    Returns a list of lists of (query_idx, row): rows in one list share
+    keyword_string, begin_date and end_date, have distinct and combinable
+    sources, and number at most max_sources. Row order is kept within and
+    across searches, by first row.
+    """
+    searches = []
+    open_groups = {}
+    for query_idx, row in rows:
+        key = (row['keyword_string'], row['begin_date'], row['end_date'])
+        values = set(combinability.get(str(row['source_id'])) or ())
+        for group in open_groups.get(key, ()):
+            shared = group['values'] & values
+            if shared and len(group['rows']) < max_sources \
+                    and str(row['source_id']) not in group['sources']:
+                group['values'] = shared
+                group['sources'].add(str(row['source_id']))
+                group['rows'].append((query_idx, row))
+                break
+        else:
+            group = {'values': values, 'sources': {str(row['source_id'])},
+                     'rows': [(query_idx, row)]}
+            searches.append(group['rows'])
+            if values:
+                open_groups.setdefault(key, []).append(group)
+    return searches
+
+
+def plan_keyword_searches(rows, max_keywords=MAX_KEYWORDS):
+    """Group (query_idx, row) pairs with a result_filter into searches.
+
+    Returns a list of lists of (query_idx, row) like plan_searches: rows in
+    one list share source_id, begin_date and end_date, and have at most
+    max_keywords distinct keyword_strings. Rows without a result_filter
+    are searched alone.
+    """
+    searches = []
+    open_groups = {}
+    for query_idx, row in rows:
+        if not row.get('result_filter'):
+            searches.append([(query_idx, row)])
+            continue
+        key = (str(row['source_id']), row['begin_date'], row['end_date'])
+        group = open_groups.get(key)
+        if group is None or (row['keyword_string'] not in group['keywords']
+                             and len(group['keywords']) >= max_keywords):
+            group = open_groups[key] = {'keywords': set(), 'rows': []}
+            searches.append(group['rows'])
+        group['keywords'].add(row['keyword_string'])
+        group['rows'].append((query_idx, row))
+    return searches
+
+
+def keyword_query(rows):
+    """One WSK query string matching the keyword_string of any of rows."""
+    keywords = []
+    for _, row in rows:
+        if row['keyword_string'] not in keywords:
+            keywords.append(row['keyword_string'])
+    if len(keywords) == 1:
+        return keywords[0]
+    return ' or '.join('(' + keyword + ')' for keyword in keywords)
+
+
+class FilterSet:
+    """The result_filters of several query rows, evaluated together.
+
+    matches(text) returns the indexes of the filters that
+    re.search(result_filter, text, re.IGNORECASE) finds in text. Filters
+    that are plain phrases, as most are, are found in one scan of the
+    lowercased text with a prefix-trie pattern (see scrub/literal.py)
+    tried at every position; a phrase matches if it is a prefix of a
+    longest match found by the scan. Other filters, and non-ASCII text
+    whose lowercasing could differ from re.IGNORECASE, are searched one
+    by one.
+    """
+
+    def __init__(self, filters):
+        self.patterns = [re.compile(result_filter, re.IGNORECASE) for result_filter in filters]
+        self.phrases = {}
+        for i, result_filter in enumerate(filters):
+            literal = literal_rule(result_filter, '')
+            if literal and isascii(literal[0]):
+                self.phrases[i] = literal[0].lower()
+        self.scan = None
+        if self.phrases:
+            self.scan = re.compile('(?=(' + trie_pattern(set(self.phrases.values())) + '))')
+
+    def matches(self, text):
+        """Indexes of the filters that match text."""
+        found = set()
+        if self.scan is not None and isascii(text):
+            longest = set(match.group(1) for match in self.scan.finditer(text.lower()))
+            for i, phrase in self.phrases.items():
+                if any(match.startswith(phrase) for match in longest):
+                    found.add(i)
+            remaining = [i for i in range(len(self.patterns)) if i not in self.phrases]
+        else:
+            remaining = range(len(self.patterns))
+        for i in remaining:
+            if self.patterns[i].search(text):
+                found.add(i)
+        return found
+
+
+def split_results(query_result, rows):
+    """Split the result pages of a multi-source search back to its rows.
+
+    Articles are attributed by their source_id. An article whose source_id
+    is missing or matches no row falls back to its publication name
+    matching a row's source_title (both slugified); the number of articles
+    attributed this way is logged. Returns ({query_idx: result pages},
+    unattributed result pages); pages keep their positions so article
+    numbering stays stable.
+    """
+    by_id = {}
+    by_title = {}
+    for query_idx, row in rows:
+        by_id[str(row['source_id'])] = query_idx
+        by_title[slugify(row['source_title'])] = query_idx
+    split = {query_idx: [[] for _ in query_result] for query_idx, _ in rows}
+    unattributed = [[] for _ in query_result]
+    by_name = 0
+    for page_idx, page in enumerate(query_result):
+        for article in page or ():
+            query_idx = by_id.get(str(article.get('source_id', '')))
+            if query_idx is None:
+                query_idx = by_title.get(slugify(article.get('pub') or ''))
+                if query_idx is not None:
+                    by_name += 1
+            if query_idx is None:
+                unattributed[page_idx].append(article)
+            else:
+                split[query_idx][page_idx].append(article)
+    if by_name:
+        logging.warning('%d articles without a matching source_id attributed by publication name',
+                        by_name)
+    return split, unattributed
+
+
+def combined_row(rows):
+    """A query row for articles of a multi-source search that could not be
+    attributed to any of its rows.
+    """
+    first = rows[0][1]
+    filters = set(row.get('result_filter', '') for _, row in rows)
+    source_ids = []
+    keywords = []
+    for _, row in rows:
+        if str(row['source_id']) not in source_ids:
+            source_ids.append(str(row['source_id']))
+        if row['keyword_string'] not in keywords:
+            keywords.append(row['keyword_string'])
+    return {'source_title': 'combined',
+            'combined': True,
+            'source_id': '+'.join(source_ids),
+            'keyword_string': keywords[0] if len(keywords) == 1 else '%d keywords' % len(keywords),
+            'begin_date': first['begin_date'],
+            'end_date': first['end_date'],
+            'result_filter': filters.pop() if len(filters) == 1 else ''}
+
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""Per-stage CPU and memory profiling for WE1S (WhatEvery1Says)
+
+searchcmd.py --profile DIR profiles a collection run by stage:
+
+    network     waiting on WSK requests
+    soap_parse  parsing Search and Retrieval SOAP responses
+    doc_parse   decoding documents' Cite metadata (wsk.Document)
+    scrub       extracting, cleaning, scrubbing and bagging article text
+    write       writing articles to the output sink
+
+json_into_mongo.py, rescrub.py and scrub/batch.py take the same options
+and profile their worker processes by read, scrub and write stages.
+
+Code marks a stage with `with profiling.stage('scrub'):`, which costs
+nothing unless a profiler is running. Time is counted for the innermost
+stage only. CPU is profiled either deterministically, with a cProfile
+profile per stage and thread, or, with --profile-mode sample, by a
+thread sampling the stacks of threads inside a stage every few
+milliseconds. Memory is traced with tracemalloc: the net growth of
+traced memory over each stage, and the allocation sites that grew
+between snapshots taken at the boundaries of every SNAPSHOT_EVERY-th
+entry of a stage. Snapshots see the whole process, so sites include
+nested stages and, with -j, other threads' work.
+
+DIR receives:
+
+    summary.txt      time, memory, hot functions and allocation sites
+                     of each stage
+    stages.json      the same, as data
+    <stage>.prof     cProfile stats of the stage (pstats, snakeviz, ...)
+    samples.folded   sampled stacks as '<stage>;<frame>;... <count>'
+                     lines, for flamegraph.pl or speedscope
+
+Worker processes each write to DIR/worker-<pid>, which merge_workers()
+adds up into DIR once the pool is done.
+
+Print the summary of a profile again, with more entries:
+    ./profiling.py DIR --top 50
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+STAGES = ('network', 'soap_parse', 'doc_parse', 'scrub', 'write')
+MODES = ('cprofile', 'sample')
+TOP = 20
+INTERVAL = 0.005
+SNAPSHOT_EVERY = 100
+STAGES_FILE = 'stages.json'
+SUMMARY_FILE = 'summary.txt'
+FOLDED_FILE = 'samples.folded'
+WORKER_PREFIX = 'worker-'
+SAVED_ENTRIES = 500
+
+_ACTIVE = None
+_SELF = os.path.basename(__file__)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._exit()
+        return False
+
+
+def stage(name):
+    """Context manager counting the code it wraps towards stage name of
+    the running profiler, if any.
+    """
+    if _ACTIVE is None:
+        return _NULL_STAGE
+    return _Stage(_ACTIVE, name)
+
+
+def _new_stats():
+    return {'seconds': 0.0, 'entries': 0, 'net_bytes': 0, 'snapshots': 0,
+            'sites': collections.Counter(), 'self_samples': collections.Counter(),
+            'samples': collections.Counter()}
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)))
+
+
+def _frame_label(code):
+    return '%s:%d(%s)' % (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+class Profiler:
+    """Profiles the stages entered by any thread of this process."""
+
+    def __init__(self, path, mode='cprofile', top=TOP, interval=INTERVAL,
+                 snapshot_every=SNAPSHOT_EVERY):
+        if mode not in MODES:
+            raise ValueError('unknown profile mode: %s' % mode)
+        self.path = path
+        self.mode = mode
+        self.top = top
+        self.interval = interval
+        self.snapshot_every = snapshot_every
+        self.stats = collections.defaultdict(_new_stats)
+        self.folded = collections.Counter()
+        self._profiles = []
+        self._stacks = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._running = False
+        self._sampler = None
+        self._cprofile_ok = True
+        self._own_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        self._running = True
+        self.started = time.perf_counter()
+        if self.mode == 'sample':
+            self._sampler = threading.Thread(target=self._sample, name='profiling-sampler')
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def stop(self):
+        self._running = False
+        if self._sampler is not None:
+            self._sampler.join()
+        self.elapsed = time.perf_counter() - self.started
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._local.profiles = {}
+            with self._lock:
+                self._stacks[threading.get_ident()] = stack
+        return stack
+
+    def _profile(self, name):
+        profiles = self._local.profiles
+        if name not in profiles:
+            import cProfile
+            profiles[name] = cProfile.Profile()
+            with self._lock:
+                self._profiles.append((name, profiles[name]))
+        return profiles[name]
+
+    def _resume(self, entry):
+        entry[1] = time.perf_counter()
+        if self.mode == 'cprofile' and self._cprofile_ok:
+            try:
+                self._profile(entry[0]).enable()
+            except ValueError as error:  # another profiler is active
+                self._cprofile_ok = False
+                logging.warning('cProfile unavailable, timing stages only: %s', error)
+
+    def _pause(self, entry):
+        if self.mode == 'cprofile' and self._cprofile_ok:
+            self._profile(entry[0]).disable()
+        seconds = time.perf_counter() - entry[1]
+        with self._lock:
+            self.stats[entry[0]]['seconds'] += seconds
+
+    def _enter(self, name):
+        stack = self._stack()
+        if stack:
+            self._pause(stack[-1])
+        with self._lock:
+            stats = self.stats[name]
+            stats['entries'] += 1
+            snapshot = self.snapshot_every and (stats['entries'] - 1) % self.snapshot_every == 0
+        entry = [name, 0.0, tracemalloc.get_traced_memory()[0],
+                 _snapshot() if snapshot else None]
+        stack.append(entry)
+        self._resume(entry)
+
+    def _exit(self):
+        stack = self._local.stack
+        entry = stack.pop()
+        self._pause(entry)
+        net = tracemalloc.get_traced_memory()[0] - entry[2]
+        sites = None
+        if entry[3] is not None:
+            sites = collections.Counter()
+            for diff in _snapshot().compare_to(entry[3], 'lineno'):
+                if diff.size_diff > 0:
+                    frame = diff.traceback[0]
+                    sites['%s:%d' % (frame.filename, frame.lineno)] += diff.size_diff
+        with self._lock:
+            stats = self.stats[entry[0]]
+            stats['net_bytes'] += net
+            if sites is not None:
+                stats['snapshots'] += 1
+                stats['sites'].update(sites)
+        if stack:
+            self._resume(stack[-1])
+
+    def _sample(self):
+        me = threading.get_ident()
+        while self._running:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                stacks = [(ident, stack[-1][0]) for ident, stack in self._stacks.items()
+                          if stack and ident != me]
+                for ident, name in stacks:
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stats = self.stats[name]
+                    stats['self_samples'][labels[0]] += 1
+                    stats['samples'].update(set(labels))
+                    self.folded[';'.join([name] + labels[::-1])] += 1
+
+    def save(self):
+        """Write the profile to self.path and return the summary text."""
+        import pstats
+        os.makedirs(self.path, exist_ok=True)
+        profiles = collections.defaultdict(list)
+        for name, profile in self._profiles:
+            profiles[name].append(profile)
+        for name, stage_profiles in profiles.items():
+            stats = None
+            for profile in stage_profiles:
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+                except TypeError:  # never enabled
+                    continue
+            if stats is not None:
+                stats.dump_stats(os.path.join(self.path, '%s.prof' % name))
+        data = {'mode': self.mode, 'pid': os.getpid(), 'seconds': self.elapsed,
+                'peak_bytes': self.peak_bytes, 'interval': self.interval,
+                'stages': dict((name, _saved_stats(stats)) for name, stats in self.stats.items())}
+        _write_profile(self.path, data, self.folded)
+        return write_summary(self.path, self.top)
+
+
+def _saved_stats(stats):
+    saved = dict(stats)
+    for key in ('sites', 'self_samples', 'samples'):
+        saved[key] = dict(stats[key].most_common(SAVED_ENTRIES))
+    return saved
+
+
+def _write_profile(path, data, folded):
+    with open(os.path.join(path, STAGES_FILE), 'w') as stages_file:
+        json.dump(data, stages_file, indent=2, sort_keys=True)
+    if folded:
+        with open(os.path.join(path, FOLDED_FILE), 'w') as folded_file:
+            for line, count in sorted(folded.items()):
+                folded_file.write('%s %d\n' % (line, count))
+
+
+def start(path, mode='cprofile', top=TOP, **options):
+    """Start profiling this process into the folder path."""
+    global _ACTIVE
+    if _ACTIVE is not None:
+        raise RuntimeError('a profiler is already running')
+    profiler = Profiler(path, mode, top, **options)
+    profiler.start()
+    _ACTIVE = profiler
+    return profiler
+
+
+def stop():
+    """Stop the running profiler and save it. Returns the summary text,
+    or None if no profiler was running.
+    """
+    global _ACTIVE
+    profiler, _ACTIVE = _ACTIVE, None
+    if profiler is None:
+        return None
+    profiler.stop()
+    return profiler.save()
+
+
+def add_arguments(parser):
+    """Add the --profile options to an argparse parser."""
+    parser.add_argument('--profile', default='',
+                        help='profile CPU and memory per stage into this folder (see profiling.py)')
+    parser.add_argument('--profile-mode', choices=MODES, default='cprofile',
+                        help='--profile: cprofile (deterministic, default) or sample (low overhead)')
+    parser.add_argument('--profile-top', type=int, default=TOP,
+                        help='--profile: functions and allocation sites per stage in the summary,\n'
+                             '%d by default' % TOP)
+
+
+def from_args(args):
+    """start() options from parsed --profile options, or None."""
+    if not args.profile:
+        return None
+    return {'path': args.profile, 'mode': args.profile_mode, 'top': args.profile_top}
+
+
+def _init_worker(profile, initializer, initargs):
+    worker = dict(profile, path=os.path.join(profile['path'], '%s%d' % (WORKER_PREFIX, os.getpid())))
+    start(**worker)
+    from multiprocessing import util
+    util.Finalize(None, stop, exitpriority=10)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def worker_initializer(profile, initializer=None, initargs=()):
+    """(initializer, initargs) for a multiprocessing.Pool whose workers
+    run initializer and, if profile holds start() options, are profiled
+    until they exit.
+    """
+    if not profile:
+        return initializer, initargs
+    return _init_worker, (profile, initializer, initargs)
+
+
+def merge_workers(path, top=TOP, **_options):
+    """Add up the worker profiles in path into a profile of path, and
+    return its summary text, or None if there are none.
+    """
+    workers = sorted(os.path.join(path, name) for name in os.listdir(path)
+                     if name.startswith(WORKER_PREFIX))
+    if not workers:
+        return None
+    merged = {'mode': None, 'pid': None, 'seconds': 0.0, 'peak_bytes': 0, 'workers': len(workers),
+              'stages': {}}
+    folded = collections.Counter()
+    prof_files = collections.defaultdict(list)
+    for worker in workers:
+        data = _read_profile(worker)
+        if data is None:
+            continue
+        merged['mode'] = data['mode']
+        merged['interval'] = data.get('interval', INTERVAL)
+        merged['seconds'] = max(merged['seconds'], data['seconds'])
+        merged['peak_bytes'] = max(merged['peak_bytes'], data['peak_bytes'])
+        for name, stats in data['stages'].items():
+            total = merged['stages'].setdefault(name, _new_stats())
+            for key in ('seconds', 'entries', 'net_bytes', 'snapshots'):
+                total[key] += stats[key]
+            for key in ('sites', 'self_samples', 'samples'):
+                total[key].update(stats[key])
+        folded.update(_read_folded(worker))
+        for filename in os.listdir(worker):
+            if filename.endswith('.prof'):
+                prof_files[filename].append(os.path.join(worker, filename))
+    import pstats
+    for filename, files in prof_files.items():
+        pstats.Stats(*files).dump_stats(os.path.join(path, filename))
+    merged['stages'] = dict((name, _saved_stats(stats)) for name, stats in merged['stages'].items())
+    _write_profile(path, merged, folded)
+    return write_summary(path, top)
+
+
+def _read_profile(path):
+    try:
+        with open(os.path.join(path, STAGES_FILE)) as stages_file:
+            return json.load(stages_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_folded(path):
+    folded = collections.Counter()
+    try:
+        with open(os.path.join(path, FOLDED_FILE)) as folded_file:
+            for line in folded_file:
+                frames, _, count = line.rstrip('\n').rpartition(' ')
+                folded[frames] += int(count)
+    except OSError:
+        pass
+    return folded
+
+
+def _megabytes(size):
+    return '%+.1f MB' % (size / 1e6)
+
+
+def _hot_functions(path, name, stats, top):
+    """Summary lines of a stage's hottest functions."""
+    prof_path = os.path.join(path, '%s.prof' % name)
+    if os.path.exists(prof_path):
+        import pstats
+        entries = pstats.Stats(prof_path).stats
+        rows = sorted(((func, entry) for func, entry in entries.items()
+                       if os.path.basename(func[0]) != _SELF),  # stage bookkeeping
+                      key=lambda item: item[1][2], reverse=True)[:top]
+        lines = ['  %10s %10s %10s  %s' % ('calls', 'tottime', 'cumtime', 'function')]
+        for (filename, lineno, funcname), (_cc, calls, tottime, cumtime, _callers) in rows:
+            lines.append('  %10d %10.3f %10.3f  %s:%d(%s)'
+                         % (calls, tottime, cumtime, filename, lineno, funcname))
+        return lines
+    if stats['self_samples']:
+        total = float(sum(stats['self_samples'].values()))
+        lines = ['  %10s %10s  %s' % ('self %', 'total %', 'function')]
+        for label, count in collections.Counter(stats['self_samples']).most_common(top):
+            lines.append('  %9.1f%% %9.1f%%  %s' % (100 * count / total,
+                                                     100 * stats['samples'].get(label, 0) / total,
+                                                     label))
+        return lines
+    return []
+
+
+def summary(path, top=TOP):
+    """Summary text of the profile saved in path."""
+    data = _read_profile(path)
+    if data is None:
+        raise IOError('no profile in %s' % path)
+    lines = ['%s profile: %.1fs%s, traced memory peak %.1f MB'
+             % (data['mode'], data['seconds'],
+                ' in %d workers' % data['workers'] if data.get('workers') else '',
+                data['peak_bytes'] / 1e6)]
+    ordered = sorted(data['stages'].items(), key=lambda item: item[1]['seconds'], reverse=True)
+    for name, stats in ordered:
+        entries = max(stats['entries'], 1)
+        lines += ['', '%s: %.2fs in %d entries, %.3f ms each; traced memory %s, %s per entry'
+                  % (name, stats['seconds'], stats['entries'], stats['seconds'] * 1000 / entries,
+                     _megabytes(stats['net_bytes']), _megabytes(stats['net_bytes'] / entries))]
+        lines += _hot_functions(path, name, stats, top)
+        if stats['sites']:
+            lines.append('  allocation sites, growth over %d snapshot pairs:' % stats['snapshots'])
+            for site, size in collections.Counter(stats['sites']).most_common(top):
+                lines.append('  %10.1f KB  %s' % (size / 1024.0, site))
+    return '\n'.join(lines) + '\n'
+
+
+def write_summary(path, top=TOP):
+    """Write the summary of the profile in path to its summary.txt and
+    return it.
+    """
+    text = summary(path, top)
+    with open(os.path.join(path, SUMMARY_FILE), 'w') as summary_file:
+        summary_file.write(text)
+    return text
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('path', help='profile folder')
+    PARSER.add_argument('--top', type=int, default=TOP,
+                        help='functions and allocation sites per stage, %d by default' % TOP)
+    ARGS = PARSER.parse_args()
+    print(summary(ARGS.path, ARGS.top))
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Live progress of collection runs for WE1S (WhatEvery1Says)
+
+searchcmd.py counts its progress as it runs:
+
+    rows            query rows in the run, done and failed
+    windows, pages  date windows searched and result pages fetched
+    documents       articles written, and their bytes
+    requests        WSK requests made, failed and in flight
+
+and every --status-interval seconds rewrites a JSON status file
+(status.json by default) with these counts, the document and page rates,
+the request error rate and an ETA from the rate of finished rows. With
+--metrics [HOST:]PORT, the same numbers are served in Prometheus text
+format at http://HOST:PORT/metrics (and the status JSON at /status),
+on localhost unless a host is given, e.g. --metrics 0.0.0.0:9100 in a
+container.
+
+Code counts with progress.add('pages'), which does nothing unless a
+run is being tracked.
+
+Print one line per status file or endpoint; exits with status 1 once any
+run is no longer running:
+    ./progress.py status.json
+    ./progress.py http://collector1:9100 http://collector2:9100
+"""
+
+import argparse
+import datetime
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+STATUS_FILE = 'status.json'
+INTERVAL = 10
+COUNTERS = ('rows_total', 'rows_done', 'rows_failed', 'windows', 'pages', 'documents',
+            'bytes_written', 'requests', 'request_errors', 'write_errors')
+METRICS = [
+    # (metric, type, help, status key)
+    ('rows', 'gauge', 'Query rows of the run.', 'rows_total'),
+    ('rows_done', 'gauge', 'Query rows finished.', 'rows_done'),
+    ('rows_failed', 'gauge', 'Query rows whose search failed.', 'rows_failed'),
+    ('windows_total', 'counter', 'Date windows searched.', 'windows'),
+    ('pages_total', 'counter', 'Result pages fetched.', 'pages'),
+    ('documents_total', 'counter', 'Articles written.', 'documents'),
+    ('bytes_written_total', 'counter', 'Bytes of articles written.', 'bytes_written'),
+    ('requests_total', 'counter', 'WSK requests made.', 'requests'),
+    ('request_errors_total', 'counter', 'WSK requests that failed.', 'request_errors'),
+    ('write_errors_total', 'counter', 'Articles that could not be written.', 'write_errors'),
+    ('requests_in_flight', 'gauge', 'WSK requests waiting for a response.', 'in_flight'),
+    ('documents_per_second', 'gauge', 'Articles written per second.', 'docs_per_sec'),
+    ('pages_per_second', 'gauge', 'Result pages fetched per second.', 'pages_per_sec'),
+    ('request_error_ratio', 'gauge', 'Share of WSK requests that failed.', 'request_error_rate'),
+    ('elapsed_seconds', 'gauge', 'Seconds since the run started.', 'elapsed_seconds'),
+    ('eta_seconds', 'gauge', 'Estimated seconds until all rows are done.', 'eta_seconds'),
+    ('running', 'gauge', '1 while the run is running.', 'running'),
+]
+PREFIX = 'we1s_collector_'
+
+_ACTIVE = None
+
+
+class _NullRequest:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_REQUEST = _NullRequest()
+
+
+class _Request:
+    __slots__ = ('progress',)
+
+    def __init__(self, progress):
+        self.progress = progress
+
+    def __enter__(self):
+        with self.progress.lock:
+            self.progress.counts['requests'] += 1
+            self.progress.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        with self.progress.lock:
+            self.progress.in_flight -= 1
+            if exc_type is not None:
+                self.progress.counts['request_errors'] += 1
+        return False
+
+
+def add(key, amount=1):
+    """Add amount to one of COUNTERS of the tracked run, if any."""
+    if _ACTIVE is not None:
+        _ACTIVE.add(key, amount)
+
+
+def request():
+    """Context manager counting a WSK request of the tracked run, if any,
+    as in flight, and as failed if it raises.
+    """
+    if _ACTIVE is None:
+        return _NULL_REQUEST
+    return _Request(_ACTIVE)
+
+
+def _timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds).isoformat(' ', 'seconds') if seconds else None
+
+
+class Progress:
+    """The counts of a run, with a status file rewritten every interval
+    seconds and an optional metrics endpoint. Safe to share between
+    threads.
+    """
+
+    def __init__(self, status_file=STATUS_FILE, interval=INTERVAL, metrics=''):
+        self.status_file = status_file
+        self.interval = interval
+        self.metrics = metrics
+        self.counts = dict((key, 0) for key in COUNTERS)
+        self.in_flight = 0
+        self.state = 'running'
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self._stopped = threading.Event()
+        self._writer = None
+        self._server = None
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def status(self):
+        """The counts and rates of the run as a dict."""
+        now = time.time()
+        with self.lock:
+            status = dict(self.counts, in_flight=self.in_flight, state=self.state)
+        elapsed = now - self.started
+        finished = status['rows_done'] + status['rows_failed']
+        remaining = max(status['rows_total'] - finished, 0)
+        eta = elapsed / finished * remaining if finished and status['state'] == 'running' else None
+        status.update(
+            pid=os.getpid(), host=socket.gethostname(), argv=sys.argv,
+            started=_timestamp(self.started), updated=_timestamp(now),
+            elapsed_seconds=round(elapsed, 1),
+            docs_per_sec=round(status['documents'] / elapsed, 2) if elapsed else 0.0,
+            pages_per_sec=round(status['pages'] / elapsed, 2) if elapsed else 0.0,
+            request_error_rate=round(float(status['request_errors']) / status['requests'], 4)
+            if status['requests'] else 0.0,
+            eta_seconds=round(eta) if eta is not None else None,
+            eta=_timestamp(now + eta) if eta is not None else None,
+            running=int(status['state'] == 'running'))
+        return status
+
+    def write_status(self):
+        """Atomically rewrite the status file."""
+        if not self.status_file:
+            return
+        tmp_path = self.status_file + '.tmp'
+        with open(tmp_path, 'w') as status_file:
+            json.dump(self.status(), status_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.status_file)
+
+    def prometheus(self):
+        """The status in Prometheus text exposition format."""
+        status = self.status()
+        lines = []
+        for metric, metric_type, text, key in METRICS:
+            value = status.get(key)
+            if value is None:
+                continue
+            lines += ['# HELP %s%s %s' % (PREFIX, metric, text),
+                      '# TYPE %s%s %s' % (PREFIX, metric, metric_type),
+                      '%s%s %s' % (PREFIX, metric, value)]
+        return '\n'.join(lines) + '\n'
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.write_status()
+            except OSError as error:
+                print(' ! could not write status:', error)
+
+    def start(self):
+        self.write_status()
+        self._writer = threading.Thread(target=self._write_loop, name='progress-status')
+        self._writer.daemon = True
+        self._writer.start()
+        if self.metrics:
+            self._server = _serve(self, self.metrics)
+
+    def stop(self, state='finished'):
+        with self.lock:
+            self.state = state
+        self._stopped.set()
+        if self._writer is not None:
+            self._writer.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.write_status()
+
+
+def parse_address(address):
+    """(host, port) from '[HOST:]PORT'; the host defaults to localhost."""
+    host, _, port = str(address).rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def _serve(progress, address):
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') in ('', '/metrics'):
+                body = progress.prometheus()
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif self.path.rstrip('/') == '/status':
+                body = json.dumps(progress.status(), indent=2, sort_keys=True)
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(parse_address(address), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='progress-metrics')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def start(status_file=STATUS_FILE, interval=INTERVAL, metrics=''):
+    """Start tracking a run."""
+    global _ACTIVE
+    if _ACTIVE is not None:
+        raise RuntimeError('a run is already being tracked')
+    progress = Progress(status_file, interval, metrics)
+    progress.start()
+    _ACTIVE = progress
+    return progress
+
+
+def stop(state='finished'):
+    """Stop tracking the run, recording its final state."""
+    global _ACTIVE
+    progress, _ACTIVE = _ACTIVE, None
+    if progress is not None:
+        progress.stop(state)
+
+
+def read_status(source):
+    """The status dict of a status file or a metrics endpoint URL."""
+    if source.startswith(('http://', 'https://')):
+        from urllib.request import urlopen
+        with urlopen(source.rstrip('/') + '/status', timeout=10) as response:
+            return json.loads(response.read().decode('utf-8'))
+    with open(source) as status_file:
+        return json.load(status_file)
+
+
+def is_running(status):
+    """Whether a status is of a running run: its state, and, for a status
+    file of this host, whether its process is alive.
+    """
+    if status.get('state') != 'running':
+        return False
+    if status.get('host') == socket.gethostname():
+        try:
+            os.kill(status['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def format_status(status):
+    """One line summarizing a status."""
+    eta = ('ETA %s (%ds)' % (status['eta'], status['eta_seconds'])
+           if status.get('eta_seconds') is not None else 'ETA -')
+    return ('%s pid %s %s: rows %d/%d (%d failed), %d windows, %d pages, %d docs (%.1f/s), '
+            '%.1f MB, %d requests (%d in flight, %.1f%% errors), %d write errors, %s, updated %s'
+            % (status['host'], status['pid'], status['state'], status['rows_done'],
+               status['rows_total'], status['rows_failed'], status['windows'], status['pages'],
+               status['documents'], status['docs_per_sec'], status['bytes_written'] / 1e6,
+               status['requests'], status['in_flight'], status['request_error_rate'] * 100,
+               status['write_errors'], eta, status['updated']))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('sources', nargs='*', default=[STATUS_FILE],
+                        help='status files or metrics endpoint URLs, "%s" by default' % STATUS_FILE)
+    ARGS = PARSER.parse_args()
+    RUNNING = True
+    for SOURCE in ARGS.sources:
+        try:
+            STATUS = read_status(SOURCE)
+        except (OSError, ValueError) as error:
+            print('%s: %s' % (SOURCE, error))
+            RUNNING = False
+            continue
+        print(format_status(STATUS))
+        RUNNING = RUNNING and is_running(STATUS)
+    sys.exit(0 if RUNNING else 1)
@@ -1,11 +1,44 @@
 #!/usr/bin/env python3
 """WE1S Query Expander: Expand multi-year ranges in queries.csv into valid query rows.
+
+    ./query_expander.py
+    ./query_expander.py -i queries.csv -o queries-expanded.csv --density density.json --target 500
+
+With --density, ranges are split into windows expected to hold about
+--target documents each, from the article counts recorded by previous
+runs (see density.py); sources and keywords with no history are still
+expanded into one row per year.
 """
+import argparse
 import csv
+import datetime
 import pprint
 
+from density import DensityHistory
+
+TARGET_DOCUMENTS = 500
+
 
-def expand_querylist(fname='queries.csv', fout='queries-expanded.csv'):
+def density_windows(first_year, last_year, documents_per_day, target=TARGET_DOCUMENTS):
+    """(begin_date, end_date) windows covering first_year to last_year,
+    each expected to hold about target documents at documents_per_day.
+    """
+    begin = datetime.date(first_year, 1, 1)
+    last = datetime.date(last_year, 12, 31)
+    if documents_per_day > 0:
+        days = max(int(target / documents_per_day), 1)
+    else:
+        days = (last - begin).days + 1
+    windows = []
+    while begin <= last:
+        end = min(begin + datetime.timedelta(days=days - 1), last)
+        windows.append((begin.isoformat(), end.isoformat()))
+        begin = end + datetime.timedelta(days=1)
+    return windows
+
+
+def expand_querylist(fname='queries.csv', fout='queries-expanded.csv', density=None,
+                     target=TARGET_DOCUMENTS):
     """For a list of queries in csv format, expand queries for which
     the begin_date is two years joined by ... into multiple rows
     of year queries, pass through others unchanged. For example:
@@ -15,15 +48,20 @@ def expand_querylist(fname='queries.csv', fout='queries-expanded.csv'):
         Chicago Daily Herald,163823,liberal arts,2000...2003,liberal arts
         Chicago Daily Herald,163823,liberal arts,2010-01-01,2010-02-01,liberal arts
 
-    ...here the middle row is expanded to three rows:
+    ...here the middle row is expanded to four rows:
 
         source_title,source_id,keyword_string,begin_date,end_date,result_filter
         Chicago Daily Herald,163823,liberal arts,1990-01-01,1990-02-01,liberal arts
         Chicago Daily Herald,163823,liberal arts,2000-01-01,2000-12-31,liberal arts
         Chicago Daily Herald,163823,liberal arts,2001-01-01,2001-12-31,liberal arts
         Chicago Daily Herald,163823,liberal arts,2002-01-01,2002-12-31,liberal arts
-        Chicago Daily Herald,163823,liberal arts,2002-01-01,2003-12-31,liberal arts
+        Chicago Daily Herald,163823,liberal arts,2003-01-01,2003-12-31,liberal arts
         Chicago Daily Herald,163823,liberal arts,2010-01-01,2010-02-01,liberal arts
+
+    If density is a density.DensityHistory with counts for the row's source
+    and keyword_string, the range is instead split into windows of about
+    target documents each: a few rows for a sparse source, many short
+    ones for a dense source.
     """
     queryrows = []
     with open(fname, 'r') as csvfile:
@@ -32,12 +70,20 @@ def expand_querylist(fname='queries.csv', fout='queries-expanded.csv'):
         for _, row in enumerate(querydict):
             if '...' in row['begin_date'] and not row['end_date']:
                 terms = [int(x) for x in row['begin_date'].split('...')]
-                for year in range(terms[0], terms[1]+1):
+                rate = None
+                if density is not None:
+                    rate = density.documents_per_day(row['source_id'], row['keyword_string'])
+                if rate is None:
+                    windows = [(str(year)+'-01-01', str(year)+'-12-31')
+                               for year in range(terms[0], terms[1]+1)]
+                else:
+                    windows = density_windows(terms[0], terms[1], rate, target)
+                for begin_date, end_date in windows:
                     queryrows.append([row['source_title'],
                                       row['source_id'],
                                       row['keyword_string'],
-                                      str(year)+'-01-01',
-                                      str(year)+'-12-31',
+                                      begin_date,
+                                      end_date,
                                       row['result_filter']])
             else:
                 queryrows.append([row['source_title'],
@@ -54,4 +100,14 @@ def expand_querylist(fname='queries.csv', fout='queries-expanded.csv'):
 
 
 if __name__ == "__main__":
-    expand_querylist()
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('-i', '--input', default='queries.csv', help='query file to expand')
+    PARSER.add_argument('-o', '--output', default='queries-expanded.csv', help='expanded query file')
+    PARSER.add_argument('--density', help='size rows from the article counts in this history file')
+    PARSER.add_argument('--target', type=int, default=TARGET_DOCUMENTS,
+                        help='--density: documents per row, %d by default' % TARGET_DOCUMENTS)
+    ARGS = PARSER.parse_args()
+    expand_querylist(ARGS.input, ARGS.output,
+                     density=DensityHistory(ARGS.density) if ARGS.density else None,
+                     target=ARGS.target)
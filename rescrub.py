@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Re-scrub stored collections with the current scrub/config.py rules
+
+Recompute article 'content' without refetching, from the stored
+'content-unscrubbed' text or, failing that, from the article's raw .xml.
+
+Rewrite output zips in a tree in place:
+    ./rescrub.py ../wskoutput
+
+Write re-scrubbed articles to a new sink instead:
+    ./rescrub.py ../wskoutput -o ../rescrubbed --sink jsonl
+
+Re-scrub the Mongo Corpus collection:
+    ./rescrub.py --mongo mongo --db we1s --collection Corpus
+
+Profile the workers' read, scrub and write stages (see profiling.py):
+    ./rescrub.py ../wskoutput --profile ../profile
+
+Articles whose 'scrub_ruleset' already matches the current ruleset are
+skipped. Bagged articles are re-bagged in their stored 'bag_mode', except
+for 'ids' bags: their term ids belong to the vocabulary.txt of the search
+run, which parallel workers cannot extend consistently, so they are left
+as they are and counted as 'novocabulary'. Zips are processed in parallel; for Mongo, documents are scrubbed
+in parallel and written back with unordered bulk updates.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import zipfile
+
+import profiling
+from bow import bag
+from extract import DEFAULT_EXTRACTOR
+from profiling import stage
+from scrub.normalize import clean_text
+from scrub.scrub import get_scrubber
+from sinks import SINKS, open_sink
+
+_worker = {}
+
+
+def rescrub_article(article, xml, scrubber, bagify=False, vocabulary=None):
+    """Recompute article['content'] in place, bagged in the article's
+    'bag_mode' if it has one (an 'ids' bag needs the run's vocabulary), or
+    as a sorted bag if bagify is set. Returns 'current' if the article is
+    already scrubbed with scrubber's ruleset, 'nosource' if there is no
+    stored text to scrub, 'novocabulary' for an 'ids' bag without a
+    vocabulary, else 'rescrubbed'.
+    """
+    if article.get('scrub_ruleset') == scrubber.fingerprint:
+        return 'current'
+    bag_mode = article.get('bag_mode')
+    if bag_mode == 'ids' and vocabulary is None:
+        return 'novocabulary'
+    bagify = bagify or bag_mode is not None
+    if isinstance(article.get('content-unscrubbed'), str):
+        txt = article['content-unscrubbed']
+    elif xml:
+        txt = clean_text(DEFAULT_EXTRACTOR.extract(xml)['body'])
+        if not bagify:
+            article['content-unscrubbed'] = txt
+    else:
+        return 'nosource'
+    txt = scrubber(txt)
+    if bagify:
+        txt = bag(txt, bag_mode or 'sorted', vocabulary)
+    article['content'] = txt
+    article['scrub_ruleset'] = scrubber.fingerprint
+    return 'rescrubbed'
+
+
+def _init_worker(scrubber, bagify, output, sink, sink_options):
+    _worker.update(scrubber=scrubber, bagify=bagify, output=output,
+                   sink=sink, sink_options=sink_options)
+
+
+def rescrub_zip(zip_path):
+    """Re-scrub the .json articles of one zip, either rewriting the zip or
+    writing to the configured sink. Returns (zip_path, counts).
+    """
+    counts = {'articles': 0, 'rescrubbed': 0, 'current': 0, 'nosource': 0, 'novocabulary': 0,
+              'errors': 0}
+    scrubber = _worker['scrubber']
+    try:
+        with zipfile.ZipFile(zip_path) as source:
+            names = set(source.namelist())
+            updated = {}
+            for name in sorted(names):
+                if not name.endswith('.json'):
+                    continue
+                counts['articles'] += 1
+                try:
+                    with stage('read'):
+                        article = json.loads(source.read(name).decode('utf-8'))
+                except ValueError:
+                    counts['errors'] += 1
+                    continue
+                xml_name = name[:-len('.json')] + '.xml'
+                with stage('read'):
+                    xml = source.read(xml_name).decode('utf-8') if xml_name in names else ''
+                with stage('scrub'):
+                    status = rescrub_article(article, xml, scrubber, _worker['bagify'])
+                counts[status] += 1
+                if status == 'rescrubbed' or _worker['output']:
+                    updated[name] = (article, xml)
+            with stage('write'):
+                if _worker['output']:
+                    slug = os.path.splitext(os.path.basename(zip_path))[0]
+                    with open_sink(_worker['sink'], _worker['output'], slug,
+                                   **_worker['sink_options']) as sink_out:
+                        for name, (article, xml) in sorted(updated.items()):
+                            sink_out.write(name[:-len('.json')], article, xml)
+                elif counts['rescrubbed']:
+                    _rewrite_zip(source, zip_path, updated)
+    except (OSError, zipfile.BadZipFile):
+        counts['errors'] += 1
+    return zip_path, counts
+
+
+def _rewrite_zip(source, zip_path, updated):
+    """Copy source to a temporary zip with updated articles, then replace it."""
+    tmp_path = zip_path + '.rescrub'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+        for info in source.infolist():
+            if info.filename in updated:
+                zip_out.writestr(info, json.dumps(updated[info.filename][0], indent=2))
+            else:
+                zip_out.writestr(info, source.read(info))
+    os.replace(tmp_path, zip_path)
+
+
+def rescrub_zips(filespath, output='', sink='zip', sink_options=None,
+                 bagify=False, processes=None, profile=None):
+    """Re-scrub every zip under filespath with a process pool. With
+    profile, a dict of profiling.start() options, the workers are profiled.
+    """
+    zip_paths = [os.path.join(dirname, filename)
+                 for (dirname, _dirs, files) in os.walk(filespath)
+                 for filename in sorted(files) if filename.endswith('.zip')]
+    if output:
+        os.makedirs(output, exist_ok=True)
+    totals = {}
+    initializer, initargs = profiling.worker_initializer(
+        profile, _init_worker, (get_scrubber(), bagify, output, sink, sink_options or {}))
+    pool = multiprocessing.Pool(processes, initializer=initializer, initargs=initargs)
+    try:
+        for zip_path, counts in pool.imap_unordered(rescrub_zip, zip_paths):
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+            if counts['errors']:
+                print(' ! errors in', zip_path)
+            if counts['novocabulary']:
+                print(' ! %d ids-bagged articles not re-scrubbed in %s'
+                      % (counts['novocabulary'], zip_path))
+    finally:
+        pool.close()
+        pool.join()
+    if profile:
+        print(profiling.merge_workers(**profile))
+    totals['zips'] = len(zip_paths)
+    return totals
+
+
+def _scrub_batch(batch):
+    scrubber = _worker['scrubber']
+    with stage('scrub'):
+        return [(doc_id, scrubber(txt)) for doc_id, txt in batch]
+
+
+def rescrub_mongo(host='mongo', port=27017, db='we1s', collection='Corpus',
+                  batch_size=500, processes=None, profile=None):
+    """Re-scrub the 'content-unscrubbed' text of stale Mongo documents.
+    With profile, the workers are profiled as for rescrub_zips.
+    """
+    from pymongo import MongoClient, UpdateOne
+
+    scrubber = get_scrubber()
+    client = MongoClient(host, port)
+    db_collection = client[db][collection]
+    stale = {'scrub_ruleset': {'$ne': scrubber.fingerprint}}
+    # Cursor.count(): count_documents() needs pymongo 3.7, requirements.txt pins 3.3
+    totals = {'nosource': db_collection.find(
+        dict(stale, **{'content-unscrubbed': {'$exists': False}})).count(), 'rescrubbed': 0}
+
+    def batches():
+        batch = []
+        cursor = db_collection.find(dict(stale, **{'content-unscrubbed': {'$exists': True}}),
+                                    projection={'content-unscrubbed': 1})
+        for doc in cursor:
+            batch.append((doc['_id'], doc['content-unscrubbed']))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    initializer, initargs = profiling.worker_initializer(
+        profile, _init_worker, (scrubber, False, '', None, {}))
+    pool = multiprocessing.Pool(processes, initializer=initializer, initargs=initargs)
+    try:
+        for results in pool.imap(_scrub_batch, batches()):
+            db_collection.bulk_write(
+                [UpdateOne({'_id': doc_id},
+                           {'$set': {'content': txt, 'scrub_ruleset': scrubber.fingerprint}})
+                 for doc_id, txt in results], ordered=False)
+            totals['rescrubbed'] += len(results)
+    finally:
+        pool.close()
+        pool.join()
+        client.close()
+    if profile:
+        print(profiling.merge_workers(**profile))
+    return totals
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('dir', nargs='?', default='', help='directory tree of output zips')
+    PARSER.add_argument('-o', '--output', default='',
+                        help='write to this directory instead of rewriting zips in place')
+    PARSER.add_argument('--sink', choices=SINKS, default='zip', help='output format with -o')
+    PARSER.add_argument('-b', '--bagify', action='store_true',
+                        help='bagify content rebuilt from raw xml')
+    PARSER.add_argument('-j', '--processes', type=int, help='worker processes, default: cpu count')
+    PARSER.add_argument('--mongo', help='re-scrub a Mongo collection on this host instead')
+    PARSER.add_argument('--port', type=int, default=27017)
+    PARSER.add_argument('--db', default='we1s')
+    PARSER.add_argument('--collection', default='Corpus')
+    profiling.add_arguments(PARSER)
+    ARGS = PARSER.parse_args()
+    START = time.time()
+    if ARGS.mongo:
+        TOTALS = rescrub_mongo(ARGS.mongo, ARGS.port, ARGS.db, ARGS.collection,
+                               processes=ARGS.processes, profile=profiling.from_args(ARGS))
+    else:
+        TOTALS = rescrub_zips(os.path.abspath(ARGS.dir), ARGS.output, ARGS.sink,
+                              bagify=ARGS.bagify, processes=ARGS.processes,
+                              profile=profiling.from_args(ARGS))
+    print(TOTALS)
+    print('%.1fs' % (time.time() - START))
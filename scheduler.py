@@ -0,0 +1,149 @@
+"""Concurrent query-row scheduling for WE1S (WhatEvery1Says)
+
+search_querylist runs its searches (lists of (query_idx, qrow) pairs, see
+planner.py) through a Scheduler: up to `jobs` searches run at a time on
+worker threads, with at most `per_source` running searches per source,
+so that no single source is hit by every worker at once. Searches start
+in the order chosen by order_searches:
+
+    file      query file order
+    priority  highest value of an optional 'priority' column first
+    span      longest date range (times number of rows) first, so the
+              biggest searches do not start last and leave workers idle
+
+Output names only depend on query_idx, so they are the same in any order.
+State shared by the searches is saved by an `after` callback, which the
+scheduler calls on the thread that started it as searches finish, so
+saves never run concurrently. The scheduler keeps counts of rows pending,
+running, done and failed, logged as searches finish and available from
+status().
+"""
+
+import collections
+import datetime
+import logging
+import threading
+
+ORDERS = ('file', 'priority', 'span')
+
+
+def search_sources(search):
+    """The source ids of the rows of a search."""
+    return set(str(qrow['source_id']) for _, qrow in search)
+
+
+def span_days(qrow):
+    """Days covered by a query row's date range."""
+    begin = datetime.datetime.strptime(qrow['begin_date'], '%Y-%m-%d')
+    end = datetime.datetime.strptime(qrow['end_date'], '%Y-%m-%d')
+    return (end - begin).days + 1
+
+
+def priority(qrow):
+    """A query row's 'priority' column as a number, 0 if missing."""
+    try:
+        return float(qrow.get('priority') or 0)
+    except ValueError:
+        return 0
+
+
+def order_searches(searches, order='file'):
+    """searches sorted by one of ORDERS; ties keep query file order."""
+    if order == 'priority':
+        key = lambda search: (-max(priority(qrow) for _, qrow in search), search[0][0])
+    elif order == 'span':
+        key = lambda search: (-sum(span_days(qrow) for _, qrow in search), search[0][0])
+    elif order == 'file':
+        key = lambda search: search[0][0]
+    else:
+        raise ValueError('unknown order: %s' % order)
+    return sorted(searches, key=key)
+
+
+class Scheduler:
+    """Runs searches on worker threads under a global and a per-source
+    concurrency limit.
+    """
+
+    def __init__(self, jobs=1, per_source=1):
+        self.jobs = max(jobs, 1)
+        self.per_source = max(per_source, 1)
+        self.counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        self.failed = []
+        self._finished = 0
+        self._active = 0
+        self._sources = collections.Counter()
+        self._cond = threading.Condition()
+
+    def status(self):
+        """Rows pending, running, done and failed."""
+        with self._cond:
+            return dict(self.counts)
+
+    def run(self, searches, task, after=None):
+        """Call task(search) for every search, in order as far as the limits
+        allow, and wait for all of them. A search whose task raises is
+        counted as failed and its query_idx values are added to failed.
+        after(), if given, is called on this thread once searches have
+        finished since its last call, and after the last one. Returns
+        status().
+        """
+        pending = list(searches)
+        with self._cond:
+            finished = self._finished
+            self.counts['pending'] += sum(len(search) for search in pending)
+            while pending or self._active:
+                if after is not None and self._finished > finished:
+                    finished = self._finished
+                    self._cond.release()
+                    try:
+                        after()
+                    finally:
+                        self._cond.acquire()
+                    continue
+                search = self._next(pending)
+                if search is None:
+                    self._cond.wait()
+                    continue
+                pending.remove(search)
+                self._start(search)
+                thread = threading.Thread(target=self._run_one, args=(search, task))
+                thread.daemon = True
+                thread.start()
+            if after is not None and self._finished > finished:
+                after()
+        return self.status()
+
+    def _next(self, pending):
+        if self._active >= self.jobs:
+            return None
+        for search in pending:
+            if all(self._sources[source] < self.per_source for source in search_sources(search)):
+                return search
+        return None
+
+    def _start(self, search):
+        self._active += 1
+        self._sources.update(search_sources(search))
+        self.counts['pending'] -= len(search)
+        self.counts['running'] += len(search)
+
+    def _run_one(self, search, task):
+        try:
+            task(search)
+            outcome = 'done'
+        except Exception:  # one failed search must not stop the others
+            logging.exception('search failed for query rows %s',
+                              ', '.join(str(query_idx) for query_idx, _ in search))
+            outcome = 'failed'
+        with self._cond:
+            self._active -= 1
+            self._finished += 1
+            self._sources.subtract(search_sources(search))
+            self.counts['running'] -= len(search)
+            self.counts[outcome] += len(search)
+            if outcome == 'failed':
+                self.failed.extend(query_idx for query_idx, _ in search)
+            logging.info('query rows: %(pending)d pending, %(running)d running, '
+                         '%(done)d done, %(failed)d failed', self.counts)
+            self._cond.notify_all()
@@ -0,0 +1,210 @@
+"""
+batch.py
+Scrub a directory tree, or the members of a set of zips, in parallel.
+
+    python -m scrub.batch ../../caches/text_files -o ../../caches/text_files_clean
+    python -m scrub.batch cache1.zip cache2.zip -o scrubbed -j 8
+    python -m scrub.batch cache1.zip -o scrubbed --profile profile
+
+Files are streamed through a process pool that shares one compiled
+Scrubber. Output mirrors the input tree; zip members are written under a
+folder named after their zip. An output file is only rewritten if it is
+older than its input or was scrubbed with another ruleset: the output
+folder keeps the ruleset fingerprint of each file in .scrub-rulesets.json.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+
+if __package__ in (None, ''):  # run as a script: import scrub as a package
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+import profiling
+from profiling import stage
+from scrub.scrub import Scrubber, get_scrubber
+
+RULESETS_FILE = '.scrub-rulesets.json'
+# one fingerprint for a whole output folder, written by earlier versions
+RULESET_FILE = '.scrub-ruleset'
+
+_worker_scrubber = None
+_worker_zip = None
+
+
+def iter_tasks(paths, output_path, suffixes=('.txt',)):
+    """Yield (source, member, output file, input mtime, input size) for each
+    file with one of suffixes under the directories and zips in paths.
+    member is None for plain files.
+    """
+    for path in paths:
+        if path.endswith('.zip'):
+            mtime = os.path.getmtime(path)
+            base = os.path.join(output_path, os.path.splitext(os.path.basename(path))[0])
+            with zipfile.ZipFile(path) as source:
+                for info in source.infolist():
+                    if info.filename.endswith(suffixes):
+                        yield (path, info.filename, os.path.join(base, info.filename),
+                               mtime, info.file_size)
+            continue
+        for (dirname, _dirs, files) in os.walk(path):
+            for filename in sorted(files):
+                if filename.endswith(suffixes):
+                    file_path = os.path.join(dirname, filename)
+                    stat = os.stat(file_path)
+                    yield (file_path, None,
+                           os.path.join(output_path, os.path.relpath(file_path, path)),
+                           stat.st_mtime, stat.st_size)
+
+
+def is_current(output_file, input_mtime):
+    """True if output_file exists and is newer than its input."""
+    try:
+        return os.path.getmtime(output_file) >= input_mtime
+    except OSError:
+        return False
+
+
+def read_ruleset(output_path):
+    """The ruleset fingerprint of a whole output_path from a .scrub-ruleset
+    file of an earlier version, or None.
+    """
+    try:
+        with open(os.path.join(output_path, RULESET_FILE)) as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+
+def read_rulesets(output_path):
+    """{output file path relative to output_path: fingerprint of the
+    ruleset it was scrubbed with}.
+    """
+    try:
+        with open(os.path.join(output_path, RULESETS_FILE)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_rulesets(output_path, rulesets):
+    """Atomically rewrite the ruleset fingerprints of output_path."""
+    path = os.path.join(output_path, RULESETS_FILE)
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(rulesets, fh, indent=0, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _init_worker(scrubber):
+    global _worker_scrubber
+    _worker_scrubber = scrubber
+
+
+def _read(source, member):
+    global _worker_zip
+    if member is None:
+        with open(source, 'rb') as fh:
+            return fh.read()
+    if _worker_zip is None or _worker_zip.filename != source:
+        if _worker_zip is not None:
+            _worker_zip.close()
+        _worker_zip = zipfile.ZipFile(source)
+    return _worker_zip.read(member)
+
+
+def scrub_task(task):
+    """Scrub one file or zip member; returns (task, bytes read, error)."""
+    source, member, output_file = task[:3]
+    try:
+        with stage('read'):
+            data = _read(source, member)
+        with stage('scrub'):
+            output = _worker_scrubber(data.decode('utf-8'))
+        with stage('write'):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file, 'w', encoding='utf-8') as fh:
+                fh.write(output)
+    except (OSError, UnicodeDecodeError, zipfile.BadZipFile) as error:
+        return task, 0, '%s: %s' % (type(error).__name__, error)
+    return task, len(data), None
+
+
+def scrub_batch(paths, output_path, processes=None, suffixes=('.txt',),
+                scrubber=None, force=False, report_every=1000, profile=None):
+    """Scrub every matching file under paths into output_path with a
+    process pool. Returns a dict of counts, bytes and rates. With profile,
+    a dict of profiling.start() options, the workers are profiled.
+    """
+    scrubber = scrubber or get_scrubber()
+    os.makedirs(output_path, exist_ok=True)
+    rulesets = read_rulesets(output_path)
+    folder_ruleset = read_ruleset(output_path)
+    stats = {'files': 0, 'skipped': 0, 'errors': 0, 'bytes': 0}
+
+    def pending():
+        for task in iter_tasks(paths, output_path, suffixes):
+            relpath = os.path.relpath(task[2], output_path)
+            ruleset = rulesets.get(relpath, folder_ruleset)
+            if not force and ruleset == scrubber.fingerprint and is_current(task[2], task[3]):
+                rulesets[relpath] = ruleset
+                stats['skipped'] += 1
+                continue
+            yield task
+
+    start = time.time()
+    initializer, initargs = profiling.worker_initializer(profile, _init_worker, (scrubber,))
+    pool = multiprocessing.Pool(processes, initializer=initializer, initargs=initargs)
+    try:
+        for task, size, error in pool.imap_unordered(scrub_task, pending(), chunksize=16):
+            relpath = os.path.relpath(task[2], output_path)
+            if error:
+                rulesets.pop(relpath, None)
+                stats['errors'] += 1
+                print(' ! ' + task[0] + (':' + task[1] if task[1] else '') + ' ' + error)
+                continue
+            rulesets[relpath] = scrubber.fingerprint
+            stats['files'] += 1
+            stats['bytes'] += size
+            if report_every and stats['files'] % report_every == 0:
+                print(format_stats(stats, time.time() - start))
+    finally:
+        pool.close()
+        pool.join()
+        write_rulesets(output_path, rulesets)
+    if profile:
+        print(profiling.merge_workers(**profile))
+    elapsed = time.time() - start
+    stats['seconds'] = elapsed
+    stats['files_per_sec'] = stats['files'] / elapsed if elapsed else 0.0
+    stats['mb_per_sec'] = stats['bytes'] / 1e6 / elapsed if elapsed else 0.0
+    return stats
+
+
+def format_stats(stats, elapsed):
+    """One-line progress report."""
+    seconds = elapsed or float('inf')
+    return ('%d files, %d skipped, %d errors, %.1f MB in %.1fs: %.1f files/sec, %.2f MB/sec'
+            % (stats['files'], stats['skipped'], stats['errors'], stats['bytes'] / 1e6,
+               elapsed, stats['files'] / seconds, stats['bytes'] / 1e6 / seconds))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('paths', nargs='+', help='directories and/or zip files to scrub')
+    PARSER.add_argument('-o', '--output', required=True, help='output directory')
+    PARSER.add_argument('-j', '--processes', type=int, help='worker processes, default: cpu count')
+    PARSER.add_argument('-s', '--suffix', action='append',
+                        help='file suffix to scrub, may repeat; default .txt')
+    PARSER.add_argument('-f', '--force', action='store_true', help='rescrub files that are up to date')
+    PARSER.add_argument('--no-fuse', action='store_true', help='apply literal rules one by one')
+    profiling.add_arguments(PARSER)
+    ARGS = PARSER.parse_args()
+    STATS = scrub_batch(ARGS.paths, ARGS.output, processes=ARGS.processes,
+                        suffixes=tuple(ARGS.suffix or ['.txt']),
+                        scrubber=Scrubber(fuse_literals=False) if ARGS.no_fuse else None,
+                        force=ARGS.force, profile=profiling.from_args(ARGS))
+    print(format_stats(STATS, STATS['seconds']))
@@ -0,0 +1,186 @@
+"""
+literal.py
+Single-pass replacement for runs of literal scrub rules.
+
+Most find/replace values in config.py are plain phrases ("Affordable Care
+Act" -> "Affordable_Care_Act"). Applied one re.sub at a time, every rule is
+another full pass over the text. compile_rules() collects consecutive
+literal rules into one pass: the phrases are compiled into a single
+prefix-trie pattern (one branch per distinct leading character, so the
+per-character matching cost does not grow with the number of phrases) and
+replacements are looked up by the matched phrase. Matching is leftmost-
+longest.
+
+Rules in a combined pass are effectively applied at the same time. That
+equals applying them in config.py order only when they cannot interact,
+so rules that conflict with an earlier rule (their phrases overlap, or one
+rule's replacement could form the other's phrase) are moved to a later
+pass than the rule they conflict with. Phrases that can only overlap
+inside a single word ("labor" / "organisations" sharing "or") are not
+treated as conflicting, so the output is that of the sequential rules
+except in text where two such phrases run together into one word. Conflicts where one
+phrase contains the other, which usually mean a rule is shadowed, are
+logged at DEBUG level and collected in the conflicts list passed to
+compile_rules(); Scrubber logs a single warning counting them.
+"""
+
+import logging
+import re
+
+# Plain characters and escaped punctuation
+LITERAL_PART = r'(?:\\[^0-9A-Za-z]|[^\\.^$*+?{}\[\]|()])'
+# A find pattern of literal parts, optionally with literal groups: "art(\.)"
+LITERAL = re.compile(r'(?:%s|\(%s+\))+\Z' % (LITERAL_PART, LITERAL_PART))
+GROUP = re.compile(r'\(((?:%s)+)\)' % LITERAL_PART)
+# A replacement that is plain text apart from \1-style group references
+REPLACE_REF = re.compile(r'\\([1-9])')
+
+
+def unescape(pattern):
+    """The text matched by a literal pattern part."""
+    return re.sub(r'\\(.)', r'\1', pattern)
+
+
+def literal_rule(find, replace):
+    """(text, replacement) if the rule always replaces one fixed string
+    with another, else None. Groups in find may only hold literal text,
+    and replace may refer to them as \\1 to \\9.
+    """
+    if not LITERAL.match(find):
+        return None
+    groups = [unescape(group) for group in GROUP.findall(find)]
+    parts = REPLACE_REF.split(replace)
+    if any('\\' in part for part in parts[::2]):
+        return None
+    refs = [int(ref) for ref in parts[1::2]]
+    if any(ref > len(groups) for ref in refs):
+        return None
+    for i, ref in enumerate(refs):
+        parts[2 * i + 1] = groups[ref - 1]
+    return unescape(GROUP.sub(r'\1', find)), ''.join(parts)
+
+
+def overlaps(first, second):
+    """True if a match of one string can share characters with the other:
+    either contains the other, or a suffix of one is a prefix of the other
+    and the shared part starts or ends on a word boundary.
+    """
+    if not first or not second:
+        return True
+    if first in second or second in first:
+        return True
+    for size in range(1, min(len(first), len(second))):
+        if _joins(first, second, size) or _joins(second, first, size):
+            return True
+    return False
+
+
+def _joins(head, tail, size):
+    shared = tail[:size]
+    if not head.endswith(shared):
+        return False
+    starts_word = not head[-size - 1].isalnum() or not shared[0].isalnum()
+    ends_word = not tail[size].isalnum() or not shared[-1].isalnum()
+    return starts_word or ends_word
+
+
+def trie_pattern(phrases):
+    """A regex matching any of phrases, leftmost-longest, built from a trie."""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    branches = [re.escape(char) + _node_pattern(child)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # a phrase ends here: the greedy optional tries longer phrases first
+    if '' in node:
+        return '(?:' + body + ')?'
+    return body
+
+
+class Lookup(dict):
+    """re.sub replacement function: the replacement for the matched phrase."""
+
+    def __call__(self, match):
+        return self[match.group()]
+
+
+class LiteralRun:
+    """Consecutive literal rules being grouped into combined passes.
+
+    Each rule goes into the pass after the latest pass holding a rule it
+    conflicts with, so conflicting rules keep their order and rules that
+    commute share a pass.
+    """
+
+    def __init__(self, label='', conflicts=None):
+        self.label = label
+        self.conflicts = [] if conflicts is None else conflicts
+        self.rules = []
+        self.layers = []
+
+    def add(self, index, find, text, replace):
+        """Add rule number index, placing it after every earlier rule it
+        conflicts with.
+        """
+        layer = 0
+        for (_, earlier_find, earlier_text, earlier_replace), earlier_layer in zip(self.rules, self.layers):
+            if not (overlaps(earlier_text, text) or overlaps(earlier_replace, text)
+                    or overlaps(replace, earlier_text)):
+                continue
+            layer = max(layer, earlier_layer + 1)
+            if find != earlier_find and (earlier_text in text or text in earlier_text
+                                         or text in earlier_replace):
+                logging.debug('scrub%s: rule %r conflicts with earlier rule %r',
+                              self.label, find, earlier_find)
+                if (find, earlier_find) not in self.conflicts:
+                    self.conflicts.append((find, earlier_find))
+        self.rules.append((index, find, text, replace))
+        self.layers.append(layer)
+
+    def passes(self):
+        """(pattern, replace, rule indexes) for each layer."""
+        result = []
+        for layer in range(max(self.layers) + 1 if self.layers else 0):
+            rules = [rule for rule, rule_layer in zip(self.rules, self.layers) if rule_layer == layer]
+            indexes = [index for index, _, _, _ in rules]
+            if len(rules) == 1:
+                _, _, text, replace = rules[0]
+                result.append((re.compile(re.escape(text)), replace.replace('\\', r'\\'), indexes))
+            else:
+                lookup = Lookup((text, replace) for _, _, text, replace in rules)
+                result.append((re.compile(trie_pattern(lookup)), lookup, indexes))
+        return result
+
+
+def compile_rules(rules, fuse_literals=True, label='', conflicts=None):
+    """Compile (find, replace) rules into (pattern, replace, rule indexes)
+    triples: pattern.sub(replace, text) applies the rules numbered in rule
+    indexes. Runs of literal rules are combined when fuse_literals is set.
+    (find, earlier find) pairs of shadowing rules are appended to conflicts.
+    """
+    passes = []
+    run = None
+    for index, (find, replace) in enumerate(rules):
+        literal = literal_rule(find, replace) if fuse_literals else None
+        if literal is None:
+            if run:
+                passes.extend(run.passes())
+                run = None
+            passes.append((re.compile(find), replace, [index]))
+            continue
+        if run is None:
+            run = LiteralRun(label, conflicts)
+        run.add(index, find, *literal)
+    if run:
+        passes.extend(run.passes())
+    return passes
@@ -0,0 +1,78 @@
+"""
+normalize.py
+Text normalization for the collector and scrub.py.
+
+clean_text() gives the same output as search.string_cleaner (unidecode,
+printable characters only, whitespace collapsed) and fix_text() the same
+output as scrub.py's ftfy.fix_text(normalization='NFKC') followed by
+remove_accents(). Both work with translation tables instead of per
+character Python calls and return early for text that is already plain
+ASCII, which is nearly all text once it has been through clean_text().
+ftfy and unidecode are only imported once text needs them.
+"""
+
+import re
+import string
+import unicodedata as ud
+
+PRINTABLE = frozenset(string.printable)
+
+# ASCII characters that string_cleaner's printable filter drops
+DELETE_UNPRINTABLE = {c: None for c in range(128) if chr(c) not in PRINTABLE}
+
+# Anything ftfy or accent removal could change in an ASCII string:
+# HTML entities, and control characters other than tab and newline.
+NEEDS_FIXING = re.compile(r'[^\t\n\x20-\x7e]|&#?\w{0,24};')
+
+try:
+    isascii = str.isascii
+except AttributeError:  # Python < 3.7
+    def isascii(text):
+        """True if text has only ASCII characters."""
+        try:
+            text.encode('ascii')
+        except UnicodeEncodeError:
+            return False
+        return True
+
+
+class _CombiningTable(dict):
+    """str.translate table deleting combining characters, filled on demand."""
+
+    def __missing__(self, codepoint):
+        value = None if ud.combining(chr(codepoint)) else codepoint
+        self[codepoint] = value
+        return value
+
+
+STRIP_COMBINING = _CombiningTable()
+
+
+def clean_text(unistr):
+    """Returns string in unaccented form, printable characters only,
+    with sequential whitespace collapsed to single spaces.
+    """
+    if not isascii(unistr):
+        import unidecode
+        unistr = unidecode.unidecode(unistr)
+        if not isascii(unistr):
+            unistr = ''.join(c for c in unistr if c in PRINTABLE)
+    return ' '.join(unistr.translate(DELETE_UNPRINTABLE).split())
+
+
+def remove_accents(input_str):
+    """Decompose (NFKD) and drop combining characters."""
+    return ud.normalize('NFKD', input_str).translate(STRIP_COMBINING)
+
+
+def fix_text(text):
+    """ftfy.fix_text(text, normalization='NFKC'), then remove_accents,
+    skipping both for ASCII text neither could change.
+    """
+    if not NEEDS_FIXING.search(text):
+        return text
+    import ftfy
+    text = ftfy.fix_text(text, normalization='NFKC')
+    if isascii(text):
+        return text
+    return remove_accents(text)
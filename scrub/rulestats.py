@@ -0,0 +1,155 @@
+"""
+rulestats.py
+Per-rule profiling of the scrub ruleset over a corpus.
+
+    python -m scrub.rulestats ../../caches/text_files
+    python -m scrub.rulestats corpus.zip -s .json --sort matches --csv rules.csv
+
+Every document is scrubbed as scrub() would, recording for each rule the
+time spent, the number of matches and the number of documents it changed.
+Rules are profiled one by one; with --fused, runs of literal rules are
+profiled as the combined passes scrub() actually runs. The final ftfy and
+accent removal step is reported as "(normalize)". Rules with no matches
+over a large corpus are candidates for retirement, and the most expensive
+ones for rewriting or reordering.
+
+JSON articles are profiled on their 'content-unscrubbed' text, or 'content'
+if they were stored unscrubbed.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import zipfile
+
+if __package__ in (None, ''):  # run as a script: import scrub as a package
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from scrub.batch import iter_tasks
+from scrub.normalize import fix_text
+from scrub.scrub import Scrubber
+
+COLUMNS = ['pass', 'iteration', 'find', 'replace', 'seconds', 'matches', 'documents', 'us_per_doc']
+SORT_KEYS = {'seconds': lambda row: -row['seconds'],
+             'matches': lambda row: -row['matches'],
+             'documents': lambda row: -row['documents'],
+             'order': lambda row: row['pass']}
+
+
+class RuleProfile:
+    """Accumulates time, match and document counts per scrub pass."""
+
+    def __init__(self, scrubber=None):
+        self.scrubber = scrubber or Scrubber(fuse_literals=False)
+        self.stats = [[0.0, 0, 0] for _ in self.scrubber.passes]
+        self.normalize = [0.0, 0, 0]
+        self.documents = 0
+
+    def scrub(self, text):
+        """Scrub text as the Scrubber would, recording the cost of each pass."""
+        timer = time.perf_counter
+        for (pattern, replace), stat in zip(self.scrubber.passes, self.stats):
+            start = timer()
+            text, count = pattern.subn(replace, text)
+            stat[0] += timer() - start
+            if count:
+                stat[1] += count
+                stat[2] += 1
+        start = timer()
+        fixed = fix_text(text)
+        self.normalize[0] += timer() - start
+        if fixed != text:
+            self.normalize[1] += 1
+            self.normalize[2] += 1
+        self.documents += 1
+        return fixed
+
+    def rows(self, sort='seconds'):
+        """One dict per pass with COLUMNS keys, sorted by a SORT_KEYS key."""
+        rows = []
+        documents = self.documents or 1
+        for number, (rules, stat) in enumerate(zip(self.scrubber.pass_rules, self.stats)):
+            rows.append({'pass': number + 1,
+                         'iteration': rules[0][0],
+                         'find': ' | '.join(rule[1] for rule in rules),
+                         'replace': ' | '.join(rule[2] for rule in rules),
+                         'seconds': stat[0], 'matches': stat[1], 'documents': stat[2],
+                         'us_per_doc': stat[0] * 1e6 / documents})
+        rows.append({'pass': len(rows) + 1, 'iteration': '', 'find': '(normalize)',
+                     'replace': '', 'seconds': self.normalize[0],
+                     'matches': self.normalize[1], 'documents': self.normalize[2],
+                     'us_per_doc': self.normalize[0] * 1e6 / documents})
+        return sorted(rows, key=SORT_KEYS[sort])
+
+    def report(self, sort='seconds', limit=None):
+        """The sorted rows as a text table."""
+        lines = ['%d documents, %.3fs total' % (self.documents,
+                                                 sum(stat[0] for stat in self.stats) + self.normalize[0]),
+                 '%5s %4s %10s %10s %9s %10s  %s' % ('pass', 'iter', 'seconds', 'matches',
+                                                   'documents', 'us/doc', 'find')]
+        for row in self.rows(sort)[:limit]:
+            lines.append('%5s %4s %10.4f %10d %9d %10.2f  %s'
+                         % (row['pass'], row['iteration'], row['seconds'], row['matches'],
+                            row['documents'], row['us_per_doc'], row['find'][:60]))
+        return '\n'.join(lines)
+
+    def write_csv(self, path, sort='seconds'):
+        """Save the sorted rows as CSV."""
+        with open(path, 'w', newline='') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.rows(sort))
+
+
+def iter_texts(paths, suffixes=('.txt',)):
+    """Yield the text of every matching file or zip member under paths."""
+    current = None
+    for source, member, _, _, _ in iter_tasks(paths, '', suffixes):
+        if member is None:
+            with open(source, 'rb') as fh:
+                data = fh.read()
+        else:
+            if current is None or current.filename != source:
+                if current is not None:
+                    current.close()
+                current = zipfile.ZipFile(source)
+            data = current.read(member)
+        text = data.decode('utf-8')
+        if (member or source).endswith('.json'):
+            article = json.loads(text)
+            text = article.get('content-unscrubbed', article.get('content', ''))
+            if not isinstance(text, str):
+                continue
+        yield text
+    if current is not None:
+        current.close()
+
+
+def profile_corpus(paths, suffixes=('.txt',), fused=False, limit=None):
+    """Profile the config.py ruleset over up to limit documents under paths."""
+    profile = RuleProfile(Scrubber(fuse_literals=fused))
+    for count, text in enumerate(iter_texts(paths, suffixes)):
+        if limit and count >= limit:
+            break
+        profile.scrub(text)
+    return profile
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    PARSER.add_argument('paths', nargs='+', help='directories and/or zip files')
+    PARSER.add_argument('-s', '--suffix', action='append',
+                        help='file suffix to read, may repeat; default .txt')
+    PARSER.add_argument('-n', '--limit', type=int, help='maximum documents to profile')
+    PARSER.add_argument('--sort', choices=sorted(SORT_KEYS), default='seconds')
+    PARSER.add_argument('--top', type=int, help='only print the first TOP rows')
+    PARSER.add_argument('--fused', action='store_true', help='profile combined literal passes')
+    PARSER.add_argument('--csv', help='also save all rows to this CSV file')
+    ARGS = PARSER.parse_args()
+    PROFILE = profile_corpus(ARGS.paths, tuple(ARGS.suffix or ['.txt']), ARGS.fused, ARGS.limit)
+    print(PROFILE.report(ARGS.sort, ARGS.top))
+    if ARGS.csv:
+        PROFILE.write_csv(ARGS.csv, ARGS.sort)
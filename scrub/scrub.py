@@ -5,6 +5,8 @@ v1.1 2015-11-21 active property and stop word handling added
 v1.2 2016-07-14 Unicode error handling added
 v1.3 2016-07-19 Added functions to remove accents and replace curly quotes. There are two 
                 options for curly quotes. Using ftfy will also normalise line breaks.
+v1.4 2026-10-19 Compiled Scrubber object with single-pass literal rules and stop words,
+                ruleset fingerprints, parallel batch scrubbing (batch.py).
 scott.kleinman@csun.edu
 
 1.  Requires configuration in config.py file in same folder as scrub.py
@@ -14,15 +16,20 @@ scott.kleinman@csun.edu
 __author__ = "Scott Kleinman"
 __copyright__ = "copyright 2015-, The WE1S Project"
 __license__ = "GPL"
-__version__ = "1.3"
+__version__ = "1.4"
 __email__ = "scott.kleinman@csun.edu"
 
-import os, re, codecs, ftfy
-import unicodedata as ud
+import os, re, codecs, hashlib, json, logging
 try:
     from scrub.config import *
 except:
     from config import *
+try:
+    from scrub.literal import compile_rules
+    from scrub.normalize import fix_text, remove_accents
+except ImportError:
+    from literal import compile_rules
+    from normalize import fix_text, remove_accents
 
 iterations = len(options)
 
@@ -32,61 +39,105 @@ def readFiles(input_file_path, output_file_path):
     encoding = 'utf-8'
     error_handling = 'strict'
     fileList = os.listdir(input_file_path)
+    scrubber = get_scrubber()
     # Open individual files
     for file in fileList:
         file_path = os.path.join(input_file_path, file)
         with codecs.open(file_path,'r',encoding=encoding,errors=error_handling) as f:
             text = f.read()
             # Call the scrub function
-            output = scrub(text)
+            output = scrubber(text)
             # Write the scrubbed text to a new file
             output_path = os.path.join(output_file_path, file)
             with codecs.open(output_path,'w',encoding='utf8',errors=error_handling) as fh:
                 fh.write(output)
             fh.close
 
-def remove_accents(input_str):
-    nfkd_form = ud.normalize('NFKD', input_str)
-    return u"".join([c for c in nfkd_form if not ud.combining(c)])
-
-def scrub(text):
-    # Cycle iterations
-    for i in range(0,iterations):
-            values = options[i]["values"]
+def read_stopwords(location):
+    """Return the list of stop words in a comma, space or line-separated file."""
+    with open(location, 'r') as fh:
+        stoplist = fh.read()
+    return [item for item in re.split(r"[\s,]+", stoplist) if item]
+
+def compile_stopwords(stoplist):
+    """One pattern matching any stop word as a whole word. Longer words are
+    tried first, so "and/or" is removed whole rather than leaving "/or".
+    """
+    alternation = "|".join(re.escape(item) for item in sorted(set(stoplist), key=len, reverse=True))
+    return re.compile(r"\b(?=\w)(?:" + alternation + r")\b(?!\w)")
+
+class Scrubber:
+    """A scrub ruleset compiled once and applied by calling the object.
+
+    Rules are read from the options list (config.py by default) without
+    modifying it. Inactive values are dropped, find patterns are compiled,
+    runs of plain-phrase rules are combined into single passes (see
+    literal.py; fuse_literals=False applies them one by one) and a stop
+    word iteration becomes a single alternation pattern. A Scrubber holds
+    no mutable state, so one instance can be shared between threads, and
+    it pickles for use in worker processes.
+
+    fingerprint is a hash of the active rules, stop words and scrub
+    version; output scrubbed under a different fingerprint is stale.
+    pass_rules lists, for each pass, the (iteration, find, replace) rules
+    it applies.
+    """
+
+    def __init__(self, options=options, stopwords_location=stopwords_location,
+                 fuse_literals=True):
+        passes = []
+        pass_rules = []
+        ruleset = []
+        conflicts = []
+        self.stoplist = []
+        for i, iteration in enumerate(options):
+            values = iteration["values"]
             # If the iteration is for stop words...
             if values == "stopwords":
-                fh = open(stopwords_location, 'r')
-                stoplist = fh.read()
-                fh.close()
-                stoplist = re.sub("\s+", ",", stoplist)
-                stoplist = stoplist.split(",")
-                replace = ""
-                print(stoplist)
-                for item in stoplist:
-                    find = r"\b(?=\w)" + re.escape(item) + r"\b(?!\w)"
-                    text = re.sub(find, "", text)
-            # Otherwise...
+                self.stoplist = read_stopwords(stopwords_location)
+                if self.stoplist:
+                    passes.append((compile_stopwords(self.stoplist), ""))
+                    pass_rules.append([(i+1, "stopwords", "")])
+                ruleset.append(sorted(set(self.stoplist)))
+            # Otherwise skip inactive values and compile the rest
             else:
-                # Delete inactive values
-                for item in values:
-                    if "active" in item.keys() and item["active"] == False:
-                        values.remove(item)
-                num_values = len(values)
-                # Apply each value in iteration
-                for j in range(0, num_values):
-                    find = values[j]["find"]
-                    replace = values[j]["replace"]
-                    text = re.sub(find, replace, text)
-
-    # Remove left and right (curly) quotation marks
-    #text = text.replace(u"\u2018", "'").replace(u"\u2019", "'").replace(u"\u201c",'"').replace(u"\u201d", '"')
-    # ftfy may be more comprehensive than the above. It also normalises line breaks to "\n"
-    text = ftfy.fix_text(text, normalization='NFKC')
-
-    # Remove accents
-    text = remove_accents(text)
-
-    return text
+                rules = [(item["find"], item["replace"]) for item in values
+                         if item.get("active", True) != False]
+                ruleset.append(rules)
+                for pattern, replace, indexes in compile_rules(rules, fuse_literals,
+                                                               label=" iteration " + str(i+1),
+                                                               conflicts=conflicts):
+                    passes.append((pattern, replace))
+                    pass_rules.append([(i+1,) + rules[j] for j in indexes])
+        if conflicts:
+            logging.warning("scrub: %d literal rules contain or are contained in an earlier rule "
+                            "(a shadowed rule?); the conflicts are logged at DEBUG level",
+                            len(set(find for find, _ in conflicts)))
+        self.passes = tuple(passes)
+        self.pass_rules = tuple(pass_rules)
+        self.fingerprint = hashlib.sha1(json.dumps([__version__, ruleset]).encode('utf-8')).hexdigest()
+
+    def __call__(self, text):
+        for pattern, replace in self.passes:
+            text = pattern.sub(replace, text)
+        # Remove left and right (curly) quotation marks
+        #text = text.replace(u"\u2018", "'").replace(u"\u2019", "'").replace(u"\u201c",'"').replace(u"\u201d", '"')
+        # ftfy may be more comprehensive than the above. It also normalises line breaks to "\n"
+        # fix_text runs ftfy and then removes accents (see normalize.py)
+        return fix_text(text)
+
+_default_scrubber = None
+
+def get_scrubber():
+    """The Scrubber for config.py, compiled on first use."""
+    global _default_scrubber
+    if _default_scrubber is None:
+        _default_scrubber = Scrubber()
+    return _default_scrubber
+
+def scrub(text):
+    """Scrub text with the ruleset in config.py."""
+    return get_scrubber()(text)
 
 if __name__ == "__main__":
     # Initiate
@@ -97,15 +148,12 @@ if __name__ == "__main__":
     readFiles(input_file_path, output_file_path)
 
     # Generate Log String
-    out = "Number of iterations: " + str(iterations) + "\n\n"
+    out = "Number of iterations: " + str(iterations) + "\n"
+    out += "Ruleset: " + get_scrubber().fingerprint + "\n\n"
     for i, item in enumerate(options):
         values = options[i]["values"]
         if values == "stopwords":
-            fh = open(stopwords_location, 'r')
-            stoplist = fh.read()
-            fh.close()
-            stoplist = re.sub("\s+", ", ", stoplist)
-            out += "Stopwords Removed: " + stoplist + "\n"
+            out += "Stopwords Removed: " + ", ".join(get_scrubber().stoplist) + "\n"
         else:
             out += "Iteration: " + str(i+1) + "\n"
             out += "Find\tReplace\n"
@@ -3,21 +3,31 @@
 
 import csv
 import datetime
-import json
 import logging
 import os
 import pprint
 import re
-import string
-import zipfile
 
-from bs4 import BeautifulSoup
-import unidecode
-from wsk import WSK
+import progress
 
-import config.config as cfg
+from bow import VOCABULARY_FILE, Vocabulary, bag
+from dedup import DedupIndex, minhash
+from density import DensityHistory
+from dtm import DTMWriter
+from lazy import optional
+from manifest import Manifest
+from planner import (COMBINABILITY_FILE, MAX_KEYWORDS, MAX_SOURCES, FilterSet, combined_row,
+                     keyword_query, load_combinability, plan_keyword_searches, plan_searches,
+                     save_combinability, split_results, update_combinability)
+from profiling import stage
+from scheduler import Scheduler, order_searches
+from scrub.normalize import clean_text
+from sinks import open_sink
+from watermark import OVERLAP_DAYS, Watermarks, delta_rows
+from xmlstore import XML_DIR, XmlStore
+
+RUN_LOCK_FILE = '.search.lock'
 
-from scrub.scrub import scrub as scrubber
 
 def date_validate(date_text, format_string='%Y-%m-%d'):
     """Validate a date string as YYYY-MM-DD format"""
@@ -34,6 +44,8 @@ def get_authenticated_session():
     The session object stores the token internally as auth_token
     and uses it as needed.
     """
+    import config.config as cfg
+    from wsk import WSK
     # initialize a WSK session, specifying email as project identifier
     session = WSK(environment=cfg.LN_ENVIRONMENT, project_id=cfg.LN_PROJECT_ID)
     # authenticate with the web service
@@ -45,158 +57,367 @@ def get_authenticated_session():
 def string_cleaner(unistr):
     """Returns string in unaccented form, printable characters only,
     with sequential whitespace collapsed to single spaces.
+    See scrub/normalize.py.
     """
-    unaccented = unidecode.unidecode(unistr)
-    printonly = ''.join(filter(lambda x: x in string.printable, unaccented))
-    return ' '.join(printonly.split())
-
+    return clean_text(unistr)
 
-def search_query(session, query_idx, qrow, bagify=True, result_filter='',
-                 outpath='', zip_output=False, scrub=True):
-    """Uses a session and a query row (labeled with an arbitrary index number)
-    to retrieve an article collection and cache their word lists in JSON format.
-    The qrow format is a dict with keys:
 
-        'source_title'    (e.g. Chicago Daily Herald -- not used in search)
-        'source_id'       (e.g. 163823 -- the wsk source id)
-        'keyword_string'  (e.g. "liberal arts")
-        'begin_date'      (e.g. '2017-12-01')
-        'end_date'
+def query_slugs(qrow):
+    """The short (source and keyword) and full (plus source id and dates)
+    slugs used to name the output of a query row.
     """
     slug = ''.join(c for c in qrow['source_title'] if c.isalnum()).lower() + '_' + \
            ''.join(c for c in qrow['keyword_string'] if c.isalnum()).lower()
-    slug_full = qrow['source_id'] + '_' + slug + '_' + qrow['begin_date'] + '_' + qrow['end_date']
-    logging.info(slug)
-    query = session.search(query=qrow['keyword_string'],
-                           source_id=qrow['source_id'],
-                           start_date=qrow['begin_date'],
-                           end_date=qrow['end_date'],
+    slug_full = str(qrow['source_id']) + '_' + slug + '_' + qrow['begin_date'] + '_' + qrow['end_date']
+    return slug, slug_full
+
+
+def fetch_results(session, keyword_string, source_id, begin_date, end_date, match_counts=None):
+    """Run a search and return its result pages (lists of article dicts),
+    or None if it found nothing. source_id may be a list of combinable
+    source ids. If match_counts is a list, the total_matches reported for
+    each date window is appended to it.
+    """
+    query = session.search(query=keyword_string,
+                           source_id=source_id,
+                           start_date=begin_date,
+                           end_date=end_date,
                            save_results=False,
                            return_results=False,
-                           yield_results=True
+                           yield_results=True,
+                           match_counts=match_counts
                           )
     query_result = list(query)
-    query_result_isempty = True
-    for qitem in query_result:
-        if qitem:
-            query_result_isempty = False
-    if query_result_isempty:
+    if not any(query_result):
+        return None
+    return query_result
+
+
+def search_query(session, query_idx, qrow, bagify=True, result_filter='',
+                 outpath='', zip_output=False, scrub=True, sink=None,
+                 sink_options=None, extractor=None, bag_mode='sorted',
+                 vocabulary=None, dtm=None, density=None, manifest=None, watermarks=None,
+                 dedup=None, dedup_xml=False):
+    """Uses a session and a query row (labeled with an arbitrary index number)
+    to retrieve an article collection and cache their word lists in JSON format.
+    See ResultWriter for the options.
+    """
+    slug, slug_full = query_slugs(qrow)
+    logging.info(slug)
+    match_counts = []
+    query_result = fetch_results(session, qrow['keyword_string'], qrow['source_id'],
+                                 qrow['begin_date'], qrow['end_date'], match_counts)
+    if query_result is None:
         logging.info('*** search aborted: %s', slug_full)
+        record_row(qrow, 0, density=density, manifest=manifest, watermarks=watermarks,
+                   total_matches=sum(match_counts))
         return
-    article_filename_list = []
-    if zip_output:
-        zip_path_out = os.path.join(outpath, slug_full + '.zip')
-        zip_out = zipfile.ZipFile(zip_path_out, 'w', zipfile.ZIP_DEFLATED)
-        zip_out.writestr('README_' + slug_full, ' ')
-        if result_filter:
-            zip_path_out_no_exact = os.path.join(outpath, slug_full + '(no-exact-match).zip')
-            zip_out_no_exact = zipfile.ZipFile(zip_path_out_no_exact, 'w', zipfile.ZIP_DEFLATED)
-            zip_out_no_exact.writestr('README_' + slug_full + '(no-exact-match)', ' ')
+    write_results(query_idx, qrow, query_result, total_matches=sum(match_counts),
+                  bagify=bagify, result_filter=result_filter,
+                  outpath=outpath, zip_output=zip_output, scrub=scrub, sink=sink,
+                  sink_options=sink_options, extractor=extractor, bag_mode=bag_mode,
+                  vocabulary=vocabulary, dtm=dtm, density=density, manifest=manifest,
+                  watermarks=watermarks, dedup=dedup, dedup_xml=dedup_xml)
+
+
+def record_row(qrow, documents, pub_date='', density=None, manifest=None, watermarks=None,
+               total_matches=None):
+    """Record a finished query row's documents written as done in a
+    manifest.Manifest, its latest article pub_date in a
+    watermark.Watermarks and its hit count in a density.DensityHistory, if
+    given, unless the row is a combined output.
+
+    The hit count is total_matches, the documents WSK reported for the
+    row's own search. Rows searched together with others (coalesced) pass
+    None, as the search's total_matches covers all of its rows, and
+    record the documents attributed to them instead.
+    """
+    if qrow.get('combined'):
+        return
+    progress.add('rows_done')
+    if manifest is not None:
+        manifest.record(qrow, documents)
+    if watermarks is not None:
+        watermarks.record(qrow, pub_date)
+    if density is not None:
+        density.record(qrow['source_id'], qrow['keyword_string'], qrow['begin_date'],
+                       qrow['end_date'], documents if total_matches is None else total_matches)
+
+
+class RowOutput:
+    """The output sinks of one query row: exact matches, and articles that
+    fail the row's result_filter in a (no-exact-match) group. Sinks are
+    opened on first write.
+    """
+
+    def __init__(self, query_idx, qrow, outpath='', sink='json', sink_options=None, dtm=None,
+                 dedup=None, dedup_xml=False):
+        self.query_idx = query_idx
+        self.qrow = qrow
+        self.slug_full = query_slugs(qrow)[1]
+        self.outpath = outpath
+        self.sink = sink
+        self.sink_options = sink_options or {}
+        self.dtm = dtm
+        self.dedup = dedup
+        self.dedup_xml = dedup_xml
+        self.sinks = {}
+        self.count = 0
+        self.pub_date = ''
+        self.total_matches = None
+
+    def name(self, group_idx, article_idx):
+        """The article name for an article position in the search results."""
+        return self.slug_full + '_' + str(self.query_idx) + '_' + str(group_idx) + '_' + str(article_idx)
 
+    def deduplicate(self, name, signature):
+        """(cluster, duplicate) of an article added to the dedup index, or
+        None without an index or signature.
+        """
+        if self.dedup is None or signature is None:
+            return None
+        return self.dedup.add(name, signature)
+
+    def write(self, article, txt, article_full_text, name, exact=True, signature=None,
+              dup=None):
+        """Add the row's keys to a processed article and write it to the
+        exact match or (no-exact-match) output. With a dedup index and the
+        article's MinHash signature, the article is tagged with its
+        duplicate cluster; dup, the deduplicate() result of another copy
+        of the article, is used instead of adding it again.
+        """
+        try:  # add dictionary keys
+            article['name'] = name
+            article['namespace'] = "we1sv2.0"
+            article['metapath'] = "Corpus," + self.slug_full + ",RawData"
+            article['database'] = "LexisNexis"
+        except (KeyError, TypeError) as error:
+            logging.info(name, 'add keys failed', error)
+        if dup is None:
+            dup = self.deduplicate(name, signature)
+        if dup is not None:
+            cluster, duplicate = dup
+            article['dup_cluster'] = cluster
+            if duplicate and self.dedup_xml:
+                article['xml_ref'] = cluster
+                article_full_text = None
+        logging.debug(pprint.pformat(article))
+        suffix = '' if exact else '(no-exact-match)'
+        if suffix not in self.sinks:
+            # a sink that cannot be opened fails the row rather than each article
+            self.sinks[suffix] = open_sink(self.sink, self.outpath, self.slug_full + suffix,
+                                           **self.sink_options)
+        sink_out = self.sinks[suffix]
+        try:
+            written = sink_out.bytes_written
+            sink_out.write(str(self.qrow['source_id']) + '_' + name + suffix,
+                           article, article_full_text)
+            self.count += 1
+            progress.add('documents')
+            progress.add('bytes_written', sink_out.bytes_written - written)
+            self.pub_date = max(self.pub_date, article.get('pub_date') or '')
+            if exact and self.dtm is not None:
+                self.dtm.add(name, txt)
+        except (OSError, TypeError) as error:
+            progress.add('write_errors')
+            logging.info(name, 'JSON write failed', error)
+
+    def close(self):
+        for sink_out in self.sinks.values():
+            sink_out.close()
+
+
+class ResultWriter:
+    """Processes search result articles (markup extraction, cleaning,
+    scrubbing and bagify) and creates the RowOutputs they are written to.
+
+    Articles are written to an output sink (see sinks.py): 'zip' or 'json'
+    by default depending on zip_output, or 'jsonl' / 'parquet'.
+    sink_options are passed to sinks.open_sink, e.g. {'compresslevel': 9}.
+
+    Article markup is read with an extract.ArticleExtractor; text of any
+    extra div classes it is configured with is stored under the lowercased
+    class name, e.g. ArticleExtractor(classes=['BYLINE']) sets 'byline'.
+
+    scrub may be a scrub.scrub.Scrubber to use instead of the config.py
+    ruleset, e.g. one shared by several queries.
+
+    bag_mode selects the bagify output (see bow.py): 'sorted' token strings,
+    'counts' {term: count} dicts, or 'ids' {term id: count} dicts against
+    vocabulary, a bow.Vocabulary (by default vocabulary.txt in outpath).
+
+    dtm may be a dtm.DTMWriter: the term counts of every article written
+    to an exact match output are appended to it.
+
+    dedup may be a dedup.DedupIndex: articles are tagged with the
+    dup_cluster of their near-duplicates, and with dedup_xml duplicates are
+    stored with an xml_ref to the first copy instead of their raw XML.
+
+    density may be a density.DensityHistory: the number of articles written
+    for each query row is recorded in it on close(), manifest may be a
+    manifest.Manifest to record the rows as done in, and watermarks a
+    watermark.Watermarks to record their latest pub_date in.
+    """
+
+    def __init__(self, bagify=True, outpath='', zip_output=False, scrub=True, sink=None,
+                 sink_options=None, extractor=None, bag_mode='sorted', vocabulary=None,
+                 dtm=None, density=None, manifest=None, watermarks=None, dedup=None,
+                 dedup_xml=False):
+        from extract import DEFAULT_EXTRACTOR
+        from scrub.scrub import get_scrubber
+        self.bagify = bagify
+        self.outpath = outpath
+        self.sink = sink or ('zip' if zip_output else 'json')
+        self.sink_options = sink_options or {}
+        self.extractor = extractor or DEFAULT_EXTRACTOR
+        self.scrubber = None
+        if scrub:
+            self.scrubber = scrub if callable(scrub) else get_scrubber()
+        self.bag_mode = bag_mode
+        self.own_vocabulary = bagify and bag_mode == 'ids' and vocabulary is None
+        if self.own_vocabulary:
+            vocabulary = Vocabulary(os.path.join(outpath, VOCABULARY_FILE))
+        self.vocabulary = vocabulary
+        self.dtm = dtm
+        self.density = density
+        self.manifest = manifest
+        self.watermarks = watermarks
+        self.dedup = dedup
+        self.dedup_xml = dedup_xml
+        self.outputs = []
+
+    def output(self, query_idx, qrow):
+        """A new RowOutput for a query row, closed with this writer."""
+        row_output = RowOutput(query_idx, qrow, self.outpath, self.sink, self.sink_options, self.dtm,
+                               self.dedup, self.dedup_xml)
+        self.outputs.append(row_output)
+        return row_output
+
+    def process(self, article, name):
+        """Replace an article's full_text with its title, copyright and
+        content. Returns the (scrubbed, possibly bagged) text, the markup,
+        and with a dedup index the MinHash signature of the text, else None.
+        """
+        signature = None
+        article_full_text = article.pop('full_text')
+        try:  # move dictionary keys
+            article['title'] = article.pop('headline', "untitled")
+        except KeyError as error:
+            logging.info(name, 'move headline to title failed', error)
+        try:  # copyright, body and any extra div classes from one parse
+            parts = self.extractor.extract(article_full_text)
+            article['copyright'] = parts.pop('copyright')
+            txt = parts.pop('body')
+            for cls, cls_txt in parts.items():
+                article[cls.lower()] = cls_txt
+        except (KeyError, TypeError) as error:
+            logging.info(name, 'markup extraction failed', error)
+            txt = ''
+        try:  # move dictionary keys
+            txt = string_cleaner(txt)
+            if self.scrubber:
+                article['content-unscrubbed'] = txt
+                txt = self.scrubber(txt)
+                article['scrub_ruleset'] = getattr(self.scrubber, 'fingerprint', '')
+            if self.dedup is not None:
+                signature = minhash(txt)
+            if self.bagify:
+                article.pop('content-unscrubbed', None)
+                # if content_raw delete content_raw
+                if self.bag_mode == 'sorted':
+                    txt = bag(txt)
+                    article['content'] = txt
+                else:
+                    article['content'] = bag(txt, self.bag_mode, self.vocabulary)
+                    article['bag_mode'] = self.bag_mode
+            else:
+                article['content'] = txt
+        except (KeyError, TypeError) as error:
+            logging.info(name, 'clean contents failed', error)
+        try: # university wire title pre 2007
+            university_wire_title = re.search('\\(C\\) ([0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f]) (.+) via U-WIRE', txt)
+            if university_wire_title:
+                    university_wire_title = university_wire_title.group(2)
+                    article['pub'] = university_wire_title 
+        except (KeyError, TypeError) as error:
+            logging.info(name, 'no university wire title', error)
+        return txt, article_full_text, signature
+
+    def close(self):
+        for row_output in self.outputs:
+            row_output.close()
+            record_row(row_output.qrow, row_output.count, row_output.pub_date, self.density,
+                       self.manifest, self.watermarks, row_output.total_matches)
+        if self.own_vocabulary:
+            self.vocabulary.save()
+
+
+def write_results(query_idx, qrow, query_result, result_filter='', total_matches=None, **options):
+    """Process the result pages of a query row's search and write the
+    articles out. The qrow format is a dict with keys:
+
+        'source_title'    (e.g. Chicago Daily Herald -- not used in search)
+        'source_id'       (e.g. 163823 -- the wsk source id)
+        'keyword_string'  (e.g. "liberal arts")
+        'begin_date'      (e.g. '2017-12-01')
+        'end_date'
+
+    Articles whose content does not match result_filter go to the row's
+    (no-exact-match) output. total_matches, the hit count of a search of
+    the row alone, is recorded as its density (see record_row). See
+    ResultWriter for the options.
+    """
+    writer = ResultWriter(**options)
+    row_output = writer.output(query_idx, qrow)
+    row_output.total_matches = total_matches
     for group_idx, group in enumerate(query_result):
         for article_idx, article in enumerate(group):
-            name = slug_full  + '_' + str(query_idx) + '_' + str(group_idx) + '_' + str(article_idx)
-            article_full_text = article.pop('full_text')
-            try:  # move dictionary keys
-                article['title'] = article.pop('headline', "untitled")
-            except KeyError as error:
-                logging.info(name, 'move headline to title failed', error)
-            try: # move dictionary keys
-                soup = BeautifulSoup(article_full_text, 'lxml')
-                all_copyright = soup.find('div', {'class': 'PUB-COPYRIGHT'})
-                if not all_copyright:
-                    all_copyright = soup.find('div', {'class': 'COPYRIGHT'})
-                copyright_txt = ''
-                for copyright in all_copyright:
-                    copyright_txt = str(copyright) # I don't know why the text isn't already a string, but it isn't, so have to make it one.
-                    copyright_txt = re.sub('Copyright [0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f] ', '', copyright_txt)
-                article['copyright'] = copyright_txt
-            except KeyError as error:
-                logging.info(name, 'copyright info failed', error)      
-            try:  # move dictionary keys
-                body_divs = soup.find_all("div", {"class":"BODY"})
-                txt = ''
-                for body_div in body_divs:
-                    txt = txt + body_div.get_text(separator=u' ')
-                txt = string_cleaner(txt)
-                if scrub:
-                    article['content-unscrubbed'] = txt
-                    txt = scrubber(txt)
-                if bagify:
-                    txt = ' '.join(sorted(txt.split(' '), key=str.lower))
-                    article.pop('content-unscrubbed')
-                    # if content_raw delete content_raw
-                article['content'] = txt
-            except (KeyError, TypeError) as error:
-                logging.info(name, 'clean contents failed', error)
-            try: # university wire title pre 2007
-                university_wire_title = re.search('\\(C\\) ([0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f][0-9A-Fa-f]) (.+) via U-WIRE', txt)
-                if university_wire_title:
-                        university_wire_title = university_wire_title.group(2)
-                        article['pub'] = university_wire_title 
-            except (KeyError, TypeError) as error:
-                logging.info(name, 'no university wire title', error)
-            try:  # add dictionary keys
-                article['name'] = name
-                article['namespace'] = "we1sv2.0"
-                article['metapath'] = "Corpus," + slug_full + ",RawData"
-                article['database'] = "LexisNexis"
-            except (KeyError, TypeError) as error:
-                logging.info(name, 'add keys failed', error)
-            logging.debug(pprint.pformat(article))
-            try:
-                if result_filter and not re.search(result_filter,
-                                                   article['content'], re.IGNORECASE):
-                    article_filename = str(qrow['source_id']) + '_' + name + '(no-exact-match).json'
-                    article_xml_filename = str(qrow['source_id']) + '_' + name + '(no-exact-match).xml'
-                    if zip_output:
-                        zip_map = zip_out_no_exact
-                        zip_map.writestr(article_filename, json.dumps(article, indent=2))
-                        zip_map.writestr(article_xml_filename, article_full_text)
-                    else:
-                        article_filepath = os.path.join(outpath, article_filename)
-                        with open(article_filepath, 'w') as outfile:
-                            json.dump(article, outfile, indent=2)
-                        article_filename_list.append(article_filename)
-                else:
-                    article_filename = str(qrow['source_id']) + '_' + name + '.json'
-                    article_xml_filename = str(qrow['source_id']) + '_' + name + '.xml'
-                    if zip_output:
-                        zip_map = zip_out
-                        zip_map.writestr(article_filename, json.dumps(article, indent=2))
-                        zip_map.writestr(article_xml_filename, article_full_text)
-                    else:
-                        article_filepath = os.path.join(outpath, article_filename)
-                        with open(article_filepath, 'w') as outfile:
-                            json.dump(article, outfile, indent=2)
-                        article_filename_list.append(article_filename)
-
-            except (OSError, TypeError) as error:
-                logging.info(name, 'JSON write failed', error)
-    if zip_output:
-        zip_out.close()
-        if result_filter:
-            zip_out_no_exact.close()
-
-
-def search_querylist(session, fname='queries.csv', bagify=True, outpath='', zip_output=False, scrub=True):
-    """For a list of queries in csv format:
+            name = row_output.name(group_idx, article_idx)
+            with stage('scrub'):
+                txt, article_full_text, signature = writer.process(article, name)
+            exact = not result_filter or re.search(result_filter, txt, re.IGNORECASE)
+            with stage('write'):
+                row_output.write(article, txt, article_full_text, name, bool(exact), signature)
+    writer.close()
 
-        source_title,source_id,keyword_string,begin_date,end_date
-        Chicago Daily Herald,163823,liberal arts,2017-01-01,2017-02-01
 
-    Output will be saved to queries.json and per-article json files.
-    The JSON format for an article is:
+def write_keyword_results(rows, query_result, **options):
+    """Process the result pages of a keyword-coalesced search once and
+    write each article to every row of rows, a list of (query_idx, qrow),
+    whose result_filter matches it. Articles that match no filter go to
+    the (no-exact-match) output of a combined row. See ResultWriter for
+    the options.
+    """
+    writer = ResultWriter(**options)
+    row_outputs = [writer.output(query_idx, qrow) for query_idx, qrow in rows]
+    unmatched = writer.output(rows[0][0], combined_row(rows))
+    filters = FilterSet([qrow['result_filter'] for _, qrow in rows])
+    for group_idx, group in enumerate(query_result):
+        for article_idx, article in enumerate(group):
+            name = unmatched.name(group_idx, article_idx)
+            with stage('scrub'):
+                txt, article_full_text, signature = writer.process(article, name)
+            matches = sorted(filters.matches(txt))
+            with stage('write'):
+                # the copies written to several rows are one fetched article
+                dup = None
+                for i in matches:
+                    row_output = row_outputs[i]
+                    row_name = row_output.name(group_idx, article_idx)
+                    if dup is None:
+                        dup = row_output.deduplicate(row_name, signature)
+                    row_output.write(dict(article), txt, article_full_text, row_name, dup=dup)
+                if not matches:
+                    unmatched.write(article, txt, article_full_text, name, exact=False,
+                                    signature=signature)
+    writer.close()
 
-        {
-          "name": "guardian-article1",
-          "namespace": "we1sv2.0",
-          "metapath": "Corpus,guardian-h,RawData",
-          "title": "Research funding: are we in danger of concentrating too hard?",
-          "content": "A growing obsession with funding scale risks crowding
-        out institutions and stifling innovation..."
-        }
+
+def read_querylist(fname='queries.csv'):
+    """Read a query csv file into (query_idx, qrow) pairs, skipping rows
+    with invalid dates.
     """
+    rows = []
     with open(fname, 'r') as csvfile:
         querylist = csv.DictReader(csvfile, delimiter=',')
         for query_idx, row in enumerate(querylist):
@@ -214,32 +435,235 @@ def search_querylist(session, fname='queries.csv', bagify=True, outpath='', zip_
                 logging.info('Begin date after end: %s, %s; skip query row: %s',
                              row['begin_date'], row['end_date'], query_idx)
             else:
-                search_query(session=session,
-                             query_idx=query_idx,
-                             qrow={'source_title':row['source_title'],
-                                   'source_id':row['source_id'],
-                                   'keyword_string':row['keyword_string'],
-                                   'begin_date':row['begin_date'].strip(),
-                                   'end_date':row['end_date'].strip()
-                                  },
-                             result_filter=row['result_filter'],
-                             bagify=bagify,
-                             outpath=outpath,
-                             zip_output=zip_output,
-                             scrub=scrub
-                            )
-
-
-STARTTIME = datetime.datetime.now().strftime('%Y%m%d-%H%m%S')
-HANDLERS = [logging.FileHandler(filename='wsk-' + STARTTIME + '.log',
-                                mode='a', delay=True),
-            logging.StreamHandler()]
-logging.basicConfig(datefmt='%m/%d/%Y %I:%M:%S %p',
-                    format='%(asctime)s %(message)s',
-                    handlers=HANDLERS,
-                    level=logging.INFO)
+                rows.append((query_idx, {'source_title':row['source_title'],
+                                         'source_id':row['source_id'],
+                                         'keyword_string':row['keyword_string'],
+                                         'begin_date':row['begin_date'].strip(),
+                                         'end_date':row['end_date'].strip(),
+                                         'result_filter':row['result_filter'],
+                                         'priority':row.get('priority') or ''
+                                        }))
+    return rows
+
+
+def search_rows(session, rows, **options):
+    """Run one search for a list of (query_idx, qrow) pairs from
+    planner.plan_searches or planner.plan_keyword_searches and write each
+    row's articles. Rows for one source are searched with one OR query
+    (see write_keyword_results); rows for several sources are searched
+    together over all their sources, and articles that cannot be
+    attributed to a row are written to a 'combined' output.
+    options are passed to ResultWriter.
+    """
+    if len(rows) == 1:
+        query_idx, qrow = rows[0]
+        search_query(session, query_idx, qrow, result_filter=qrow['result_filter'], **options)
+        return
+    first = rows[0][1]
+    if len(set(str(qrow['source_id']) for _, qrow in rows)) == 1:
+        logging.info('keyword search: %s', ', '.join(query_slugs(qrow)[0] for _, qrow in rows))
+        query_result = fetch_results(session, keyword_query(rows), first['source_id'],
+                                     first['begin_date'], first['end_date'])
+        if query_result is None:
+            logging.info('*** search aborted: %s', query_slugs(combined_row(rows))[1])
+            for _, qrow in rows:
+                record_row(qrow, 0, density=options.get('density'), manifest=options.get('manifest'),
+                           watermarks=options.get('watermarks'))
+            return
+        write_keyword_results(rows, query_result, **options)
+        return
+    logging.info('combined search: %s', ', '.join(query_slugs(qrow)[0] for _, qrow in rows))
+    query_result = fetch_results(session, first['keyword_string'],
+                                 [qrow['source_id'] for _, qrow in rows],
+                                 first['begin_date'], first['end_date'])
+    split, unattributed = split_results(query_result or [], rows)
+    for query_idx, qrow in rows:
+        if any(split[query_idx]):
+            write_results(query_idx, qrow, split[query_idx],
+                          result_filter=qrow['result_filter'], **options)
+        else:
+            logging.info('*** search aborted: %s', query_slugs(qrow)[1])
+            record_row(qrow, 0, density=options.get('density'), manifest=options.get('manifest'),
+                       watermarks=options.get('watermarks'))
+    if any(unattributed):
+        qrow = combined_row(rows)
+        logging.info('%d articles not attributed to a source: %s',
+                     sum(len(page) for page in unattributed), query_slugs(qrow)[1])
+        write_results(rows[0][0], qrow, unattributed, result_filter=qrow['result_filter'],
+                      **options)
+
+
+def search_querylist(session, fname='queries.csv', bagify=True, outpath='', zip_output=False, scrub=True,
+                     sink=None, sink_options=None, bag_mode='sorted', dtm='', coalesce=False,
+                     max_sources=MAX_SOURCES, combinability_file=COMBINABILITY_FILE,
+                     coalesce_keywords=False, max_keywords=MAX_KEYWORDS, jobs=1, per_source=1,
+                     order='file', density_file='', manifest_file='', watermark_file='',
+                     delta=False, overlap=OVERLAP_DAYS, dedup_file='', dedup_xml=False,
+                     xml_store=False):
+    """For a list of queries in csv format:
+
+        source_title,source_id,keyword_string,begin_date,end_date
+        Chicago Daily Herald,163823,liberal arts,2017-01-01,2017-02-01
+
+    Output will be saved to queries.json and per-article json files.
+    The JSON format for an article is:
+
+        {
+          "name": "guardian-article1",
+          "namespace": "we1sv2.0",
+          "metapath": "Corpus,guardian-h,RawData",
+          "title": "Research funding: are we in danger of concentrating too hard?",
+          "content": "A growing obsession with funding scale risks crowding
+        out institutions and stifling innovation..."
+        }
+
+    With bag_mode 'ids', all queries share the vocabulary.txt in outpath.
+    If dtm is a folder path, a document-term matrix of all queries is
+    appended to it (see dtm.py).
+
+    With coalesce, rows with the same keyword_string and dates are searched
+    together, up to max_sources combinable sources per search (see
+    planner.py); source combinability is cached in combinability_file.
+    With coalesce_keywords, rows with a result_filter and the same source
+    and dates are searched with one OR query of up to max_keywords keyword
+    strings first.
+
+    Searches run on up to jobs threads, at most per_source at a time for
+    any one source, started in an order from scheduler.ORDERS. Returns
+    the counts of rows done and failed (see scheduler.py).
+
+    If density_file is set, the number of articles found for each row is
+    recorded in it for query_expander.py (see density.py). If manifest_file
+    is set, every row is recorded in it as done or failed when its search
+    ends, for lexisnexis_query_writers.py (see manifest.py).
+
+    If watermark_file is set, the latest collected pub_date and searched
+    date of each source and keyword string are recorded in it. With delta,
+    rows instead run from their watermark less overlap days to today (see
+    watermark.py).
+
+    If dedup_file is set, near-duplicate articles are tagged with a
+    dup_cluster from a MinHash LSH index kept in it, and with dedup_xml
+    stored without their raw XML (see dedup.py).
+
+    With xml_store, the raw XML of articles is compressed into the store in
+    outpath/xml with per-source dictionaries instead of being written to
+    the sink (see xmlstore.py).
+
+    The vocabulary, DTM, density, watermark and dedup files are saved on
+    the calling thread as searches finish. outpath is locked for the run
+    (see lock_outpath), so a second search writing to it fails at once.
+    """
+    if delta and not watermark_file:
+        raise ValueError('delta needs a watermark_file')
+    run_lock = lock_outpath(outpath)
+    try:
+        vocabulary = None
+        if bagify and bag_mode == 'ids':
+            vocabulary = Vocabulary(os.path.join(outpath, VOCABULARY_FILE))
+        dtm_writer = DTMWriter(dtm) if dtm else None
+        density = DensityHistory(density_file) if density_file else None
+        manifest = Manifest(manifest_file) if manifest_file else None
+        watermarks = Watermarks(watermark_file) if watermark_file else None
+        dedup = DedupIndex(dedup_file) if dedup_file else None
+        store = XmlStore(os.path.join(outpath, XML_DIR)) if xml_store else None
+        if store is not None:
+            sink_options = dict(sink_options or {}, xml_store=store)
+        if scrub and not callable(scrub):
+            from scrub.scrub import get_scrubber
+            scrub = get_scrubber()  # compile once, before any worker threads start
+        options = {'bagify': bagify, 'outpath': outpath, 'zip_output': zip_output,
+                   'scrub': scrub, 'sink': sink, 'sink_options': sink_options,
+                   'bag_mode': bag_mode, 'vocabulary': vocabulary, 'dtm': dtm_writer,
+                   'density': density, 'manifest': manifest, 'watermarks': watermarks,
+                   'dedup': dedup, 'dedup_xml': dedup_xml}
+        rows = read_querylist(fname)
+        if delta:
+            rows = delta_rows(rows, watermarks, overlap)
+            logging.info('delta: %d query rows to search', len(rows))
+        progress.add('rows_total', len(rows))
+        if coalesce_keywords:
+            searches = plan_keyword_searches(rows, max_keywords)
+        else:
+            searches = [[row] for row in rows]
+        if coalesce:
+            single = [search[0] for search in searches if len(search) == 1]
+            combinability = load_combinability(combinability_file)
+            if update_combinability(session, [qrow for _, qrow in single], combinability):
+                save_combinability(combinability, combinability_file)
+            searches = [search for search in searches if len(search) > 1] + \
+                       plan_searches(single, combinability, max_sources)
+            searches.sort(key=lambda search: search[0][0])
+        if coalesce or coalesce_keywords:
+            logging.info('%d query rows in %d searches', len(rows), len(searches))
+
+        def run_search(search):
+            try:
+                search_rows(session, search, **options)
+            except Exception:
+                progress.add('rows_failed', len(search))
+                if manifest is not None:
+                    for _, qrow in search:
+                        manifest.record(qrow, None, 'failed')
+                raise
+
+        def save_state():
+            if vocabulary is not None:
+                vocabulary.save()
+            if dtm_writer is not None:
+                dtm_writer.flush()
+            if density is not None:
+                density.save()
+            if watermarks is not None:
+                watermarks.save()
+            if dedup is not None:
+                dedup.commit()
+
+        status = Scheduler(jobs, per_source).run(order_searches(searches, order), run_search,
+                                                 after=save_state)
+        if store is not None:
+            store.close()
+        return status
+    finally:
+        run_lock.close()
+
+
+def lock_outpath(outpath):
+    """Take an exclusive lock on outpath/.search.lock, so that two searches
+    do not write to one outpath (and append conflicting term ids to its
+    vocabulary.txt). Returns the lock file; the lock is released when it
+    is closed or the process ends. Raises RuntimeError if another process
+    holds the lock. Without fcntl (Windows) outpath is not locked.
+    """
+    if outpath:
+        os.makedirs(outpath, exist_ok=True)
+    lock_file = open(os.path.join(outpath, RUN_LOCK_FILE), 'w')
+    fcntl = optional('fcntl')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError('another search is writing to %s' % os.path.abspath(outpath))
+    return lock_file
+
+
+def configure_logging():
+    """Log to the console and to a wsk-<start time>.log file. Called by
+    the command line tools when they start a run, not on import.
+    """
+    starttime = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    handlers = [logging.FileHandler(filename='wsk-' + starttime + '.log',
+                                    mode='a', delay=True),
+                logging.StreamHandler()]
+    logging.basicConfig(datefmt='%m/%d/%Y %I:%M:%S %p',
+                        format='%(asctime)s %(message)s',
+                        handlers=handlers,
+                        level=logging.INFO)
+
 
 if __name__ == "__main__":
+    configure_logging()
     MY_SESSION = get_authenticated_session()
     search_querylist(MY_SESSION, 'queries.csv', bagify=False, zip_output=True, scrub=True)
     logging.info("done\n\n")
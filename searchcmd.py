@@ -3,21 +3,75 @@
 usage examples:
     python searchcmd.py -o ../wskoutput -q queries.csv
     ./searchcmd.py -o ../wskoutput -q queries.csv
+    ./searchcmd.py -o ../wskoutput -q queries.csv --sink jsonl --zstd
+    ./searchcmd.py -o ../wskoutput -q queries.csv -b --bag-mode counts
+    ./searchcmd.py -q queries.csv --estimate estimate.csv -j 8
+    ./searchcmd.py -o ../wskoutput -q queries.csv --delta
+    ./searchcmd.py -o ../wskoutput -q queries.csv --profile ../profile
+    ./searchcmd.py -o ../wskoutput -q queries.csv --metrics 0.0.0.0:9100
 """
 
 import argparse
 import sys
 
-from search import get_authenticated_session, search_querylist
+import profiling
+import progress
+from bow import BAG_MODES
+from dedup import DEDUP_FILE
+from density import DENSITY_FILE
+from estimate import estimate_querylist
+from manifest import MANIFEST_FILE
+from planner import MAX_KEYWORDS, MAX_SOURCES
+from scheduler import ORDERS
+from search import configure_logging, get_authenticated_session, search_querylist
+from sinks import SINKS, check_compresslevel
+from watermark import OVERLAP_DAYS, WATERMARK_FILE
 
 
 def main(args):
     """Collection of actions to execute on run."""
+    configure_logging()
+    profile = profiling.from_args(args)
+    if profile:
+        profiling.start(**profile)
+    progress.start(args.status, args.status_interval, args.metrics)
+    state = 'failed'
+    try:
+        run(args)
+        state = 'finished'
+    finally:
+        progress.stop(state)
+        if profile:
+            print(profiling.stop())
+            print('Profile written to', profile['path'])
+
+
+def run(args):
+    """Run the estimate or the searches of the query file."""
     session = get_authenticated_session()
 
-    if args.queries:
+    if args.queries and args.estimate:
+        if args.estimate == '-':
+            estimate_querylist(session, fname=args.queries, jobs=args.jobs,
+                               per_source=args.per_source, density_file=args.density)
+        else:
+            with open(args.estimate, 'w', newline='') as output:
+                estimate_querylist(session, fname=args.queries, jobs=args.jobs,
+                                   per_source=args.per_source, density_file=args.density,
+                                   output=output)
+    elif args.queries:
+        sink_options = {'compresslevel': args.compresslevel,
+                        'max_bytes': args.shard_mb * 1024 * 1024,
+                        'zstd': args.zstd}
         search_querylist(session, fname=args.queries, bagify=args.bagify,
-                         outpath=args.outpath, zip_output=args.zip, scrub=args.scrub)
+                         outpath=args.outpath, zip_output=args.zip, scrub=args.scrub,
+                         sink=args.sink, sink_options=sink_options, bag_mode=args.bag_mode,
+                         dtm=args.dtm, coalesce=args.coalesce, max_sources=args.max_sources,
+                         coalesce_keywords=args.coalesce_keywords, max_keywords=args.max_keywords,
+                         jobs=args.jobs, per_source=args.per_source, order=args.order,
+                         density_file=args.density, manifest_file=args.manifest,
+                         watermark_file=args.watermarks, delta=args.delta, overlap=args.overlap,
+                         dedup_file=args.dedup, dedup_xml=args.dedup_xml, xml_store=args.xml_store)
 
 
 if __name__ == '__main__':
@@ -25,12 +79,73 @@ if __name__ == '__main__':
                                      usage='use "%(prog)s --help" for more information',
                                      formatter_class=argparse.RawTextHelpFormatter)
     PARSER.add_argument('-b', '--bagify', action='store_true', help='bagify article content, false by default ')
+    PARSER.add_argument('--bag-mode', choices=BAG_MODES, default='sorted',
+                        help='bagify output: sorted token string (default), term counts, or vocabulary id counts')
+    PARSER.add_argument('--dtm', default='', help='append a document-term matrix of the articles to this folder')
     PARSER.add_argument('-o', '--outpath', default='', help='output path, e.g. "../output"')
     PARSER.add_argument('-q', '--queries', help='specify query file path, e.g. queries.csv')
     PARSER.add_argument('-z', '--zip', action='store_false', help='zip the json output, true by default')
     PARSER.add_argument('-s', '--scrub', action='store_false', help='scrub article content, true by default')
+    PARSER.add_argument('--sink', choices=SINKS, help='output format, overrides -z: zip, json, jsonl or parquet')
+    PARSER.add_argument('--compresslevel', type=int, help='compression level for the zip (0-9), jsonl (zstd, 1-22) or parquet (1-22) sink')
+    PARSER.add_argument('--shard-mb', type=int, default=64, help='jsonl sink: maximum shard size in MB, 64 by default')
+    PARSER.add_argument('--zstd', action='store_true', help='jsonl sink: zstd-compress the shards')
+    PARSER.add_argument('--coalesce', action='store_true',
+                        help='search rows with the same keywords and dates over several combinable sources at once')
+    PARSER.add_argument('--max-sources', type=int, default=MAX_SOURCES,
+                        help='--coalesce: maximum sources per search, %d by default' % MAX_SOURCES)
+    PARSER.add_argument('--coalesce-keywords', action='store_true',
+                        help='search rows with a result_filter and the same source and dates with one OR query')
+    PARSER.add_argument('--max-keywords', type=int, default=MAX_KEYWORDS,
+                        help='--coalesce-keywords: maximum keyword strings per search, %d by default' % MAX_KEYWORDS)
+    PARSER.add_argument('-j', '--jobs', type=int, default=1, help='searches to run at once, 1 by default')
+    PARSER.add_argument('--per-source', type=int, default=1,
+                        help='searches to run at once per source, 1 by default')
+    PARSER.add_argument('--order', choices=ORDERS, default='file',
+                        help='search order: query file order (default), priority column, or longest date span first')
+    PARSER.add_argument('--density', default=DENSITY_FILE,
+                        help='record article counts per source and keyword in this file, "%s" by default;\n'
+                             '"" to disable' % DENSITY_FILE)
+    PARSER.add_argument('--manifest', default=MANIFEST_FILE,
+                        help='record each row as done or failed in this file, "%s" by default;\n'
+                             '"" to disable' % MANIFEST_FILE)
+    PARSER.add_argument('--watermarks', default=WATERMARK_FILE,
+                        help='record the latest collected date per source and keyword in this file,\n'
+                             '"%s" by default; "" to disable' % WATERMARK_FILE)
+    PARSER.add_argument('--delta', action='store_true',
+                        help='search each row only from its watermark, less --overlap days, to today')
+    PARSER.add_argument('--overlap', type=int, default=OVERLAP_DAYS,
+                        help='--delta: days before the watermark to search again for late-indexed\n'
+                             'documents, %d by default' % OVERLAP_DAYS)
+    PARSER.add_argument('--dedup', nargs='?', const=DEDUP_FILE, default='',
+                        help='tag near-duplicate articles with a dup_cluster, using the index in this\n'
+                             'file, "%s" by default' % DEDUP_FILE)
+    PARSER.add_argument('--dedup-xml', action='store_true',
+                        help='--dedup: store duplicates with an xml_ref to the first copy instead of their XML')
+    PARSER.add_argument('--xml-store', action='store_true',
+                        help='compress raw XML into the per-source dictionary store in OUTPATH/xml\n'
+                             'instead of the sink (see xmlstore.py)')
+    PARSER.add_argument('--estimate', nargs='?', const='-', default='',
+                        help='only probe each row for its document count and write a CSV of estimated\n'
+                             'searches, retrievals, bytes and time to this file, or stdout')
+    PARSER.add_argument('--status', default=progress.STATUS_FILE,
+                        help='rewrite the progress of the run to this file, "%s" by default;\n'
+                             '"" to disable (see progress.py)' % progress.STATUS_FILE)
+    PARSER.add_argument('--status-interval', type=float, default=progress.INTERVAL,
+                        help='--status: seconds between rewrites, %d by default' % progress.INTERVAL)
+    PARSER.add_argument('--metrics', default='', metavar='[HOST:]PORT',
+                        help='serve progress metrics in Prometheus format on this port, of localhost\n'
+                             'unless a host is given')
+    profiling.add_arguments(PARSER)
     if not sys.argv[1:]:
         PARSER.print_help()
         PARSER.exit()
     ARGS = PARSER.parse_args()
+    try:
+        check_compresslevel(ARGS.sink or ('zip' if ARGS.zip else 'json'),
+                            {'compresslevel': ARGS.compresslevel, 'zstd': ARGS.zstd})
+    except ValueError as error:
+        PARSER.error(str(error))
+    if ARGS.delta and not ARGS.watermarks:
+        PARSER.error('--delta needs a --watermarks file')
     main(ARGS)
@@ -0,0 +1,312 @@
+"""Output sinks for WE1S (WhatEvery1Says) article collections
+
+A sink receives processed articles from search.search_query one at a time
+and persists them. Each query opens one sink for matching articles and,
+when a result_filter is used, a second one for its no-exact-match results.
+
+    json     one loose .json file per article (the original unzipped output)
+    zip      one zip per query with a .json and an .xml member per article
+    jsonl    sharded JSON Lines files, size-capped, optionally zstd-compressed
+    parquet  one columnar Parquet file of article metadata and content
+
+The jsonl and parquet sinks keep the raw XML in an 'xml' field / column
+unless include_xml=False. With an xml_store option (an xmlstore.XmlStore)
+any sink leaves the raw XML out and puts it in the store instead. zstandard and pyarrow are optional and are only
+needed, and imported, by the sinks that use them.
+"""
+
+import io
+import json
+import os
+import sys
+import zipfile
+
+from lazy import optional
+
+
+SINKS = ('zip', 'json', 'jsonl', 'parquet')
+
+ZIP_COMPRESSION = {'deflate': zipfile.ZIP_DEFLATED,
+                   'stored': zipfile.ZIP_STORED,
+                   'bzip2': zipfile.ZIP_BZIP2,
+                   'lzma': zipfile.ZIP_LZMA}
+
+# Valid compresslevel range of each codec that takes one
+COMPRESSLEVELS = {'deflate': (0, 9), 'bzip2': (1, 9), 'zstd': (1, 22),
+                  'gzip': (1, 9), 'brotli': (0, 11)}
+
+# Column order of the parquet sink; any other article keys are dropped.
+PARQUET_COLUMNS = ['name', 'namespace', 'metapath', 'database', 'doc_id',
+                   'attachment_id', 'title', 'pub', 'pub_date', 'length',
+                   'section', 'author', 'copyright', 'content',
+                   'content-unscrubbed']
+
+
+class Sink:
+    """Base class for article sinks. Subclasses implement write and close.
+
+    write(basename, article, xml) receives the file basename the article
+    would have in the zip / json output (without extension), the article
+    dict, and the raw Display-markup XML of the article, or None if it is
+    stored elsewhere. bytes_written counts the UTF-8 bytes of the
+    (uncompressed) articles written.
+    """
+
+    def __init__(self, outpath, slug):
+        self.outpath = outpath
+        self.slug = slug
+        self.count = 0
+        self.bytes_written = 0
+
+    def write(self, basename, article, xml):
+        """Persist one article."""
+        raise NotImplementedError
+
+    def close(self):
+        """Flush and release any open files."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonFileSink(Sink):
+    """One pretty-printed .json file per article, directly in outpath."""
+
+    def write(self, basename, article, xml):
+        data = json.dumps(article, indent=2).encode('utf-8')
+        with open(os.path.join(self.outpath, basename + '.json'), 'wb') as outfile:
+            outfile.write(data)
+        self.count += 1
+        self.bytes_written += len(data)
+
+
+class ZipSink(Sink):
+    """One zip per query, holding a .json and an .xml member per article.
+
+    compression is a key of ZIP_COMPRESSION; compresslevel is passed to
+    zipfile (0-9 for deflate, 1-9 for bzip2) and needs Python 3.7+.
+    """
+
+    def __init__(self, outpath, slug, compression='deflate', compresslevel=None):
+        super().__init__(outpath, slug)
+        kwargs = {}
+        if compresslevel is not None:
+            kwargs['compresslevel'] = compresslevel
+        self.path = os.path.join(outpath, slug + '.zip')
+        self.zip_out = zipfile.ZipFile(self.path, 'w',
+                                       ZIP_COMPRESSION[compression], **kwargs)
+        self.zip_out.writestr('README_' + slug, ' ')
+
+    def write(self, basename, article, xml):
+        data = json.dumps(article, indent=2).encode('utf-8')
+        self.zip_out.writestr(basename + '.json', data)
+        self.bytes_written += len(data)
+        if xml is not None:
+            xml_data = xml.encode('utf-8')
+            self.zip_out.writestr(basename + '.xml', xml_data)
+            self.bytes_written += len(xml_data)
+        self.count += 1
+
+    def close(self):
+        self.zip_out.close()
+
+
+class JsonlSink(Sink):
+    """Sharded JSON Lines: <slug>-00000.jsonl, <slug>-00001.jsonl, ...
+
+    A new shard is started once a shard holds max_bytes of (uncompressed)
+    records. With zstd=True shards are written as .jsonl.zst streams at
+    the given compresslevel.
+    """
+
+    def __init__(self, outpath, slug, max_bytes=64 * 1024 * 1024,
+                 zstd=False, compresslevel=None, include_xml=True):
+        super().__init__(outpath, slug)
+        if zstd and optional('zstandard') is None:
+            raise ImportError('the zstd jsonl sink requires the zstandard package')
+        self.max_bytes = max_bytes
+        self.zstd = zstd
+        self.compresslevel = compresslevel if compresslevel is not None else 3
+        self.include_xml = include_xml
+        self.shard = -1
+        self.paths = []
+        self._file = None
+        self._stream = None
+        self._shard_bytes = 0
+
+    def _open_shard(self):
+        self._close_shard()
+        self.shard += 1
+        ext = '.jsonl.zst' if self.zstd else '.jsonl'
+        path = os.path.join(self.outpath, '%s-%05d%s' % (self.slug, self.shard, ext))
+        self._file = open(path, 'wb')
+        if self.zstd:
+            compressor = optional('zstandard').ZstdCompressor(level=self.compresslevel)
+            self._stream = compressor.stream_writer(self._file)
+        else:
+            self._stream = self._file
+        self._shard_bytes = 0
+        self.paths.append(path)
+
+    def _close_shard(self):
+        if self._stream is not None:
+            self._stream.close()
+            if not self._file.closed:
+                self._file.close()
+        self._file = None
+        self._stream = None
+
+    def write(self, basename, article, xml):
+        record = dict(article)
+        record['file'] = basename
+        if self.include_xml and xml is not None:
+            record['xml'] = xml
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        if self._stream is None or (self._shard_bytes
+                                    and self._shard_bytes + len(line) > self.max_bytes):
+            self._open_shard()
+        self._stream.write(line)
+        self._shard_bytes += len(line)
+        self.count += 1
+        self.bytes_written += len(line)
+
+    def close(self):
+        self._close_shard()
+
+
+class ParquetSink(Sink):
+    """One <slug>.parquet file with a string column per PARQUET_COLUMNS
+    entry (plus 'file' and 'xml'), written in row groups of row_group_size.
+    """
+
+    def __init__(self, outpath, slug, row_group_size=1000, compression='zstd',
+                 compresslevel=None, include_xml=True):
+        super().__init__(outpath, slug)
+        pyarrow = optional('pyarrow')
+        if pyarrow is None or optional('pyarrow.parquet') is None:
+            raise ImportError('the parquet sink requires the pyarrow package')
+        self.columns = PARQUET_COLUMNS + ['file'] + (['xml'] if include_xml else [])
+        self.schema = pyarrow.schema([(col, pyarrow.string()) for col in self.columns])
+        self.row_group_size = row_group_size
+        self.path = os.path.join(outpath, slug + '.parquet')
+        self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema,
+                                                    compression=compression,
+                                                    compression_level=compresslevel)
+        self._rows = {col: [] for col in self.columns}
+        self._buffered = 0
+
+    def write(self, basename, article, xml):
+        record = dict(article, file=basename, xml=xml)
+        for col in self.columns:
+            value = record.get(col)
+            if value is not None and not isinstance(value, str):
+                value = json.dumps(value)
+            self._rows[col].append(value)
+            if value:
+                self.bytes_written += len(value.encode('utf-8'))
+        self._buffered += 1
+        self.count += 1
+        if self._buffered >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffered:
+            table = optional('pyarrow').Table.from_pydict(self._rows, schema=self.schema)
+            self.writer.write_table(table)
+            self._rows = {col: [] for col in self.columns}
+            self._buffered = 0
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class XmlStoreSink(Sink):
+    """Writes articles to another sink without their raw XML, which goes
+    to an xmlstore.XmlStore under the article name.
+    """
+
+    def __init__(self, sink, xml_store):
+        super().__init__(sink.outpath, sink.slug)
+        self.sink = sink
+        self.xml_store = xml_store
+
+    def write(self, basename, article, xml):
+        if xml:
+            self.xml_store.put(article['name'], xml)
+        self.sink.write(basename, article, None)
+        self.count += 1
+        self.bytes_written = self.sink.bytes_written
+
+    def close(self):
+        self.sink.close()
+
+
+def open_sink(kind, outpath, slug, **options):
+    """Return an open sink of the given kind (one of SINKS).
+    Options not understood by that sink are ignored, so a single
+    options dict can be passed for whichever sink is selected.
+    """
+    check_compresslevel(kind, options)
+    if options.get('xml_store') is not None:
+        sink = open_sink(kind, outpath, slug, **dict(options, xml_store=None))
+        return XmlStoreSink(sink, options['xml_store'])
+    if kind == 'json':
+        return JsonFileSink(outpath, slug)
+    if kind == 'zip':
+        return ZipSink(outpath, slug, **_pick(options, 'compression', 'compresslevel'))
+    if kind == 'jsonl':
+        return JsonlSink(outpath, slug, **_pick(options, 'max_bytes', 'zstd',
+                                                 'compresslevel', 'include_xml'))
+    if kind == 'parquet':
+        return ParquetSink(outpath, slug, **_pick(options, 'row_group_size',
+                                                   'compresslevel', 'include_xml'))
+    raise ValueError('unknown sink: %s' % kind)
+
+
+def sink_codec(kind, options):
+    """The codec the sink kind compresses with given options, or None."""
+    if kind == 'zip':
+        return options.get('compression') or 'deflate'
+    if kind == 'jsonl':
+        return 'zstd' if options.get('zstd') else None
+    if kind == 'parquet':
+        return 'zstd'
+    return None
+
+
+def check_compresslevel(kind, options):
+    """Raise ValueError if options has a compresslevel outside the range of
+    the codec the sink kind would use it with. Levels for sinks that do
+    not compress, or codecs without levels, are ignored.
+    """
+    level = options.get('compresslevel')
+    codec = sink_codec(kind, options)
+    if level is None or codec not in COMPRESSLEVELS:
+        return
+    if kind == 'zip' and sys.version_info < (3, 7):
+        raise ValueError('compresslevel for the zip sink needs Python 3.7 or later')
+    low, high = COMPRESSLEVELS[codec]
+    if not low <= level <= high:
+        raise ValueError('compresslevel %d is out of range for the %s sink (%s: %d-%d)'
+                         % (level, kind, codec, low, high))
+
+
+def _pick(options, *keys):
+    return {key: options[key] for key in keys if options.get(key) is not None}
+
+
+def iter_jsonl(path):
+    """Yield the records of a .jsonl or .jsonl.zst shard."""
+    with open(path, 'rb') as raw:
+        if path.endswith('.zst'):
+            zstandard = optional('zstandard')
+            if zstandard is None:
+                raise ImportError('reading .zst shards requires the zstandard package')
+            raw = zstandard.ZstdDecompressor().stream_reader(raw)
+        for line in io.TextIOWrapper(raw, encoding='utf-8'):
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,13 @@
+"""pytest configuration for the WE1S collector tests
+
+Tests import the collector's top-level modules and the benchmark helpers
+(reference implementations, synthetic articles) the way the scripts do.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,44 @@
+"""scrub/normalize.py against the code it replaced
+
+clean_text and fix_text must give the same output as the original
+string_cleaner and ftfy + remove_accents path (kept in
+benchmarks/bench_normalize.py) on the edge cases and on the body text
+of synthetic articles.
+"""
+
+import pytest
+
+from bench_normalize import EDGE_CASES, legacy_fix_text, legacy_string_cleaner
+from extract import ArticleExtractor
+from scrub.normalize import clean_text, fix_text
+from synthetic import Generator
+
+
+def sample_bodies(count=5, words=400):
+    generator = Generator(seed=1, vocabulary_size=2000)
+    extractor = ArticleExtractor()
+    return [extractor.extract(generator.article(words))['body'] for _ in range(count)]
+
+
+BODIES = sample_bodies()
+
+
+@pytest.mark.parametrize('text', EDGE_CASES)
+def test_clean_text_edge_cases(text):
+    assert clean_text(text) == legacy_string_cleaner(text)
+
+
+@pytest.mark.parametrize('text', EDGE_CASES)
+def test_fix_text_edge_cases(text):
+    assert fix_text(text) == legacy_fix_text(text)
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_clean_text_articles(body):
+    assert clean_text(body) == legacy_string_cleaner(body)
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_fix_text_articles(body):
+    assert fix_text(body) == legacy_fix_text(body)
+    assert fix_text(legacy_string_cleaner(body)) == legacy_fix_text(legacy_string_cleaner(body))
@@ -0,0 +1,55 @@
+"""watermark.delta_rows: a delta re-run searches each span once."""
+
+from watermark import Watermarks, delta_rows
+
+
+def year_rows(years, source_id='163823', keyword_string='liberal arts'):
+    return [(idx, {'source_title': 'Chicago Daily Herald', 'source_id': source_id,
+                   'keyword_string': keyword_string, 'begin_date': '%d-01-01' % year,
+                   'end_date': '%d-12-31' % year, 'result_filter': ''})
+            for idx, year in enumerate(years)]
+
+
+def spans(rows):
+    return [(query_idx, qrow['begin_date'], qrow['end_date']) for query_idx, qrow in rows]
+
+
+def test_no_watermark_extends_only_the_latest_row(tmp_path):
+    watermarks = Watermarks(str(tmp_path / 'watermarks.json'))
+    rows = delta_rows(year_rows([2016, 2017, 2018]), watermarks, end_date='2019-03-01')
+    assert spans(rows) == [(0, '2016-01-01', '2016-12-31'), (1, '2017-01-01', '2017-12-31'),
+                           (2, '2018-01-01', '2019-03-01')]
+
+
+def test_rows_before_the_watermark_are_dropped(tmp_path):
+    watermarks = Watermarks(str(tmp_path / 'watermarks.json'))
+    for _, qrow in year_rows([2016, 2017]) + [(2, dict(year_rows([2018])[0][1],
+                                                       end_date='2018-06-30'))]:
+        watermarks.record(qrow)
+    rows = delta_rows(year_rows([2016, 2017, 2018]), watermarks, overlap=7, end_date='2019-03-01')
+    assert spans(rows) == [(2, '2018-06-23', '2019-03-01')]
+
+
+def test_overlap_keeps_the_end_of_a_covered_row(tmp_path):
+    watermarks = Watermarks(str(tmp_path / 'watermarks.json'))
+    for _, qrow in year_rows([2016, 2017]):
+        watermarks.record(qrow)
+    rows = delta_rows(year_rows([2016, 2017, 2018]), watermarks, overlap=7, end_date='2019-03-01')
+    assert spans(rows) == [(1, '2017-12-24', '2017-12-31'), (2, '2018-01-01', '2019-03-01')]
+
+
+def test_keys_are_independent(tmp_path):
+    watermarks = Watermarks(str(tmp_path / 'watermarks.json'))
+    for _, qrow in year_rows([2016, 2017], source_id='8075'):
+        watermarks.record(qrow)
+    rows = year_rows([2016, 2017]) + [(idx + 2, qrow) for idx, qrow
+                                       in year_rows([2016, 2017], source_id='8075')]
+    assert spans(delta_rows(rows, watermarks, overlap=0, end_date='2018-01-10')) == [
+        (0, '2016-01-01', '2016-12-31'), (1, '2017-01-01', '2018-01-10'),
+        (3, '2017-12-31', '2018-01-10')]
+
+
+def test_rows_after_end_date_are_dropped(tmp_path):
+    watermarks = Watermarks(str(tmp_path / 'watermarks.json'))
+    rows = delta_rows(year_rows([2018, 2019]), watermarks, end_date='2018-10-19')
+    assert spans(rows) == [(0, '2018-01-01', '2018-10-19')]
@@ -0,0 +1,131 @@
+"""Collection high-water marks for WE1S (WhatEvery1Says) recurring crawls
+
+Records, per (source_id, keyword_string), the latest pub_date of any
+collected article, the date spans searched by finished rows (from their
+begin_date to their end_date or the day they ran, whichever is earlier),
+and the date through which searches have covered the source without a
+gap, the end of the first span:
+
+    {"163823|liberal arts": {"pub_date": "2017-06-29", "covered": "2017-07-01",
+                             "spans": [["2017-01-01", "2017-07-01"]]}, ...}
+
+A row that finishes before an earlier row, or after an earlier row
+failed, starts a new span and does not move covered past the gap.
+
+In delta mode (searchcmd.py --delta) a re-run only searches for new
+documents: query rows that end before the watermark less an overlap (to
+catch documents indexed late) are dropped, the others are moved to start
+no earlier than that, and the latest row of each source and keyword
+string is extended to end today. A query file expanded by year thus
+searches the years since the watermark once each, not every year's row
+over the same span.
+"""
+
+import datetime
+import json
+import os
+import threading
+
+from density import density_key
+
+WATERMARK_FILE = 'watermarks.json'
+OVERLAP_DAYS = 7
+
+
+def today():
+    """Today's date as YYYY-MM-DD."""
+    return datetime.date.today().strftime('%Y-%m-%d')
+
+
+def next_day(date):
+    """The day after date, YYYY-MM-DD."""
+    day = datetime.datetime.strptime(date, '%Y-%m-%d') + datetime.timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def merge_spans(spans):
+    """[begin, end] date spans sorted, with overlapping and adjacent spans
+    joined.
+    """
+    merged = []
+    for begin, end in sorted(spans):
+        if merged and begin <= next_day(merged[-1][1]):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([begin, end])
+    return merged
+
+
+class Watermarks:
+    """Watermarks per source and keyword string, kept in a JSON file.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=WATERMARK_FILE):
+        self.path = path
+        self.marks = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path) as watermark_file:
+                self.marks = json.load(watermark_file)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, qrow, pub_date=''):
+        """Record a finished query row, whose latest article (if any) was
+        published on pub_date (YYYY-MM-DD, time of day ignored).
+        """
+        covered = min(qrow['end_date'], today())
+        with self._lock:
+            mark = self.marks.setdefault(density_key(qrow['source_id'], qrow['keyword_string']), {})
+            if pub_date and pub_date[:10] > mark.get('pub_date', ''):
+                mark['pub_date'] = pub_date[:10]
+            if qrow['begin_date'] <= covered:
+                # a mark from before spans were kept covers everything up to it
+                spans = mark.get('spans') or ([['', mark['covered']]] if mark.get('covered') else [])
+                mark['spans'] = merge_spans(spans + [[qrow['begin_date'], covered]])
+                mark['covered'] = mark['spans'][0][1]
+
+    def watermark(self, source_id, keyword_string):
+        """The date through which a source and keyword string are known to
+        be collected without a gap, or None: covered, or for a mark
+        without it the latest pub_date.
+        """
+        with self._lock:
+            mark = self.marks.get(density_key(source_id, keyword_string), {})
+        return mark.get('covered') or mark.get('pub_date') or None
+
+    def save(self):
+        """Write the watermark file."""
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as watermark_file:
+                json.dump(self.marks, watermark_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def delta_rows(rows, watermarks, overlap=OVERLAP_DAYS, end_date=None):
+    """(query_idx, qrow) pairs left to search after the watermarks. For
+    each (source_id, keyword_string), rows ending before the watermark
+    less overlap days are dropped, the rest start no earlier than that,
+    and the rows with the latest end_date are extended to end_date, today
+    by default. Rows with nothing left to search are dropped.
+    """
+    end_date = end_date or today()
+    latest = {}
+    for _, qrow in rows:
+        key = density_key(qrow['source_id'], qrow['keyword_string'])
+        latest[key] = max(latest.get(key, ''), qrow['end_date'])
+    delta = []
+    for query_idx, qrow in rows:
+        if qrow['end_date'] == latest[density_key(qrow['source_id'], qrow['keyword_string'])]:
+            qrow = dict(qrow, end_date=end_date)
+        else:
+            qrow = dict(qrow, end_date=min(qrow['end_date'], end_date))
+        mark = watermarks.watermark(qrow['source_id'], qrow['keyword_string'])
+        if mark:
+            start = datetime.datetime.strptime(mark, '%Y-%m-%d') - datetime.timedelta(days=overlap)
+            qrow['begin_date'] = max(qrow['begin_date'], start.strftime('%Y-%m-%d'))
+        if qrow['begin_date'] <= qrow['end_date']:
+            delta.append((query_idx, qrow))
+    return delta
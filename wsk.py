@@ -1,4 +1,3 @@
-from pymongo import MongoClient
 from bs4 import BeautifulSoup, element
 from datetime import datetime, timedelta
 from dateutil import parser as dateparser
@@ -11,6 +10,9 @@ import requests
 import time
 import sys
 
+import progress
+from profiling import stage
+
 class WSK:
   def __init__(self, environment='', project_id=''):
     self.environment = environment
@@ -26,6 +28,7 @@ class WSK:
     @param {str} dbname: the name of the db to use in Mongo
     @param {str} uri: a mongodb uri that specifies the db location
     '''
+    from pymongo import MongoClient
     self.db = MongoClient(uri)[dbname]
 
 
@@ -313,12 +316,14 @@ class WSK:
     return_results=False,
     save_results=True,
     yield_results=False,
-    time_delta=30):
+    time_delta=30,
+    match_counts=None):
     '''
     Run a full query for the user, fetching all doc metadata and content
 
     @param: {str} query: the user's document query phrase
-    @param: {int} source_id: the source id to which queries will be addressed
+    @param: {int|list} source_id: the source id, or a list of combinable
+      source ids, to which queries will be addressed
     @param: {str} start_date: the starting query date in string format
     @param: {str} end_date: the ending query date in string format
     @param: {bool} yield_results: stream results to the parent function
@@ -326,6 +331,8 @@ class WSK:
     @param: {bool} store_results: save matches to mongo
     @param: {bool} get_text: fetch full text content for each match
     @param: {bool} time_delta: time stride in days
+    @param: {list} match_counts: if given, the total_matches of each date
+      window searched is appended to it
     @returns: {obj} an object with metadata describing search results data
     '''
     user_results = []  # results to return to user
@@ -349,6 +356,8 @@ class WSK:
         query_result = self.run_search(query, source_id, begin=query_begin,
             end=query_end, start_date=start_date_str, end_date=end_date_str,
             save_results=save_results, get_text=get_text)
+        if match_counts is not None and query_begin == 1 and query_result['status_code'] == 200:
+          match_counts.append(query_result['total_matches'])
 
         # case where query returned no results
         if query_result['total_matches'] == 0:
@@ -412,7 +421,8 @@ class WSK:
     Method that actually submits search requests. Called from self.search(),
     which controls the logic that constructs the individual searches
     @param: {str} query: the user's document query phrase
-    @param: {int} source_id: the source id to which queries will be addressed
+    @param: {int|list} source_id: the source id, or a list of combinable
+      source ids, to which queries will be addressed
     @param: {int} begin: the starting result number to return
     @param: {int} end: the ending result number to return
     @param: {str} start_date: the starting query date in string format
@@ -422,6 +432,10 @@ class WSK:
     @returns: {obj} an object with metadata describing search results data
     '''
     print(' * querying for', query, source_id, begin, end, start_date, end_date)
+    source_ids = source_id if isinstance(source_id, (list, tuple)) else [source_id]
+    source_id_list = ''.join(
+      '<sourceId xmlns="http://common.services.v1.wsapi.lexisnexis.com">{0}</sourceId>'.format(i)
+      for i in source_ids)
 
     request = '''
       <SOAP-ENV:Envelope
@@ -432,7 +446,7 @@ class WSK:
             <binarySecurityToken>{0}</binarySecurityToken>
             <sourceInformation>
               <sourceIdList xmlns="http://common.search.services.v1.wsapi.lexisnexis.com">
-                <sourceId xmlns="http://common.services.v1.wsapi.lexisnexis.com">{1}</sourceId>
+                {1}
               </sourceIdList>
             </sourceInformation>
             <query>{2}</query>
@@ -455,27 +469,35 @@ class WSK:
           </Search>
         </soap:Body>
       </SOAP-ENV:Envelope>
-      '''.format(self.auth_token, source_id, query, self.project_id,
+      '''.format(self.auth_token, source_id_list, query, self.project_id,
           start_date, end_date, begin, end)
     url = self.get_url('Search')
 
-    response = requests.post(url=url, headers=self.get_headers(request), data=request)
-    soup = BeautifulSoup(response.text, 'lxml')
-    result_packet = {}
-    result_packet['status_code'] = response.status_code
-    result_packet['total_matches'] = 0
-    result_packet['results'] = []
-
-    try:
-      result_count_tag = find_tag_by_name(soup, 'documentsfound')
-      result_packet['total_matches'] = int(result_count_tag.get_text())
-    except AttributeError:
+    with stage('network'), progress.request():
+      response = requests.post(url=url, headers=self.get_headers(request), data=request)
+    progress.add('pages')
+    if begin == 1:
+      progress.add('windows')
+    if response.status_code != 200:
+      progress.add('request_errors')
+    with stage('soap_parse'):
+      soup = BeautifulSoup(response.text, 'lxml')
+      result_packet = {}
+      result_packet['status_code'] = response.status_code
       result_packet['total_matches'] = 0
+      result_packet['results'] = []
+
+      try:
+        result_count_tag = find_tag_by_name(soup, 'documentsfound')
+        result_packet['total_matches'] = int(result_count_tag.get_text())
+      except AttributeError:
+        result_packet['total_matches'] = 0
 
     if (result_packet['total_matches'] == 0) or (result_packet['status_code'] != 200):
       return result_packet
     else:
-      result_packet['results'] = self.get_documents(soup, get_text)
+      result_packet['results'] = self.get_documents(soup, get_text,
+                                                    multi_source=len(source_ids) > 1)
 
     if save_results: self.save_results(result_packet['results'])
 
@@ -528,9 +550,11 @@ class WSK:
     return datetime_date.strftime('%Y-%m-%d')
 
 
-  def get_documents(self, soup, get_text=True):
+  def get_documents(self, soup, get_text=True, multi_source=False):
     '''
     @param: {BeautifulSoup}: the result of a search() query
+    @param: {bool} multi_source: the search was over several sources, so
+      each match also records its source_id
     @returns: {arr}: a list of objects, each describing a match's metadata
     '''
     # create a store of processed documents
@@ -542,7 +566,8 @@ class WSK:
         doc_containers.append(i)
     for idx, i in enumerate(doc_containers):
       try:
-        doc = Document(i).metadata
+        with stage('doc_parse'):
+          doc = Document(i, include_source_id=multi_source).metadata
         if get_text:
           doc['full_text'] = self.get_full_text(doc['doc_id'])
         docs.append(doc)
@@ -579,15 +604,20 @@ class WSK:
       '''.format(self.auth_token, document_id)
 
     url = self.get_url('Retrieval')
-    response = requests.post(url=url, headers=self.get_headers(request), data=request)
-    soup = BeautifulSoup(response.text, 'xml')
-    return base64.b64decode(soup.document.text).decode('utf8')
+    with stage('network'), progress.request():
+      response = requests.post(url=url, headers=self.get_headers(request), data=request)
+    if response.status_code != 200:
+      progress.add('request_errors')
+    with stage('soap_parse'):
+      soup = BeautifulSoup(response.text, 'xml')
+      return base64.b64decode(soup.document.text).decode('utf8')
 
 
 class Document(dict):
-  def __init__(self, document_soup):
+  def __init__(self, document_soup, include_source_id=False):
     self.verbose = False
     self.include_meta = False
+    self.include_source_id = include_source_id
     self.metadata = self.format_doc(document_soup)
 
 
@@ -618,6 +648,8 @@ class Document(dict):
     formatted['headline'] = self.get_doc_headline(doc_soup)
     formatted['attachment_id'] = self.get_doc_attachment_id(doc_soup)
     formatted['pub'] = self.get_doc_pub(doc_soup)
+    if self.include_source_id:
+      formatted['source_id'] = self.get_doc_source_id(doc_soup)
     formatted['pub_date'] = self.get_doc_pub_date(doc_soup)
     formatted['length'] = self.get_doc_length(doc_soup)
     formatted['section'] = self.get_doc_section(doc_soup)
@@ -678,6 +710,21 @@ class Document(dict):
         return default_name
 
 
+  def get_doc_source_id(self, soup):
+    '''
+    Multi-source searches return documents from several sources; the
+    source id identifies which one. The meta name is matched loosely
+    (sourceId, source-id); if it is missing, planner.split_results falls
+    back to the publication name.
+    @param {BeautifulSoup} soup: a documentcontainer tag
+    @returns {str}: the sourceId meta attribute of a document, or ''
+    '''
+    for meta in soup.find_all('meta'):
+      if meta.get('name', '').lower() in ('sourceid', 'source-id'):
+        return meta.get('content', '')
+    return ''
+
+
   def get_doc_pub_date(self, soup):
     '''
     Parses different human-readable date formats dynamically,
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Dictionary-compressed raw XML storage for WE1S (WhatEvery1Says)
+
+The raw Display-markup XML of articles from one source repeats the same
+headers, classes and copyright blocks, which DEFLATE, compressing each
+zip member on its own, cannot exploit. An XML store instead compresses
+each article's XML as a zstd frame against a dictionary trained on that
+source's articles:
+
+    xml/dictionaries/<dict id>.zdict   trained zstd dictionaries
+    xml/dictionaries/sources.json      {source_id: dict id} for new writes
+    xml/<source_id>.pack               concatenated zstd frames
+    xml/<source_id>.idx                name, offset and length per frame
+
+A source is the part of an article name before the first '_'. Frames
+record the id of their dictionary, so retraining a source only affects
+new writes; sources without a dictionary are compressed without one.
+
+Train dictionaries from the .xml members of existing output zips:
+    ./xmlstore.py train ../wskoutput -o ../wskoutput/xml
+
+Collect into the store with searchcmd.py --xml-store: sinks then leave
+out the raw XML, which XmlReader(path).read(name) or read_xml(path, name)
+returns for a single article. Needs the zstandard package.
+"""
+
+import argparse
+import collections
+import json
+import os
+import threading
+import zipfile
+
+from catalog import zip_fields
+from lazy import optional
+
+XML_DIR = 'xml'
+DICT_DIR = 'dictionaries'
+SOURCES_FILE = 'sources.json'
+DICT_SIZE = 110 * 1024
+LEVEL = 9
+SAMPLES = 2000
+MIN_SAMPLES = 20
+
+
+def article_source(name):
+    """The source key of an article name: its text before the first '_'."""
+    return name.split('_', 1)[0]
+
+
+def _require_zstandard():
+    zstandard = optional('zstandard')
+    if zstandard is None:
+        raise ImportError('the XML store requires the zstandard package')
+    return zstandard
+
+
+class _Dictionaries:
+    """The trained dictionaries of a store, loaded on first use."""
+
+    def __init__(self, path):
+        self.path = os.path.join(path, DICT_DIR)
+        self.cache = {}
+
+    def sources(self):
+        try:
+            with open(os.path.join(self.path, SOURCES_FILE)) as sources_file:
+                return json.load(sources_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, dict_id):
+        if dict_id not in self.cache:
+            with open(os.path.join(self.path, '%d.zdict' % dict_id), 'rb') as dict_file:
+                self.cache[dict_id] = _require_zstandard().ZstdCompressionDict(dict_file.read())
+        return self.cache[dict_id]
+
+
+class XmlStore:
+    """Appends articles' raw XML to a store, compressed with the dictionary
+    of their source. Safe to share between threads.
+    """
+
+    def __init__(self, path, level=LEVEL):
+        _require_zstandard()
+        self.path = path
+        self.level = level
+        os.makedirs(os.path.join(path, DICT_DIR), exist_ok=True)
+        self.dictionaries = _Dictionaries(path)
+        self.sources = self.dictionaries.sources()
+        self._compressors = {}
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _compressor(self, source):
+        if source not in self._compressors:
+            zstandard = _require_zstandard()
+            dict_id = self.sources.get(source)
+            if dict_id:
+                self._compressors[source] = zstandard.ZstdCompressor(
+                    level=self.level, dict_data=self.dictionaries.get(dict_id))
+            else:
+                self._compressors[source] = zstandard.ZstdCompressor(level=self.level)
+        return self._compressors[source]
+
+    def _open(self, source):
+        if source not in self._files:
+            base = os.path.join(self.path, source)
+            self._files[source] = (open(base + '.pack', 'ab'),
+                                   open(base + '.idx', 'a', encoding='utf-8'))
+        return self._files[source]
+
+    def put(self, name, xml):
+        """Store the raw XML of the article name."""
+        source = article_source(name)
+        with self._lock:
+            frame = self._compressor(source).compress(xml.encode('utf-8'))
+            pack, index = self._open(source)
+            offset = pack.tell()
+            pack.write(frame)
+            pack.flush()
+            index.write('%s\t%d\t%d\n' % (name, offset, len(frame)))
+            index.flush()
+
+    def close(self):
+        with self._lock:
+            for pack, index in self._files.values():
+                pack.close()
+                index.close()
+            self._files = {}
+
+
+class XmlReader:
+    """Reads single articles' raw XML from a store. Source indexes are
+    loaded on first use.
+    """
+
+    def __init__(self, path):
+        _require_zstandard()
+        self.path = path
+        self.dictionaries = _Dictionaries(path)
+        self.indexes = {}
+
+    def _index(self, source):
+        if source not in self.indexes:
+            index = {}
+            try:
+                with open(os.path.join(self.path, source + '.idx'), encoding='utf-8') as index_file:
+                    for line in index_file:
+                        fields = line.rstrip('\n').split('\t')
+                        if len(fields) == 3:
+                            index[fields[0]] = (int(fields[1]), int(fields[2]))
+            except FileNotFoundError:
+                pass
+            self.indexes[source] = index
+        return self.indexes[source]
+
+    def read(self, name):
+        """The raw XML of the article name. Raises KeyError if it is not
+        in the store.
+        """
+        source = article_source(name)
+        offset, length = self._index(source)[name]
+        with open(os.path.join(self.path, source + '.pack'), 'rb') as pack:
+            pack.seek(offset)
+            frame = pack.read(length)
+        zstandard = _require_zstandard()
+        dict_id = zstandard.get_frame_parameters(frame).dict_id
+        if dict_id:
+            decompressor = zstandard.ZstdDecompressor(dict_data=self.dictionaries.get(dict_id))
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(frame).decode('utf-8')
+
+
+def read_xml(path, name):
+    """The raw XML of one article in the store at path."""
+    return XmlReader(path).read(name)
+
+
+def xml_samples(paths, samples=SAMPLES):
+    """{source_id: [raw XML bytes]}, up to samples per source, from the
+    .xml members of the output zips under paths.
+    """
+    found = collections.defaultdict(list)
+    for path in paths:
+        zip_paths = [path] if not os.path.isdir(path) else [
+            os.path.join(dirname, filename) for (dirname, _dirs, files) in os.walk(path)
+            for filename in sorted(files) if filename.endswith('.zip')]
+        for zip_path in zip_paths:
+            source = zip_fields(os.path.basename(zip_path))[0]
+            if not source or len(found[source]) >= samples:
+                continue
+            try:
+                with zipfile.ZipFile(zip_path) as source_zip:
+                    for member in source_zip.namelist():
+                        if member.endswith('.xml') and len(found[source]) < samples:
+                            data = source_zip.read(member)
+                            if data:
+                                found[source].append(data)
+            except (OSError, zipfile.BadZipFile):
+                continue
+    return found
+
+
+def train(paths, output, dict_size=DICT_SIZE, samples=SAMPLES, level=LEVEL):
+    """Train a dictionary for every source with at least MIN_SAMPLES
+    articles under paths, and make it the dictionary for new writes to
+    the store at output. Returns {source_id: (samples, compressed bytes
+    without a dictionary, with it)}.
+    """
+    zstandard = _require_zstandard()
+    dict_path = os.path.join(output, DICT_DIR)
+    os.makedirs(dict_path, exist_ok=True)
+    dictionaries = _Dictionaries(output)
+    sources = dictionaries.sources()
+    report = {}
+    for source, source_samples in sorted(xml_samples(paths, samples).items()):
+        if len(source_samples) < MIN_SAMPLES:
+            continue
+        try:
+            trained = zstandard.train_dictionary(dict_size, source_samples, level=level)
+        except zstandard.ZstdError as error:
+            print(' ! could not train', source, error)
+            continue
+        with open(os.path.join(dict_path, '%d.zdict' % trained.dict_id()), 'wb') as dict_file:
+            dict_file.write(trained.as_bytes())
+        sources[source] = trained.dict_id()
+        plain = zstandard.ZstdCompressor(level=level)
+        with_dict = zstandard.ZstdCompressor(level=level, dict_data=trained)
+        report[source] = (len(source_samples),
+                          sum(len(plain.compress(sample)) for sample in source_samples),
+                          sum(len(with_dict.compress(sample)) for sample in source_samples))
+    with open(os.path.join(dict_path, SOURCES_FILE), 'w') as sources_file:
+        json.dump(sources, sources_file, indent=2, sort_keys=True)
+    return report
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    SUBPARSERS = PARSER.add_subparsers(dest='command')
+    TRAIN = SUBPARSERS.add_parser('train', help='train per-source dictionaries from output zips')
+    TRAIN.add_argument('paths', nargs='+', help='output zips or directories')
+    TRAIN.add_argument('-o', '--output', required=True, help='XML store folder')
+    TRAIN.add_argument('--dict-kb', type=int, default=DICT_SIZE // 1024,
+                       help='dictionary size in KB, %d by default' % (DICT_SIZE // 1024))
+    TRAIN.add_argument('--samples', type=int, default=SAMPLES,
+                       help='articles to train on per source, %d by default' % SAMPLES)
+    READ = SUBPARSERS.add_parser('read', help='print the raw XML of an article')
+    READ.add_argument('path', help='XML store folder')
+    READ.add_argument('name', help='article name')
+    ARGS = PARSER.parse_args()
+    if ARGS.command == 'train':
+        REPORT = train(ARGS.paths, ARGS.output, ARGS.dict_kb * 1024, ARGS.samples)
+        for SOURCE, (COUNT, PLAIN, WITH_DICT) in sorted(REPORT.items()):
+            print('%s: %d articles, %d bytes without dictionary, %d with (%.1fx)'
+                  % (SOURCE, COUNT, PLAIN, WITH_DICT, float(PLAIN) / max(WITH_DICT, 1)))
+    elif ARGS.command == 'read':
+        print(read_xml(ARGS.path, ARGS.name))
+    else:
+        PARSER.print_help()
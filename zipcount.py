@@ -9,48 +9,77 @@ Count all files inside zipfiles in the tree of a subdirectory:
     ./zipcount.py myfolder
 
 Count all filenames matching the namefilter 'json':
-    ./zipcount.py -f json
+    ./zipcount.py -n json
 
 Count all filenames matching the namefilter 'txt' in a subdirectory tree:
 
-    ./zipcount.py myfolder -f txt
+    ./zipcount.py myfolder -n txt
+
+Count the articles of a source, keyword string and year, or per year:
+    ./zipcount.py myfolder -n .json --source 163823 --keyword "liberal arts" --year 2017
+    ./zipcount.py myfolder -n .json --source 163823 --by year
+
+Find the zip holding an article:
+    ./zipcount.py myfolder --locate 163823_chicagodailyherald_liberalarts_2017-01-01_2017-12-31_0_0_3
+
+Counts are answered from a catalog of the tree (see catalog.py), which
+is first brought up to date by scanning only new or changed zips, in
+parallel. --no-update answers from the catalog as it is.
 """
 
 
 import argparse
 import os
-import zipfile
 
+from catalog import Catalog
 
-def main(filespath, namefilter=''):
-    """Loop through zip files, count files (with optional namefilter)"""
 
-    os.chdir(filespath)
-    count = 0
-    for (dirname, _dirs, files) in os.walk(filespath):
-        for filename in files:
-            if filename.endswith('.zip'):  # scan for zip files
-                filepath = os.path.join(dirname, filename)
-                print('\n', filepath, '\n')
-                source = zipfile.ZipFile(filepath, 'r')  # read zip
+def main(filespath, namefilter='', source='', keyword='', year='', by='', locate='',
+         list_files=False, update=True, catalog_path='', processes=None):
+    """Count files in zip files (with optional namefilter) from the catalog"""
 
-                # test for bad filename char
-                for afile in source.filelist:
-                    if namefilter:
-                        if namefilter in afile.filename:
-                            count += 1
-                            print('   ', afile.filename)
-                    else:
-                        count += 1
-                        print('   ', afile.filename)
-    print('Files counted:\n', count)
+    with Catalog(filespath, catalog_path) as catalog:
+        if update:
+            scanned, dropped, unreadable = catalog.update(processes)
+            if scanned or dropped:
+                print('Catalog: %d zips scanned, %d dropped, %d unreadable'
+                      % (scanned, dropped, unreadable))
+        if locate:
+            for zip_path, member in catalog.locate(locate):
+                print(zip_path, member)
+            return
+        if list_files:
+            last_path = None
+            for zip_path, member in catalog.members(namefilter, source, keyword, year):
+                if zip_path != last_path:
+                    print('\n', zip_path, '\n')
+                    last_path = zip_path
+                print('   ', member)
+        if by:
+            for value, count in catalog.counts(by, namefilter, source, keyword, year):
+                print('%s\t%d' % (value, count))
+        print('Files counted:\n', catalog.count(namefilter, source, keyword, year))
 
 
 if __name__ == '__main__':
-    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
     PARSER.add_argument('dir', nargs='?', default='',
                         help='directory tree to process')
     PARSER.add_argument('-n', '--namefilter', default='',
                         help='pattern for content filenames, e.g. json')
+    PARSER.add_argument('--source', default='', help='only count this source id or title')
+    PARSER.add_argument('--keyword', default='', help='only count this keyword string')
+    PARSER.add_argument('--year', default='', help='only count articles of this year')
+    PARSER.add_argument('--by', choices=('source_id', 'source', 'keyword', 'year'),
+                        help='print counts per source id, source, keyword or year')
+    PARSER.add_argument('--locate', default='', help='print the zip and member of an article name')
+    PARSER.add_argument('-l', '--list', action='store_true', help='print the counted filenames')
+    PARSER.add_argument('--no-update', action='store_true',
+                        help='do not scan new or changed zips first')
+    PARSER.add_argument('--catalog', default='',
+                        help='catalog file, catalog.sqlite in the tree by default')
+    PARSER.add_argument('-j', '--processes', type=int, help='scan processes, default: cpu count')
     ARGS = PARSER.parse_args()
-    main(os.path.abspath(ARGS.dir), ARGS.namefilter)
+    main(os.path.abspath(ARGS.dir), ARGS.namefilter, ARGS.source, ARGS.keyword, ARGS.year,
+         ARGS.by, ARGS.locate, ARGS.list, not ARGS.no_update, ARGS.catalog, ARGS.processes)